@@ -0,0 +1,63 @@
+"""Measure control plane app lookup cost as the registry grows.
+
+Registers fake apps directly in a fresh ``Server`` registry and times
+lookups by id and by port, next to the linear scan the control plane used
+before the registry was keyed by id.
+
+Usage::
+
+    $ python benchmarks/bench_app_lookup.py --number 10000
+"""
+import argparse
+import random
+import timeit
+from types import SimpleNamespace
+
+from httpmocker.server import Server
+
+SIZES = (10, 100, 1000, 10000)
+
+
+def make_server(size):
+    # bypass the singleton so every size gets an empty registry.
+    server = Server.__wrapped__()
+    for n in range(size):
+        app = SimpleNamespace(id=f'bench-{n}', name='bench', port=None)
+        server._register(app, 20000 + n, process=None)
+    return server
+
+
+def linear_scan(server, app_id):
+    for app in server.apps:
+        if app.id == app_id:
+            return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f'{"apps":>6} {"by id":>10} {"by port":>10} {"scan":>10}'
+          '  (usec per lookup)')
+    for size in SIZES:
+        server = make_server(size)
+        app_ids = [f'bench-{random.randrange(size)}'
+                   for _ in range(args.number)]
+        ports = [20000 + random.randrange(size) for _ in range(args.number)]
+
+        def per_lookup(func, keys):
+            keys = iter(keys)
+            total = timeit.timeit(lambda: func(next(keys)),
+                                  number=args.number)
+            return total / args.number * 1e6
+
+        by_id = per_lookup(server.get, app_ids)
+        by_port = per_lookup(server.get_by_port, ports)
+        scan = per_lookup(lambda app_id: linear_scan(server, app_id),
+                          app_ids)
+        print(f'{size:>6} {by_id:>10.3f} {by_port:>10.3f} {scan:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Measure how long ``Server.start`` takes to bring up a mock app.
+
+Every round runs in a fresh interpreter so that each framework is measured
+from a cold start (Django can only be configured once per process).
+
+Usage::
+
+    $ python benchmarks/bench_app_start.py --rounds 5 --port 9100
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+APP_TYPES = ('sanic', 'flask', 'django')
+
+
+def single_round(app_type, port):
+    """Start and stop one app, printing the start latency in seconds."""
+    from httpmocker.app.base_app import AppRegistry
+    from httpmocker.config import get_config
+    from httpmocker.server import Server
+
+    server = Server(get_config())
+    app = getattr(AppRegistry, app_type)({})
+    started = time.perf_counter()
+    server.start(app, port=port)
+    elapsed = time.perf_counter() - started
+    server.stop(app)
+    print(f'elapsed={elapsed}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--apps', nargs='+', default=APP_TYPES,
+                        choices=APP_TYPES)
+    parser.add_argument('--single', nargs=2, metavar=('APP', 'PORT'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        single_round(args.single[0], int(args.single[1]))
+        return
+
+    print(f'{"app":<8} {"min":>8} {"median":>8} {"max":>8}  (seconds)')
+    for offset, app_type in enumerate(args.apps):
+        samples = []
+        for _ in range(args.rounds):
+            out = subprocess.run(
+                [sys.executable, __file__, '--single', app_type,
+                 str(args.port + offset)],
+                stdout=subprocess.PIPE, check=True, universal_newlines=True)
+            samples.extend(
+                float(line.split('=', 1)[1])
+                for line in out.stdout.splitlines()
+                if line.startswith('elapsed='))
+        print(f'{app_type:<8} {min(samples):>8.3f} '
+              f'{statistics.median(samples):>8.3f} {max(samples):>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Compare Django apps sharing an interpreter with a process per app.
+
+Starts ``--apps`` Django apps on the ``threaded`` WSGI server, first every
+one of them in a thread of this process, then every one of them in its own
+process with ``Server.start``, and reports the time until they all serve a
+registered view and the memory they take. Memory is the proportional set
+size, pages shared by forked processes are split between them.
+
+Usage::
+
+    $ python benchmarks/bench_django_apps.py --apps 8 --port 9500
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.client import HTTPConnection
+
+from httpmocker.app.base_app import AppRegistry
+from httpmocker.config import get_config
+from httpmocker.handler import HANDLER_DATA_URL
+from httpmocker.server import Server
+
+URL = '/users/<int:id>'
+DATA = {'m-response': {'body': {'id': '{path.id}'}}}
+
+
+def pss(pid):
+    """Proportional set size of the process in MiB."""
+    with open(f'/proc/{pid}/smaps_rollup') as smaps:
+        for line in smaps:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def check(port):
+    conn = HTTPConnection('127.0.0.1', port)
+    conn.request('POST', HANDLER_DATA_URL, body=json.dumps(DATA),
+                 headers={'m-handler-url': URL})
+    assert conn.getresponse().status == 200
+    conn.close()
+    conn = HTTPConnection('127.0.0.1', port)
+    conn.request('GET', '/users/7')
+    response = conn.getresponse()
+    assert response.read() == b'{"id": "7"}', port
+    conn.close()
+
+
+def wait(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return check(port)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
+
+
+def shared(args):
+    before = pss(os.getpid())
+    started = time.perf_counter()
+    for n in range(args.apps):
+        app = AppRegistry.django({'WSGI_SERVER': 'threaded'})
+        threading.Thread(target=app.serve, kwargs={
+            'port': args.port + n, 'enable_ssl': 'False'},
+            daemon=True).start()
+    for n in range(args.apps):
+        wait(args.port + n)
+    return time.perf_counter() - started, pss(os.getpid()) - before
+
+
+def separate(args):
+    server = Server(get_config())
+    apps = []
+    started = time.perf_counter()
+    try:
+        for n in range(args.apps):
+            app = AppRegistry.django({'WSGI_SERVER': 'threaded'})
+            server.start(app, port=args.port + args.apps + n)
+            apps.append(app)
+        for n in range(args.apps):
+            check(args.port + args.apps + n)
+        elapsed = time.perf_counter() - started
+        memory = sum(pss(server._processes[app.id].pid) for app in apps)
+    finally:
+        for app in apps:
+            server.stop(app)
+    return elapsed, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--apps', type=int, default=8)
+    parser.add_argument('--port', type=int, default=9500,
+                        help='first of the 2 * apps ports used')
+    args = parser.parse_args()
+
+    print(f'{"apps":>10} {"start s":>9} {"PSS MiB":>9}')
+    for name, run in (('shared', shared), ('separate', separate)):
+        elapsed, memory = run(args)
+        print(f'{name:>10} {elapsed:>9.3f} {memory:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Measure Django view registration cost as the url patterns grow.
+
+Attaches ``--views`` views to a ``DjangoApp`` in batches of ``--batch``
+handlers, the way POSTs of handler code do, and times it next to the scan
+of every served pattern per view the app did before the patterns were
+keyed by route. Every batch is resolved as soon as it is attached, and a
+sample of the views is resolved, overridden and detached at the end, to
+check the resolver never serves stale patterns.
+
+Usage::
+
+    $ python benchmarks/bench_django_urlpatterns.py --views 5000 --batch 100
+"""
+import argparse
+import random
+import time
+
+from django.urls import Resolver404, path, resolve
+
+from httpmocker.app.base_app import AppRegistry
+
+
+def view(request, **kwargs):
+    pass
+
+
+def make_paths(start, stop, version=1):
+    return [path(f'views/{n}/<int:id>', view, {'n': n, 'version': version})
+            for n in range(start, stop)]
+
+
+def linear_attach(patterns, paths):
+    for new in paths:
+        for served in patterns:
+            if str(new.pattern) == str(served.pattern):
+                patterns.remove(served)
+                patterns.append(new)
+                break
+        else:
+            patterns.append(new)
+
+
+def check(urlconf, n, version):
+    match = resolve(f'/views/{n}/7', urlconf)
+    assert match.kwargs == {'id': 7, 'n': n, 'version': version}, \
+        (n, match.kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--views', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--sample', type=int, default=200)
+    args = parser.parse_args()
+
+    batches = [make_paths(start, min(start + args.batch, args.views))
+               for start in range(0, args.views, args.batch)]
+
+    patterns = []
+    started = time.perf_counter()
+    for paths in batches:
+        linear_attach(patterns, paths)
+    scan = time.perf_counter() - started
+
+    app = AppRegistry.django({})
+    app.urlpatterns.install()
+    urlconf = app.urlpatterns.urlconf
+    index = 0
+    started = time.perf_counter()
+    for number, paths in enumerate(batches):
+        app.attach_handler(f'batch-{number}', paths)
+        index += time.perf_counter() - started
+        check(urlconf, paths[0].default_args['n'], 1)
+        check(urlconf, paths[-1].default_args['n'], 1)
+        started = time.perf_counter()
+
+    print(f'{"views":>6} {"batches":>8} {"scan s":>9} {"index s":>9}')
+    print(f'{args.views:>6} {len(batches):>8} {scan:>9.3f} {index:>9.3f}')
+
+    sample = random.sample(range(args.views), min(args.sample,
+                                                  args.views))
+    started = time.perf_counter()
+    for n in sample:
+        check(urlconf, n, 1)
+    resolving = (time.perf_counter() - started) / len(sample) * 1e6
+    print(f'resolved {len(sample)} views, {resolving:.1f} usec per view')
+
+    app.attach_handler('override', [
+        new for n in sample for new in make_paths(n, n + 1, version=2)])
+    for n in sample:
+        check(urlconf, n, 2)
+    app.detach_handler('override')
+    for n in sample:
+        try:
+            resolve(f'/views/{n}/7', urlconf)
+        except Resolver404:
+            continue
+        raise AssertionError(f'views/{n} is still served.')
+    print(f'overrode and detached {len(sample)} views')
+
+
+if __name__ == '__main__':
+    main()
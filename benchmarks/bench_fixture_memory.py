@@ -0,0 +1,115 @@
+"""Measure the memory saved by serving fixtures from shared memory.
+
+Starts ``--apps`` Flask apps with ``Server.start`` and gives each one the
+same large response, first as a private ``m-response`` body, then, on a
+fresh set of apps, as a ``fixture`` blob stored once by the control plane.
+The memory of every app process is sampled before and after.
+
+RSS counts every shared page in full in every process, so it hides the
+saving, PSS splits shared pages between the processes mapping them and is
+the figure to compare. Linux only, memory is read from ``/proc``.
+
+Usage::
+
+    $ python benchmarks/bench_fixture_memory.py --apps 8 --size 32 \\
+        --port 9200
+"""
+import argparse
+import io
+import json
+from http.client import HTTPConnection
+
+from httpmocker.app.base_app import AppRegistry
+from httpmocker.config import get_config
+from httpmocker.handler import HANDLER_DATA_URL
+from httpmocker.server import Server
+
+URL = '/catalog/'
+
+
+def memory(pid):
+    """Resident and proportional set size of the process, in MiB."""
+    sizes = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in ('Rss', 'Pss'):
+                sizes[name] = int(value.split()[0]) / 1024
+    return sizes['Rss'], sizes['Pss']
+
+
+def request(port, method, url, body=None, headers=None):
+    conn = HTTPConnection('127.0.0.1', port)
+    try:
+        conn.request(method, url, body=body, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def serve(ports, data, size):
+    for port in ports:
+        status, _ = request(port, 'POST', HANDLER_DATA_URL,
+                            body=json.dumps(data),
+                            headers={'m-handler-url': URL})
+        assert status == 200, status
+        # serve it once so that the app touches every page of the body.
+        status, body = request(port, 'GET', URL)
+        assert status == 200 and len(body) == size, status
+
+
+def sample(server, apps):
+    return [memory(server._processes[app.id].pid) for app in apps]
+
+
+def report(label, samples, baseline):
+    rss = [sample[0] - base[0] for sample, base in zip(samples, baseline)]
+    pss = [sample[1] - base[1] for sample, base in zip(samples, baseline)]
+    print(f'{label:<8} {sum(rss) / len(rss):>10.1f}'
+          f' {sum(pss) / len(pss):>10.1f} {sum(rss):>10.1f}'
+          f' {sum(pss):>10.1f}')
+    return sum(pss)
+
+
+def measure(server, label, data, args):
+    """Serve the data from fresh apps and report their memory growth."""
+    apps = [AppRegistry.flask({}) for _ in range(args.apps)]
+    ports = [args.port + n for n in range(args.apps)]
+    for app, port in zip(apps, ports):
+        server.start(app, port=port)
+    try:
+        baseline = sample(server, apps)
+        serve(ports, data, args.size * 1024 * 1024)
+        return report(label, sample(server, apps), baseline)
+    finally:
+        for app in apps:
+            server.stop(app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--apps', type=int, default=8)
+    parser.add_argument('--size', type=int, default=32,
+                        help='response size in MiB')
+    parser.add_argument('--port', type=int, default=9200)
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    server = Server(get_config())
+    print(f'{"":<8} {"rss/app":>10} {"pss/app":>10} {"rss total":>10}'
+          f' {"pss total":>10}  (MiB over idle apps)')
+    try:
+        private = measure(server, 'private',
+                          {'m-response': {'body': 'x' * size}}, args)
+        digest, _ = server.fixtures.put(io.BytesIO(b'x' * size))
+        shared = measure(server, 'shared',
+                         {'m-response': {'fixture': digest}}, args)
+    finally:
+        server.fixtures.close()
+    print(f'\nsaved {private - shared:.1f} MiB PSS over {args.apps} '
+          f'apps, {(private - shared) / args.apps:.1f} MiB per app')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Measure per request handler data lookup cost as the data grows.
+
+Fills a ``HandlerData`` store with concrete paths and route templates and
+times the lookup the request middleware does for an exact hit, a template
+hit and a miss, next to the linear scan of templates a naive matcher would
+do. With ``--flask`` the whole before-request middleware is timed through
+the Flask test client.
+
+Usage::
+
+    $ python benchmarks/bench_handler_data.py --number 10000 --flask
+"""
+import argparse
+import random
+import timeit
+
+from httpmocker.routing import HandlerData, RouteTrie
+
+SIZES = (10, 100, 1000, 10000)
+
+
+def make_store(size):
+    # half concrete paths, half templates.
+    store = HandlerData()
+    for n in range(size // 2):
+        store[f'/exact/{n}/'] = {'n': n}
+        store[f'/tpl/{n}/<int:id>/'] = {'n': n}
+    return store
+
+
+def linear_scan(templates, path):
+    for template in templates:
+        trie = RouteTrie()
+        trie.insert(template, None)
+        if trie.match(path) is not None:
+            return template
+
+
+def per_lookup(func, keys, number):
+    keys = iter(keys)
+    total = timeit.timeit(lambda: func(next(keys)), number=number)
+    return total / number * 1e6
+
+
+def bench_lookup(number):
+    print(f'{"entries":>7} {"exact":>9} {"template":>9} {"miss":>9}'
+          f' {"scan":>9}  (usec per lookup)')
+    for size in SIZES:
+        store = make_store(size)
+        half = max(size // 2, 1)
+        exact = [f'/exact/{random.randrange(half)}/' for _ in range(number)]
+        templated = [f'/tpl/{random.randrange(half)}/7/'
+                     for _ in range(number)]
+        missing = [f'/miss/{n}/' for n in range(number)]
+        templates = [key for key in store if '<' in key]
+        timings = [per_lookup(store.resolve, paths, number)
+                   for paths in (exact, templated, missing)]
+        timings.append(per_lookup(lambda path: linear_scan(templates, path),
+                                  templated, min(number, 100)))
+        print(f'{size:>7}' + ''.join(f' {usec:>9.3f}' for usec in timings))
+
+
+def bench_flask(number):
+    from flask import Flask, request
+
+    print(f'\n{"entries":>7} {"request":>9}  (usec per flask request)')
+    for size in (0, 10000):
+        store = make_store(size) if size else HandlerData()
+        app = Flask(__name__)
+
+        @app.before_request
+        def request_middleware():
+            key, data, params, template, fault = store.resolve(
+                request.path)
+            request.handler_data = data
+            request.handler_params = params
+
+        @app.route('/tpl/<int:n>/<int:id>/')
+        def view(n, id):
+            return ''
+
+        client = app.test_client()
+        paths = [f'/tpl/{random.randrange(max(size // 2, 1))}/7/'
+                 for _ in range(number)]
+        print(f'{size:>7} {per_lookup(client.get, paths, number):>9.3f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=10000)
+    parser.add_argument('--flask', action='store_true',
+                        help='time the flask request middleware too')
+    args = parser.parse_args()
+    bench_lookup(args.number)
+    if args.flask:
+        bench_flask(args.number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Measure the throughput of a Sanic app by number of worker processes.
+
+Starts a Sanic app with ``Server.start`` for every ``--workers`` count,
+registers a templated JSON response and hammers it for ``--duration``
+seconds from ``--clients`` client processes, each one sending requests on
+its own keep-alive connection. Client processes keep the load generator off
+the GIL of the benchmark, give the machine enough cores for both sides.
+
+Usage::
+
+    $ python benchmarks/bench_sanic_workers.py --workers 1 2 4 8 \\
+        --clients 16 --duration 5 --port 9300
+"""
+import argparse
+import json
+import time
+from http.client import HTTPConnection
+from multiprocessing import Pool
+
+from httpmocker.app.base_app import AppRegistry
+from httpmocker.config import get_config
+from httpmocker.handler import HANDLER_DATA_URL
+from httpmocker.server import Server
+
+URL = '/users/<int:id>'
+DATA = {'m-response': {'body': {'id': '{path.id}', 'name': 'user',
+                                'tags': ['a', 'b', 'c']}}}
+
+
+def hammer(args):
+    """Send requests for ``duration`` seconds, return the count."""
+    port, duration, offset = args
+    conn = HTTPConnection('127.0.0.1', port)
+    count = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        conn.request('GET', f'/users/{offset + count}')
+        response = conn.getresponse()
+        response.read()
+        assert response.status == 200, response.status
+        count += 1
+    conn.close()
+    return count
+
+
+def measure(server, workers, args):
+    app = AppRegistry.sanic({'WORKERS': workers})
+    server.start(app, port=args.port)
+    try:
+        conn = HTTPConnection('127.0.0.1', args.port)
+        conn.request('POST', HANDLER_DATA_URL, body=json.dumps(DATA),
+                     headers={'m-handler-url': URL})
+        assert conn.getresponse().status == 200
+        conn.close()
+        with Pool(args.clients) as pool:
+            counts = pool.map(hammer, [
+                (args.port, args.duration, n * 10 ** 7)
+                for n in range(args.clients)])
+    finally:
+        server.stop(app)
+        # let the workers release the port before the next run.
+        time.sleep(1)
+    return sum(counts) / args.duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 2, 4, 8])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--port', type=int, default=9300)
+    args = parser.parse_args()
+
+    server = Server(get_config())
+    print(f'{"workers":>8} {"req/s":>10} {"speedup":>8}')
+    baseline = None
+    for workers in args.workers:
+        rate = measure(server, workers, args)
+        baseline = baseline or rate
+        print(f'{workers:>8} {rate:>10.0f} {rate / baseline:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Compare the throughput and latency of the WSGI servers of the apps.
+
+Starts a Flask or Django app with ``Server.start`` for every ``--servers``
+entry (see ``httpmocker.wsgi``, ``dev`` is ``runserver`` for Django),
+registers a templated JSON response and sends it requests for
+``--duration`` seconds from ``--clients`` client processes, each one on its
+own keep-alive connection. Reports requests per second and latency
+percentiles in milliseconds.
+
+Every server is measured from a fresh process, Django settings can only be
+configured once per process.
+
+Usage::
+
+    $ python benchmarks/bench_wsgi_servers.py --app django --servers dev \\
+        threaded prefork --workers 4 --clients 16 --duration 5 --port 9400
+"""
+import argparse
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.client import HTTPConnection
+from multiprocessing import Pool
+
+from httpmocker.app.base_app import AppRegistry
+from httpmocker.config import get_config
+from httpmocker.handler import HANDLER_DATA_URL
+from httpmocker.server import Server
+
+URL = '/users/<int:id>'
+DATA = {'m-response': {'body': {'id': '{path.id}', 'name': 'user',
+                                'tags': ['a', 'b', 'c']}}}
+
+
+def hammer(args):
+    """Send requests for ``duration`` seconds, return their latencies."""
+    port, duration, offset = args
+    conn = HTTPConnection('127.0.0.1', port)
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while True:
+        started = time.perf_counter()
+        if started >= deadline:
+            break
+        conn.request('GET', f'/users/{offset + len(latencies)}')
+        response = conn.getresponse()
+        response.read()
+        assert response.status == 200, response.status
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    return latencies
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def measure(name, args):
+    server = Server(get_config())
+    app = getattr(AppRegistry, args.app)(
+        {'WSGI_SERVER': name, 'WORKERS': args.workers})
+    server.start(app, port=args.port)
+    try:
+        conn = HTTPConnection('127.0.0.1', args.port)
+        conn.request('POST', HANDLER_DATA_URL, body=json.dumps(DATA),
+                     headers={'m-handler-url': URL})
+        assert conn.getresponse().status == 200
+        conn.close()
+        with Pool(args.clients) as pool:
+            results = pool.map(hammer, [
+                (args.port, args.duration, n * 10 ** 7)
+                for n in range(args.clients)])
+    finally:
+        server.stop(app)
+        # let the server release the port before the next run.
+        time.sleep(1)
+    latencies = sorted(value for result in results for value in result)
+    return len(latencies) / args.duration, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', choices=['flask', 'django'],
+                        default='flask')
+    parser.add_argument('--servers', nargs='+',
+                        default=['dev', 'threaded', 'prefork'])
+    parser.add_argument('--workers', type=int, default=4,
+                        help='processes of the prefork server')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--port', type=int, default=9400)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('fork')
+    print(f'{"server":>10} {"req/s":>10} {"p50 ms":>8} {"p90 ms":>8}'
+          f' {"p99 ms":>8}')
+    for name in args.servers:
+        with ProcessPoolExecutor(1, mp_context=context) as executor:
+            rate, latencies = executor.submit(measure, name, args).result()
+        p50, p90, p99 = (percentile(latencies, q) * 1000
+                         for q in (50, 90, 99))
+        print(f'{name:>10} {rate:>10.0f} {p50:>8.2f} {p90:>8.2f}'
+              f' {p99:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Drive the control plane API from many parallel clients.
+
+Starts a control plane server in this process and runs ``--clients`` workers
+that each create a mock app, poll its status and stop it again, while the
+remaining workers keep polling. Compare the threaded server against the
+single-threaded one with ``--no-threaded``.
+
+Usage::
+
+    $ python benchmarks/load_control_plane.py --clients 16 --app flask
+"""
+import argparse
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from httpmocker.client import Client, HTTPAdapter
+from httpmocker.config import get_config
+from httpmocker.server import Server, make_server
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def lifecycle(host, port, app_type, app_port, polls):
+    """Create, poll and stop one app, timing every control request."""
+    timings = {'start': [], 'status': [], 'stop': []}
+    with Client(HTTPAdapter(host, port)) as client:
+        app = client.app(app_type, app_port)
+        started = time.perf_counter()
+        app.start()
+        timings['start'].append(time.perf_counter() - started)
+        for _ in range(polls):
+            started = time.perf_counter()
+            app.status()
+            timings['status'].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        app.stop()
+        timings['stop'].append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--polls', type=int, default=50)
+    parser.add_argument('--app', default='flask')
+    parser.add_argument('--port', type=int, default=9080)
+    parser.add_argument('--app-port', type=int, default=9200)
+    parser.add_argument('--no-threaded', dest='threaded',
+                        action='store_false')
+    args = parser.parse_args()
+
+    host = '127.0.0.1'
+    Server(get_config())
+    http_server = make_server(host, args.port, threaded=args.threaded)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        results = list(pool.map(
+            lambda n: lifecycle(host, args.port, args.app,
+                                args.app_port + n, args.polls),
+            range(args.clients)))
+    wall = time.perf_counter() - started
+    http_server.shutdown()
+    http_server.server_close()
+
+    mode = 'threaded' if args.threaded else 'single-threaded'
+    print(f'{mode}: {args.clients} clients in {wall:.2f}s')
+    print(f'{"request":<8} {"count":>6} {"p50 ms":>8} {"p99 ms":>8}')
+    for kind in ('start', 'status', 'stop'):
+        samples = [t for result in results for t in result[kind]]
+        print(f'{kind:<8} {len(samples):>6} '
+              f'{statistics.median(samples) * 1000:>8.2f} '
+              f'{percentile(samples, 99) * 1000:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,9 +2,10 @@
 """
 from .__meta__ import __author__, __version__
 from httpmocker.client import Client, mock_via
+from httpmocker.async_client import AsyncClient
 from httpmocker.server import run as run_mock_server
 from httpmocker.log import configure_logging
 
-__all__ = ['Client', 'mock_via', 'run_mock_server']
+__all__ = ['Client', 'AsyncClient', 'mock_via', 'run_mock_server']
 
 configure_logging()
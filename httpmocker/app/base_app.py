@@ -1,13 +1,32 @@
 """Abstract Base Application"""
+import abc
+import json
 import logging
+import os
+import socket
+import threading
+import time
+from http import HTTPStatus
 from uuid import uuid4
 
 from httpmocker.exceptions import DuplicateAppError
-from httpmocker.handler import AbstractHandler, register_handler_routes
+from httpmocker.faults import FAULT_HEADER
+from httpmocker.handler import (NDJSON, AbstractHandler,
+                                register_handler_routes)
 from httpmocker.mixins import SSLMixin
 from httpmocker.config import get_config
+from httpmocker.journal import Journal, SharedJournal
+from httpmocker.metrics import (PROMETHEUS, Metrics, SharedMetrics,
+                                summarize, to_prometheus)
+from httpmocker.oplog import OpLog
+from httpmocker.routing import HandlerData, RouteIndex, SharedCounters
+from httpmocker.store import FixtureCache
+from httpmocker.templating import answers_requests
 logger = logging.getLogger(__name__)
 
+READY = 'ready'
+FAILED = 'failed'
+
 
 class AppRegistry():
     pass
@@ -33,14 +52,276 @@ class BaseApp(SSLMixin, AbstractHandler, metaclass=MetaApp):
 
     def __init__(self, config):
         self.id = '-'.join([self.NAME, str(uuid4())])
+        self.config = config
         self._host = '0.0.0.0'
         self._port = None
-        self.handler_data = {}
+        # handler data by path or route template.
+        self.handler_data = HandlerData()
+        # attached handlers by name, blueprint or urlpatterns.
+        self.handlers = {}
+        # routes of attached handlers, used to validate handler data.
+        self.routes = RouteIndex()
+        # fixture blobs shared by the control plane, attached on first use.
+        self.fixtures = FixtureCache()
+        # requests received outside of the management routes.
+        self.journal = Journal(
+            int(config.get('JOURNAL_SIZE',
+                           get_config().get('JOURNAL_SIZE'))),
+            int(config.get('JOURNAL_BODY_SIZE',
+                           get_config().get('JOURNAL_BODY_SIZE'))))
+        # request counts and latency histograms by route.
+        self.metrics = Metrics()
+        # worker processes serving the app, for the servers forking them.
+        self.workers = int(config.get('WORKERS', 1))
+        # control plane writes shared by the workers, see httpmocker.oplog.
+        self.oplog = None
+        # served over https, set by the control plane once started.
+        self.ssl_enabled = False
         cert = config.get('ssl_cert', None)
         key = config.get('ssl_key', None)
         if cert and key:
             self.save_cert(cert, key)
 
+    def sequence_headers(self, url):
+        """Build the headers reporting the position of a handler data
+        sequence.
+
+        :param str url: handler data url.
+        :return: headers, empty when the data is not a sequence.
+        :rtype: dict
+        """
+        state = self.handler_data.state(url)
+        if state is None:
+            return {}
+        return {f'm-sequence-{key}': str(value)
+                for key, value in state.items()}
+
+    @staticmethod
+    def _data_items(body, content_type=None):
+        stream = hasattr(body, 'read')
+        if (content_type or '').split(';')[0].strip() == NDJSON:
+            # a stream is parsed line by line as it is read.
+            lines = body if stream else body.splitlines()
+            for number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                    yield item['url'], item['data']
+                except (ValueError, KeyError, TypeError) as e:
+                    raise ValueError(f'Invalid entry on line {number}: '
+                                     f'{e!r}.')
+        else:
+            items = json.load(body) if stream else json.loads(body or b'{}')
+            if not isinstance(items, dict):
+                raise ValueError('Expected a JSON object of data by url.')
+            yield from items.items()
+
+    def set_data_many(self, body, content_type=None):
+        """Register handler data of many urls, all of them or none.
+
+        :param bytes body: JSON object of data by url or, with the NDJSON
+            content type, one ``{"url": ..., "data": ...}`` object per line.
+            A binary stream is read incrementally.
+        :param str content_type: request content type.
+        :return: number of registered urls and per entry errors.
+        :rtype: tuple
+        """
+        try:
+            items = list(self._data_items(body, content_type))
+        except ValueError as e:
+            return 0, [{'error': str(e)}]
+
+        def check(url, data):
+            # templated responses are served without a handler route.
+            if not (answers_requests(data) or self.routes.serves(url)):
+                return 'Route not found.'
+
+        errors = [{'url': url, 'error': error} for url, error
+                  in self.handler_data.set_many(items, check=check)]
+        return 0 if errors else len(items), errors
+
+    def remove_data_many(self, body):
+        """Remove handler data of many urls, all of them or none.
+
+        :param bytes body: JSON list of urls.
+        :return: number of removed urls and per entry errors.
+        :rtype: tuple
+        """
+        try:
+            urls = json.loads(body or b'[]')
+        except ValueError as e:
+            return 0, [{'error': f'Invalid body: {e}.'}]
+        if not isinstance(urls, list) or \
+                not all(isinstance(url, str) for url in urls):
+            return 0, [{'error': 'Expected a JSON list of urls.'}]
+        errors = [{'url': url, 'error': 'Data not found.'}
+                  for url in self.handler_data.delete_many(urls)]
+        return 0 if errors else len(set(urls)), errors
+
+    def clear_data(self):
+        """Remove handler data of every url.
+
+        :return: number of removed urls and no errors.
+        :rtype: tuple
+        """
+        count = len(self.handler_data)
+        self.handler_data.clear()
+        return count, []
+
+    def share_state(self):
+        """Share the state of the app with the worker processes about to be
+        forked.
+
+        Control plane writes are replayed by every worker, see
+        ``httpmocker.oplog``, while the sequence positions, the journal and
+        the metrics are kept in shared memory, see ``httpmocker.shared``.
+        """
+        self.oplog = OpLog()
+        self.handler_data.counters = SharedCounters()
+        self.journal = SharedJournal(self.journal.size,
+                                     self.journal.body_size)
+        self.metrics = SharedMetrics()
+
+    def replicate(self, op):
+        """Apply a control plane write in every worker of the app.
+
+        :param dict op: operation, see ``apply``.
+        :return: result of the operation.
+        """
+        if self.oplog is None:
+            return self.apply(op)
+        return self.oplog.write(op, self.apply)
+
+    def apply(self, op):
+        """Apply a control plane write to the state of this worker.
+
+        :param dict op: ``attach``, ``detach``, ``set_data``,
+            ``remove_data``, ``set_data_many``, ``remove_data_many`` or
+            ``clear_data`` operation and its arguments.
+        :return: result of the operation.
+        """
+        name = op['op']
+        if name == 'attach':
+            handler = self.load_handler(op['name'], op['code'], op['attr'])
+            return self.attach_handler(op['name'], handler)
+        if name == 'detach':
+            return self.detach_handler(op['name'])
+        if name == 'set_data':
+            self.handler_data[op['url']] = op['data']
+        elif name == 'remove_data':
+            del self.handler_data[op['url']]
+        elif name == 'set_data_many':
+            return self.set_data_many(op['body'].encode(),
+                                      op['content_type'])
+        elif name == 'remove_data_many':
+            return self.remove_data_many(op['body'].encode())
+        elif name == 'clear_data':
+            return self.clear_data()
+        else:
+            raise ValueError(f'Unknown operation {name!r}.')
+
+    def _synced(self, wsgi_app):
+        # replay before the framework matches the url against the routes.
+        def wrapper(environ, start_response):
+            self.oplog.sync(self.apply)
+            return wsgi_app(environ, start_response)
+        return wrapper
+
+    def remove_fixture(self, name):
+        """Remove an uploaded fixture file.
+
+        :param str name: fixture file name.
+        :return: response body and status.
+        :rtype: tuple
+        """
+        try:
+            os.remove(self.fixture_path(name))
+        except ValueError as e:
+            return {'error': str(e)}, HTTPStatus.BAD_REQUEST
+        except FileNotFoundError:
+            return {'error': f'File {name} not found.'}, HTTPStatus.NOT_FOUND
+        return {'msg': f'File {name} deleted.'}, HTTPStatus.OK
+
+    def record_request(self, method, path, query, route, status, started,
+                       body=None):
+        """Account a served request in the metrics and the journal.
+
+        :param str method: request method.
+        :param str path: request path.
+        :param str query: raw query string.
+        :param str route: route template serving the request or None.
+        :param int status: response status.
+        :param float started: ``time.perf_counter()`` at request start.
+        :param bytes body: request body.
+        """
+        duration = time.perf_counter() - started
+        self.metrics.observe(method, route, status, duration)
+        self.journal.record(method, path, query, status, duration, body)
+
+    @staticmethod
+    def fault_result(action, fault):
+        """Build the response body, status and headers of an injected
+        fault. A reset connection never receives it, the request is
+        accounted with the error status.
+
+        :param str action: injected fault.
+        :param FaultPolicy fault: fault policy.
+        :rtype: tuple
+        """
+        return {'error': f'Injected {action} fault.'}, fault.error_status, \
+            {FAULT_HEADER: action}
+
+    def metrics_result(self, args):
+        """Build the response body, status and content type of a metrics
+        request.
+
+        :param Mapping args: query parameters, ``format=prometheus`` renders
+            the Prometheus text format instead of JSON.
+        :rtype: tuple
+        """
+        rows = self.metrics.snapshot()
+        if args.get('format') == 'prometheus':
+            labels = {'app': self.name, 'port': self.port}
+            return to_prometheus([(labels, row) for row in rows]), \
+                HTTPStatus.OK, PROMETHEUS
+        return json.dumps({'routes': [summarize(row) for row in rows]}), \
+            HTTPStatus.OK, 'application/json'
+
+    def journal_result(self, args):
+        """Build the response body and status of a journal query.
+
+        :param Mapping args: ``method``, ``path``, ``status``, ``since`` and
+            ``limit`` query parameters.
+        :rtype: tuple
+        """
+        filters = {name: args.get(name) for name in
+                   ('method', 'path', 'status', 'since', 'limit')}
+        try:
+            records = self.journal.query(**filters)
+        except ValueError as e:
+            return {'error': f'Invalid journal filter: {e}'}, \
+                HTTPStatus.BAD_REQUEST
+        return {'requests': records,
+                'recorded': self.journal.recorded,
+                'size': self.journal.size}, HTTPStatus.OK
+
+    @staticmethod
+    def bulk_result(count, errors, action):
+        """Build the response body and status of a bulk data request.
+
+        :param int count: number of urls the action applied to.
+        :param list errors: per entry errors.
+        :param str action: past tense of the action, e.g. ``registered``.
+        :rtype: tuple
+        """
+        if errors:
+            return {'error': f'{len(errors)} entries are invalid, no data '
+                             f'{action}.',
+                    'errors': errors}, HTTPStatus.BAD_REQUEST
+        return {'msg': f'Data {action} for {count} urls.',
+                'count': count}, HTTPStatus.OK
+
     def get_handler_storage_root(self):
         return get_config().get('HANDLER_STORAGE_ROOT') + \
             f'/{self.NAME}/' + str(self._port)
@@ -49,10 +330,65 @@ class BaseApp(SSLMixin, AbstractHandler, metaclass=MetaApp):
         return get_config().get('CERT_STORAGE_ROOT') + \
             f'/{self.NAME}/'
 
+    def run(self, ready=None, **kwargs):
+        """Run the application and report its readiness.
+
+        The bind is attempted up front so that an occupied port is reported
+        right away, then a probe waits for the framework to start listening.
+
+        :param multiprocessing.Connection ready: connection to report
+            ``(READY, None)`` or ``(FAILED, error)`` on, Defaults -> None
+        """
+        host = kwargs.get('host', self._host)
+        port = kwargs['port']
+        reporter = _ReadyReporter(ready)
+
+        try:
+            self._check_bind(host, port)
+        except OSError as error:
+            reporter.failed(error)
+            raise
+
+        probe = threading.Thread(target=self._probe, args=(
+            host, port, reporter), daemon=True)
+        probe.start()
+        try:
+            self.serve(**kwargs)
+        except BaseException as error:
+            reporter.failed(error)
+            raise
+        finally:
+            reporter.close()
+
+    @abc.abstractmethod
+    def serve(self, **kwargs):
+        raise NotImplementedError
+
+    @staticmethod
+    def _check_bind(host, port):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host, port))
+
+    @staticmethod
+    def _probe(host, port, reporter, interval=0.01):
+        host = '127.0.0.1' if host in ('', '0.0.0.0') else host
+        while not reporter.done:
+            try:
+                with socket.create_connection((host, port), timeout=1):
+                    reporter.ready()
+                    return
+            except OSError:
+                time.sleep(interval)
+
     @property
     def port(self):
         return self._port
 
+    @port.setter
+    def port(self, port):
+        self._port = port
+
     @property
     def host(self):
         return self._host
@@ -60,3 +396,34 @@ class BaseApp(SSLMixin, AbstractHandler, metaclass=MetaApp):
     @property
     def name(self):
         return self.NAME
+
+
+class _ReadyReporter:
+    """Sends a single readiness message to the parent process."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._lock = threading.Lock()
+        self.done = conn is None
+
+    def _send(self, status, error=None):
+        with self._lock:
+            if self.done:
+                return
+            self.done = True
+            try:
+                self._conn.send((status, error))
+            except (OSError, ValueError):
+                logger.debug('Parent went away before readiness report.')
+
+    def ready(self):
+        self._send(READY)
+
+    def failed(self, error):
+        self._send(FAILED, str(error) or error.__class__.__name__)
+
+    def close(self):
+        with self._lock:
+            self.done = True
+            if self._conn is not None:
+                self._conn.close()
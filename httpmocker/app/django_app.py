@@ -6,29 +6,183 @@ from __future__ import absolute_import
 import ast
 import json
 import logging
+import os
 import sys
+import threading
+import time
+import types
 from functools import wraps
 from http import HTTPStatus
+from uuid import uuid4
 
 from django.conf import LazySettings, settings
 from django.core import management
 from django.core.management import execute_from_command_line
-from django.http import HttpResponse
-from django.urls import path
+from django.core.management.utils import get_random_secret_key
+from django.core.wsgi import get_wsgi_application
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.http.request import RawPostDataException
+from django.urls import clear_url_caches, path
 
 from httpmocker.app.base_app import BaseApp
-from httpmocker.handler import HANDLER_DATA_URL, HANDLER_URL, HandlerMixin
+from httpmocker.config import get_config
+from httpmocker.exceptions import TemplateError
+from httpmocker.handler import (HANDLER_CACHE_URL, HANDLER_DATA_BULK_URL,
+                                HANDLER_DATA_URL, HANDLER_FILE_URL,
+                                HANDLER_URL, JOURNAL_URL, METRICS_URL,
+                                MOCK_APP_URL, STREAM_CHUNK_SIZE, HandlerMixin)
+from httpmocker.store import iter_chunks
+from httpmocker.templating import answers_requests, parse_body
+from httpmocker.wsgi import DEV, PREFORK, get_backend
 
 logger = logging.getLogger(__name__)
 
+# served to the requests reaching no app, the apps have their own urlconf.
 urlpatterns = []
+# apps served by this process, by the port they listen on.
+_apps = {}
+DISPATCH_MIDDLEWARE = f'{__name__}.dispatch_middleware'
+
+
+def configure_settings(config):
+    """Configure the Django settings shared by the apps of the process.
+
+    The settings of a process are configured once, by its first app. The
+    apps have their own urlconf and request middleware, see
+    ``dispatch_middleware``.
+
+    :param dict config: app config, its upper case keys are settings.
+    """
+    if not settings.configured:
+        settings.configure(**{'ALLOWED_HOSTS': ['*'], 'DEBUG': True,
+                              'ROOT_URLCONF': __name__,
+                              'SECRET_KEY': get_random_secret_key(),
+                              **{key: value for key, value in config.items()
+                                 if key.isupper()}})
+    # the middleware of the config runs within the app middleware.
+    if DISPATCH_MIDDLEWARE not in settings.MIDDLEWARE:
+        settings.MIDDLEWARE = [DISPATCH_MIDDLEWARE, *settings.MIDDLEWARE]
+
+
+def dispatch_middleware(get_response):
+    """Hand the requests to the app listening on the port they reached.
+
+    The request is resolved against the urlconf of the app, the requests
+    of a port no app listens on against the empty ``urlpatterns``.
+    """
+    def middleware(request):
+        app = _apps.get(int(request.META.get('SERVER_PORT') or 0))
+        if app is None:
+            return get_response(request)
+        request.urlconf = app.urlpatterns.urlconf
+        return app.middleware(request, get_response)
+    return middleware
+
+
+def set_urlpatterns(urlconf, patterns):
+    """Serve a new list of url patterns.
+
+    The url resolver caches the list of the urlconf module and resolves
+    requests of every thread against it. The list is replaced rather than
+    changed in place and the resolver cache is cleared, the next requests
+    resolve against a resolver of the new list.
+
+    :param str urlconf: urlconf module name.
+    :param list patterns: url patterns.
+    """
+    sys.modules[urlconf].urlpatterns = patterns
+    clear_url_caches()
+
+
+class URLPatternIndex:
+    """Url patterns served by the app, keyed by their route.
+
+    The patterns are kept in the order the resolver tries them, a pattern
+    replacing the one of its route is moved last. Adding or removing a
+    pattern costs O(1), every change publishes a new ``urlpatterns`` list
+    once.
+
+    The list is published in a urlconf module of its own, the apps of a
+    process do not serve each other's patterns. The module is created by
+    ``install`` in the process serving the app, the control plane creating
+    the app does not keep it.
+    """
+
+    def __init__(self):
+        self._patterns = {}
+        # serializes the changes and their publication.
+        self._lock = threading.Lock()
+        self.urlconf = f'{__name__}.urls_{uuid4().hex}'
+        self._installed = False
+
+    def install(self):
+        """Create the urlconf module and publish the patterns in it."""
+        with self._lock:
+            module = types.ModuleType(self.urlconf)
+            module.urlpatterns = []
+            sys.modules[self.urlconf] = module
+            self._installed = True
+            self._publish()
+
+    def _publish(self):
+        if self._installed:
+            set_urlpatterns(self.urlconf, list(self._patterns.values()))
+
+    def add(self, patterns):
+        """Serve the patterns, replacing the patterns of their routes.
+
+        :param list patterns: url patterns.
+        """
+        with self._lock:
+            for pattern in patterns:
+                key = str(pattern.pattern)
+                self._patterns.pop(key, None)
+                self._patterns[key] = pattern
+            self._publish()
+
+    def remove(self, patterns):
+        """Stop serving the patterns.
+
+        A route overridden by a pattern added later keeps serving it.
+
+        :param list patterns: url patterns.
+        :return: routes the patterns were not served for.
+        :rtype: list
+        """
+        missing = []
+        with self._lock:
+            for pattern in patterns:
+                key = str(pattern.pattern)
+                if self._patterns.get(key) is pattern:
+                    del self._patterns[key]
+                else:
+                    missing.append(key)
+            self._publish()
+        return missing
+
+    def __contains__(self, route):
+        return route in self._patterns
+
+    def __len__(self):
+        return len(self._patterns)
+
 
+def connection_socket(request):
+    """Find the client socket of a request.
 
-def export_globally_as(name):
-    def wrapper(func):
-        module = sys.modules[__name__]
-        setattr(module, name, func)
-    return wrapper
+    The Werkzeug servers expose it in the environ, the development server
+    only exposes the socket file the request is read from, wrapped by the
+    ``wsgi.input`` stream.
+
+    :return: client socket, None when it can not be found.
+    :rtype: socket.socket
+    """
+    sock = request.META.get('werkzeug.socket')
+    if sock is not None:
+        return sock
+    stream = request.META.get('wsgi.input')
+    reader = getattr(getattr(stream, '_read', None), '__self__', None)
+    return getattr(getattr(reader, 'raw', None), '_sock', None)
 
 
 def enforce_headers(headers):
@@ -50,24 +204,114 @@ class DjangoApp(HandlerMixin, BaseApp):
 
     def __init__(self, config):
         super().__init__(config)
-        settings.configure(ALLOWED_HOSTS=config.get('ALLOWED_HOSTS', ['*']),
-                           ROOT_URLCONF='httpmocker.app.django_app',
-                           DEBUG=config.get('ALLOWED_HOSTS', True),
-                           **config)
+        configure_settings(config)
+        # url patterns of the handlers and of the management routes.
+        self.urlpatterns = URLPatternIndex()
+        # WSGI server of the app, see httpmocker.wsgi, dev is runserver.
+        self.wsgi_server = config.get(
+            'WSGI_SERVER', get_config().get('WSGI_SERVER'))
 
     def reg_request_middleware(self):
 
-        @export_globally_as('request_middleware')
-        def request_middleware(get_response):
-            def middleware(request):
-                request.handler_data = self.handler_data.get(
-                    request.path, {})
+        def middleware(request, get_response):
+            # management routes never consume handler data.
+            if request.path.startswith(MOCK_APP_URL):
+                return get_response(request)
+            started = time.perf_counter()
+            key, data, params, template, fault = \
+                self.handler_data.resolve(request.path)
+            request.handler_data = data
+            request.handler_params = params
+            action = fault.inject(connection_socket(request)) \
+                if fault is not None else None
+            if action is not None:
+                body, status, headers = self.fault_result(action, fault)
+                response = HttpResponse(json.dumps(body), status=status)
+                for name, value in headers.items():
+                    response[name] = value
+            elif template is not None:
+                response = self._render(request, params, template)
+            else:
                 response = get_response(request)
-                return response
-            return middleware
-
-        settings.MIDDLEWARE = [
-            'httpmocker.app.django_app.request_middleware']
+            match = getattr(request, 'resolver_match', None)
+            self.record_request(
+                request.method, request.path,
+                request.META.get('QUERY_STRING', ''),
+                '/' + match.route if match else key,
+                response.status_code, started,
+                self._journal_body(request))
+            if action is None and fault is not None and fault.trickles:
+                response = self._trickle(response, fault)
+            return response
+
+        # called by dispatch_middleware with the requests of the app.
+        self.middleware = middleware
+
+    @staticmethod
+    def _trickle(response, fault):
+        if response.streaming:
+            # FileResponse drops its wsgi.file_wrapper shortcut.
+            response.streaming_content = fault.trickle(
+                response.streaming_content)
+            return response
+        trickled = StreamingHttpResponse(fault.trickle([response.content]),
+                                         status=response.status_code)
+        for name, value in response.items():
+            trickled[name] = value
+        return trickled
+
+    def _journal_body(self, request):
+        if not self.journal.keeps_body:
+            return None
+        try:
+            return request.body
+        except RawPostDataException:
+            # the view read the body as a stream.
+            return None
+
+    def _render(self, request, params, template):
+        status, headers, body = template.render(
+            path=params,
+            query=request.GET.dict(),
+            headers=request.headers,
+            body=parse_body(request.body)
+            if 'body' in template.sources else None)
+        if template.fixture is not None:
+            try:
+                view = self.fixtures.get(template.fixture)
+            except KeyError:
+                return HttpResponse(
+                    json.dumps({'error': f'Fixture {template.fixture} '
+                                         f'not found.'}),
+                    status=HTTPStatus.NOT_FOUND)
+            # wsgi servers only write bytes, copy the blob chunk by chunk.
+            response = StreamingHttpResponse(
+                iter_chunks(view, STREAM_CHUNK_SIZE), status=status)
+            response['Content-Length'] = len(view)
+        elif template.file is None:
+            response = HttpResponse(body, status=status)
+        else:
+            location = self.fixture_path(template.file)
+            if not os.path.isfile(location):
+                return HttpResponse(
+                    json.dumps({'error': f'Fixture file {template.file} '
+                                         f'not found.'}),
+                    status=HTTPStatus.NOT_FOUND)
+            # served through wsgi.file_wrapper, sendfile where the server
+            # provides it.
+            response = FileResponse(open(location, 'rb'), status=status)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    def attach_handler(self, name, paths):
+        self.urlpatterns.add(paths)
+        self.handlers[name] = list(paths)
+        self.routes.add(name, ['/' + str(path.pattern) for path in paths])
+
+    def detach_handler(self, name):
+        self.routes.remove(name)
+        return self.urlpatterns.remove(self.handlers.pop(name))
 
     def reg_handler_route(self):
 
@@ -77,40 +321,28 @@ class DjangoApp(HandlerMixin, BaseApp):
             urlpatterns_name = request.headers.get(
                 'm-urlpatterns-name', None) or 'urlpatterns'
 
-            try:
-                save_temp = True if request.method == "DELETE" else False
-                module = self.import_handler(handler_name,
-                                             request.body.decode(),
-                                             save_temp=save_temp)
-                paths = getattr(module, urlpatterns_name)
-            except Exception:
-                return HttpResponse(
-                    json.dumps({'error': 'Invalid handler data.'}),
-                    status=HTTPStatus.BAD_REQUEST)
-
             if request.method == "POST":
-                for path in paths:
-                    for _path in urlpatterns:
-                        if str(path.pattern) == str(_path.pattern):
-                            urlpatterns.remove(_path)
-                            urlpatterns.append(path)
-                            break
-                    else:
-                        urlpatterns.append(path)
-
+                try:
+                    self.replicate({'op': 'attach', 'name': handler_name,
+                                    'code': request.body.decode(),
+                                    'attr': urlpatterns_name})
+                except Exception:
+                    return HttpResponse(
+                        json.dumps({'error': 'Invalid handler data.'}),
+                        status=HTTPStatus.BAD_REQUEST)
                 return HttpResponse(
                     json.dumps({'msg': 'View(s) registered/overridden.'}),
                     status=HTTPStatus.OK)
 
             elif request.method == "DELETE":
-                not_deleted_paths = []
-                for path in paths:
-                    for _path in urlpatterns:
-                        if str(path.pattern) == str(_path.pattern):
-                            urlpatterns.remove(_path)
-                            break
-                    else:
-                        not_deleted_paths.append(str(path.pattern))
+                if handler_name not in self.handlers:
+                    return HttpResponse(
+                        json.dumps({'error': f'Handler {handler_name} '
+                                    'is not attached.'}),
+                        status=HTTPStatus.NOT_FOUND)
+
+                not_deleted_paths = self.replicate(
+                    {'op': 'detach', 'name': handler_name})
                 if not_deleted_paths:
                     return HttpResponse(
                         json.dumps({'msg': 'View(s) unregistered.',
@@ -124,7 +356,15 @@ class DjangoApp(HandlerMixin, BaseApp):
             else:
                 return HttpResponse(status=HTTPStatus.METHOD_NOT_ALLOWED)
 
-        urlpatterns.append(path(HANDLER_URL[1:], handle_handler_data))
+        self.urlpatterns.add([path(HANDLER_URL[1:], handle_handler_data)])
+
+        def handle_cache(request):
+            if request.method != "GET":
+                return HttpResponse(status=HTTPStatus.METHOD_NOT_ALLOWED)
+            return HttpResponse(json.dumps(self.code_cache.stats()),
+                                status=HTTPStatus.OK)
+
+        self.urlpatterns.add([path(HANDLER_CACHE_URL[1:], handle_cache)])
 
     def reg_handler_data_route(self):
 
@@ -133,9 +373,12 @@ class DjangoApp(HandlerMixin, BaseApp):
             url = request.headers['m-handler-url']
             if request.method == "GET":
                 if url in self.handler_data:
-                    return HttpResponse(
+                    response = HttpResponse(
                         json.dumps(self.handler_data[url]),
                         status=HTTPStatus.OK)
+                    for name, value in self.sequence_headers(url).items():
+                        response[name] = value
+                    return response
                 else:
                     return HttpResponse(
                         json.dumps(
@@ -143,8 +386,18 @@ class DjangoApp(HandlerMixin, BaseApp):
                              f'for \'{url}\' route.'}),
                         status=HTTPStatus.NOT_FOUND)
             elif request.method == "POST":
-                self.handler_data[url] = json.loads(
-                    request.body.decode())
+                data = json.loads(request.body)
+                # templated responses are served without a handler route.
+                if not (answers_requests(data) or self.routes.serves(url)):
+                    return HttpResponse(
+                        json.dumps({'msg': 'Route not found.'}),
+                        status=HTTPStatus.NOT_FOUND)
+                try:
+                    self.replicate({'op': 'set_data', 'url': url,
+                                    'data': data})
+                except TemplateError as e:
+                    return HttpResponse(json.dumps({'error': str(e)}),
+                                        status=HTTPStatus.BAD_REQUEST)
                 return HttpResponse(
                     json.dumps(
                         {'msg': f'View data registered for \'{url}\' route.'}),
@@ -152,7 +405,7 @@ class DjangoApp(HandlerMixin, BaseApp):
 
             elif request.method == "DELETE":
                 if url in self.handler_data:
-                    del self.handler_data[url]
+                    self.replicate({'op': 'remove_data', 'url': url})
                     return HttpResponse(
                         json.dumps({'msg': 'View data deleted.'}),
                         status=HTTPStatus.OK)
@@ -165,7 +418,85 @@ class DjangoApp(HandlerMixin, BaseApp):
             else:
                 return HttpResponse(status=HTTPStatus.METHOD_NOT_ALLOWED)
 
-        urlpatterns.append(path(HANDLER_DATA_URL[1:], handle_data))
+        self.urlpatterns.add([path(HANDLER_DATA_URL[1:], handle_data)])
+
+        def handle_bulk_data(request):
+            if request.method == "POST" and self.oplog is None:
+                # parsed as the body is read.
+                count, errors = self.set_data_many(
+                    request, request.content_type)
+                action = 'registered'
+            elif request.method == "POST":
+                count, errors = self.replicate({
+                    'op': 'set_data_many',
+                    'body': request.body.decode('utf-8', 'replace'),
+                    'content_type': request.content_type})
+                action = 'registered'
+            elif request.method == "DELETE":
+                if request.headers.get('m-handler-clear'):
+                    count, errors = self.replicate({'op': 'clear_data'})
+                else:
+                    count, errors = self.replicate({
+                        'op': 'remove_data_many',
+                        'body': request.body.decode('utf-8', 'replace')})
+                action = 'deleted'
+            else:
+                return HttpResponse(status=HTTPStatus.METHOD_NOT_ALLOWED)
+            body, status = self.bulk_result(count, errors, action)
+            return HttpResponse(json.dumps(body), status=status)
+
+        self.urlpatterns.add(
+            [path(HANDLER_DATA_BULK_URL[1:], handle_bulk_data)])
+
+        @enforce_headers(['m-handler-file'])
+        def handle_file(request):
+            name = request.headers['m-handler-file']
+            if request.method == "POST":
+                try:
+                    _, size = self.save_fixture(name, iter(
+                        lambda: request.read(STREAM_CHUNK_SIZE), b''))
+                except ValueError as e:
+                    return HttpResponse(json.dumps({'error': str(e)}),
+                                        status=HTTPStatus.BAD_REQUEST)
+                body, status = {'msg': f'File {name} saved.',
+                                'size': size}, HTTPStatus.OK
+            elif request.method == "DELETE":
+                body, status = self.remove_fixture(name)
+            else:
+                return HttpResponse(status=HTTPStatus.METHOD_NOT_ALLOWED)
+            return HttpResponse(json.dumps(body), status=status)
+
+        self.urlpatterns.add([path(HANDLER_FILE_URL[1:], handle_file)])
+
+    def reg_journal_route(self):
+
+        def handle_journal(request):
+            if request.method == "GET":
+                body, status = self.journal_result(request.GET)
+            elif request.method == "DELETE":
+                self.journal.clear()
+                body, status = {'msg': 'Journal cleared.'}, HTTPStatus.OK
+            else:
+                return HttpResponse(status=HTTPStatus.METHOD_NOT_ALLOWED)
+            return HttpResponse(json.dumps(body), status=status)
+
+        self.urlpatterns.add([path(JOURNAL_URL[1:], handle_journal)])
+
+    def reg_metrics_route(self):
+
+        def handle_metrics(request):
+            if request.method == "GET":
+                body, status, content_type = self.metrics_result(request.GET)
+                return HttpResponse(body, status=status,
+                                    content_type=content_type)
+            elif request.method == "DELETE":
+                self.metrics.clear()
+                return HttpResponse(
+                    json.dumps({'msg': 'Metrics cleared.'}),
+                    status=HTTPStatus.OK)
+            return HttpResponse(status=HTTPStatus.METHOD_NOT_ALLOWED)
+
+        self.urlpatterns.add([path(METRICS_URL[1:], handle_metrics)])
 
     def _derive_run_cmd(self, **kwargs):
         run_cmd = ['manage.py']
@@ -189,6 +520,25 @@ class DjangoApp(HandlerMixin, BaseApp):
 
         return run_cmd
 
-    def run(self, **kwargs):
-        run_cmd = self._derive_run_cmd(**kwargs)
-        execute_from_command_line(run_cmd)
+    def serve(self, **kwargs):
+        self.urlpatterns.install()
+        _apps[int(kwargs['port'])] = self
+        if self.wsgi_server == DEV:
+            run_cmd = self._derive_run_cmd(**kwargs)
+            execute_from_command_line(run_cmd)
+            return
+
+        if 'host' in kwargs:
+            self._host = kwargs['host']
+        self._port = kwargs['port']
+        ssl_context = (self.ssl_cert, self.ssl_key) \
+            if ast.literal_eval(kwargs['enable_ssl']) else None
+
+        serve = get_backend(self.wsgi_server)
+        app = get_wsgi_application()
+        if self.wsgi_server == PREFORK:
+            # before the workers are forked, they inherit it.
+            self.share_state()
+            app = self._synced(app)
+        serve(app, self._host, self._port, ssl_context=ssl_context,
+              workers=self.workers)
@@ -6,11 +6,23 @@ from __future__ import absolute_import
 import ast
 import json
 import logging
+import os
+import time
 from http import HTTPStatus
 
-from flask import Blueprint, Flask, jsonify, make_response, request
+from flask import (Blueprint, Flask, Response, jsonify, make_response,
+                   request, send_file)
 from httpmocker.app.base_app import BaseApp
-from httpmocker.handler import HANDLER_DATA_URL, HANDLER_URL, HandlerMixin
+from httpmocker.config import get_config
+from httpmocker.exceptions import TemplateError
+from httpmocker.handler import (HANDLER_CACHE_URL, HANDLER_DATA_BULK_URL,
+                                HANDLER_DATA_URL, HANDLER_FILE_URL,
+                                HANDLER_URL, JOURNAL_URL, METRICS_URL,
+                                MOCK_APP_URL, STREAM_CHUNK_SIZE,
+                                HandlerMixin)
+from httpmocker.store import iter_chunks
+from httpmocker.templating import answers_requests, parse_body
+from httpmocker.wsgi import PREFORK, get_backend
 
 logger = logging.getLogger(__name__)
 
@@ -37,26 +49,109 @@ class FlaskApp(HandlerMixin, BaseApp):
         super().__init__(config)
         self.app = Flask(__name__)
         self.app.config.update(**config)
+        # WSGI server of the app, see httpmocker.wsgi.
+        self.wsgi_server = config.get(
+            'WSGI_SERVER', get_config().get('WSGI_SERVER'))
 
     def reg_request_middleware(self):
         @self.app.before_request
         def request_middleware():
-            request.handler_data = self.handler_data.get(
-                request.path, {})
+            # management routes never consume handler data.
+            if request.path.startswith(MOCK_APP_URL):
+                return
+            request.started = time.perf_counter()
+            key, data, params, template, fault = self.handler_data.resolve(
+                request.path)
+            request.handler_route = key
+            request.handler_data = data
+            request.handler_params = params
+            if fault is not None:
+                action = fault.inject(request.environ.get('werkzeug.socket'))
+                if action is not None:
+                    body, status, headers = self.fault_result(action, fault)
+                    return make_response(jsonify(**body), status, headers)
+                request.fault = fault
+            if template is not None:
+                return self._render(params, template)
+
+        @self.app.after_request
+        def response_middleware(response):
+            started = getattr(request, 'started', None)
+            if started is None:
+                return response
+            self.record_request(
+                request.method, request.path,
+                request.query_string.decode(),
+                request.url_rule.rule if request.url_rule
+                else request.handler_route,
+                response.status_code, started,
+                request.get_data() if self.journal.keeps_body else None)
+            fault = getattr(request, 'fault', None)
+            if fault is not None and fault.trickles:
+                response.response = fault.trickle(response.iter_encoded())
+            return response
+
+    def _render(self, params, template):
+        status, headers, body = template.render(
+            path=params,
+            query=request.args.to_dict(),
+            headers=request.headers,
+            body=parse_body(request.get_data())
+            if 'body' in template.sources else None)
+        if template.fixture is not None:
+            try:
+                view = self.fixtures.get(template.fixture)
+            except KeyError:
+                return make_response(jsonify(
+                    error=f'Fixture {template.fixture} not found.'),
+                    HTTPStatus.NOT_FOUND)
+            # wsgi servers only write bytes, copy the blob chunk by chunk.
+            resp = Response(iter_chunks(view, STREAM_CHUNK_SIZE), status,
+                            headers, direct_passthrough=True)
+            resp.content_length = len(view)
+            return resp
+        if template.file is None:
+            return make_response(body, status, headers)
+        location = self.fixture_path(template.file)
+        if not os.path.isfile(location):
+            return make_response(jsonify(
+                error=f'Fixture file {template.file} not found.'),
+                HTTPStatus.NOT_FOUND)
+        # served through wsgi.file_wrapper, sendfile where the server
+        # provides it.
+        resp = send_file(location, conditional=False)
+        resp.status_code = status
+        resp.headers.update(headers)
+        return resp
 
     def _remove_bp(self, bp):
-        for view in list(self.app.view_functions.keys()):
-            if bp.name in view:
-                del self.app.view_functions[view]
-                break
-        else:
+        views = [view for view in self.app.view_functions
+                 if view.startswith(bp.name + '.')]
+        if not views:
             raise KeyError(f'Blueprint with {bp.name} name not found.')
+        for view in views:
+            del self.app.view_functions[view]
 
         if bp.name in self.app.blueprints:
             del self.app.blueprints[bp.name]
         else:
             raise KeyError(f'Blueprint with {bp.name} name not found.')
 
+    def _blueprint_uris(self, bp):
+        prefix = bp.name + '.'
+        return [rule.rule for rule in self.app.url_map.iter_rules()
+                if rule.endpoint.startswith(prefix)]
+
+    def attach_handler(self, name, bp):
+        self.app.register_blueprint(bp)
+        self.handlers[name] = bp
+        self.routes.add(name, self._blueprint_uris(bp))
+
+    def detach_handler(self, name):
+        self._remove_bp(self.handlers[name])
+        del self.handlers[name]
+        self.routes.remove(name)
+
     def reg_handler_route(self):
         @self.app.route(HANDLER_URL, methods=['POST'])
         def add_blueprint():
@@ -65,42 +160,38 @@ class FlaskApp(HandlerMixin, BaseApp):
                 'm-blueprint-name', None) or 'bp'
 
             try:
-                module = self.import_handler(handler_name,
-                                             request.data.decode())
-                bp = getattr(module, blueprint_name)
+                self.replicate({'op': 'attach', 'name': handler_name,
+                                'code': request.data.decode(),
+                                'attr': blueprint_name})
+            except AssertionError as error:
+                return make_response(jsonify(msg=str(error)),
+                                     HTTPStatus.CONFLICT)
             except Exception:
                 return make_response(jsonify(error='Invalid handler data.'),
                                      HTTPStatus.BAD_REQUEST)
-
-            try:
-                self.app.register_blueprint(bp)
-            except (AssertionError) as error:
-                return make_response(jsonify(msg=str(error)),
-                                     HTTPStatus.CONFLICT)
             return make_response(jsonify(msg='Blueprint registered.'),
                                  HTTPStatus.OK)
 
         @self.app.route(HANDLER_URL, methods=['DELETE'])
         def delete_blueprint():
             handler_name = request.headers['m-handler-name']
-            blueprint_name = request.headers.get(
-                'm-blueprint-name', None) or 'bp'
-
-            try:
-                module = self.import_handler(handler_name,
-                                             request.data.decode())
-                bp = getattr(module, blueprint_name)
-            except Exception:
-                return make_response(jsonify(error='Invalid handler data.'),
-                                     HTTPStatus.BAD_REQUEST)
+            if handler_name not in self.handlers:
+                return make_response(
+                    jsonify(error=f'Handler {handler_name} is not attached.'),
+                    HTTPStatus.NOT_FOUND)
             try:
-                self._remove_bp(bp)
+                self.replicate({'op': 'detach', 'name': handler_name})
             except (AssertionError, KeyError) as error:
                 return make_response(jsonify(msg=str(error)),
                                      HTTPStatus.NOT_FOUND)
             return make_response(jsonify(msg='Blueprint de-registered.'),
                                  HTTPStatus.OK)
 
+        @self.app.route(HANDLER_CACHE_URL, methods=['GET'])
+        def get_handler_cache():
+            return make_response(jsonify(**self.code_cache.stats()),
+                                 HTTPStatus.OK)
+
     def reg_handler_data_route(self):
 
         @self.app.route(HANDLER_DATA_URL, methods=['GET'])
@@ -108,7 +199,8 @@ class FlaskApp(HandlerMixin, BaseApp):
             url = request.headers['m-handler-url']
             if url in self.handler_data:
                 return make_response(json.dumps(self.handler_data[url]),
-                                     HTTPStatus.OK)
+                                     HTTPStatus.OK,
+                                     self.sequence_headers(url))
             else:
                 return make_response(jsonify(
                     msg=f'Blueprint data not found for a given url.'),
@@ -117,15 +209,18 @@ class FlaskApp(HandlerMixin, BaseApp):
         @self.app.route(HANDLER_DATA_URL, methods=['POST'])
         def set_blueprint_data():
             url = request.headers['m-handler-url']
-            for rule in self.app.url_map.iter_rules():
-                print(rule.rule, url)
-                print(type(rule), type(url))
-                if rule.rule == url:
-                    self.handler_data[url] = json.loads(
-                        request.data.decode())
-                    return make_response(jsonify(
-                        msg=f'Data registered for \'{url}\' route.'),
-                        HTTPStatus.OK)
+            data = json.loads(request.get_data(cache=False))
+            # templated responses are served without a handler route.
+            if answers_requests(data) or self.routes.serves(url):
+                try:
+                    self.replicate({'op': 'set_data', 'url': url,
+                                    'data': data})
+                except TemplateError as e:
+                    return make_response(jsonify(error=str(e)),
+                                         HTTPStatus.BAD_REQUEST)
+                return make_response(jsonify(
+                    msg=f'Data registered for \'{url}\' route.'),
+                    HTTPStatus.OK)
             return make_response(jsonify(
                 msg=f'Route not found.'),
                 HTTPStatus.NOT_FOUND)
@@ -134,7 +229,7 @@ class FlaskApp(HandlerMixin, BaseApp):
         def delete_blueprint_data():
             url = request.headers['m-handler-url']
             if url in self.handler_data:
-                del self.handler_data[url]
+                self.replicate({'op': 'remove_data', 'url': url})
                 return make_response(jsonify(
                     msg=f'Blueprint data deleted.'),
                     HTTPStatus.OK)
@@ -143,7 +238,81 @@ class FlaskApp(HandlerMixin, BaseApp):
                     msg=f'Blueprint data not found for a given url.'),
                     HTTPStatus.NOT_FOUND)
 
-    def run(self, **kwargs):
+        @self.app.route(HANDLER_DATA_BULK_URL, methods=['POST'])
+        def set_bulk_data():
+            if self.oplog is None:
+                # parsed as the body is read.
+                count, errors = self.set_data_many(request.stream,
+                                                   request.content_type)
+            else:
+                count, errors = self.replicate({
+                    'op': 'set_data_many',
+                    'body': request.get_data().decode('utf-8', 'replace'),
+                    'content_type': request.content_type})
+            body, status = self.bulk_result(count, errors, 'registered')
+            return make_response(jsonify(**body), status)
+
+        @self.app.route(HANDLER_DATA_BULK_URL, methods=['DELETE'])
+        def delete_bulk_data():
+            if request.headers.get('m-handler-clear'):
+                count, errors = self.replicate({'op': 'clear_data'})
+            else:
+                count, errors = self.replicate({
+                    'op': 'remove_data_many',
+                    'body': request.get_data().decode('utf-8', 'replace')})
+            body, status = self.bulk_result(count, errors, 'deleted')
+            return make_response(jsonify(**body), status)
+
+        @self.app.route(HANDLER_FILE_URL, methods=['POST'])
+        def upload_file():
+            name = request.headers.get('m-handler-file')
+            if not name:
+                return make_response(jsonify(
+                    error='m-handler-file header is mandatory.'),
+                    HTTPStatus.BAD_REQUEST)
+            try:
+                _, size = self.save_fixture(name, iter(
+                    lambda: request.stream.read(STREAM_CHUNK_SIZE), b''))
+            except ValueError as e:
+                return make_response(jsonify(error=str(e)),
+                                     HTTPStatus.BAD_REQUEST)
+            return make_response(jsonify(msg=f'File {name} saved.',
+                                         size=size), HTTPStatus.OK)
+
+        @self.app.route(HANDLER_FILE_URL, methods=['DELETE'])
+        def delete_file():
+            body, status = self.remove_fixture(
+                request.headers.get('m-handler-file', ''))
+            return make_response(jsonify(**body), status)
+
+    def reg_journal_route(self):
+
+        @self.app.route(JOURNAL_URL, methods=['GET'])
+        def get_journal():
+            body, status = self.journal_result(request.args)
+            return make_response(jsonify(**body), status)
+
+        @self.app.route(JOURNAL_URL, methods=['DELETE'])
+        def clear_journal():
+            self.journal.clear()
+            return make_response(jsonify(msg='Journal cleared.'),
+                                 HTTPStatus.OK)
+
+    def reg_metrics_route(self):
+
+        @self.app.route(METRICS_URL, methods=['GET'])
+        def get_metrics():
+            body, status, content_type = self.metrics_result(request.args)
+            return make_response(body, status,
+                                 {'Content-Type': content_type})
+
+        @self.app.route(METRICS_URL, methods=['DELETE'])
+        def clear_metrics():
+            self.metrics.clear()
+            return make_response(jsonify(msg='Metrics cleared.'),
+                                 HTTPStatus.OK)
+
+    def serve(self, **kwargs):
         if 'host' in kwargs:
             self._host = kwargs['host']
         self._port = kwargs['port']
@@ -154,4 +323,10 @@ class FlaskApp(HandlerMixin, BaseApp):
 
         kwargs.pop('enable_ssl', None)
 
-        self.app.run(**kwargs)
+        serve = get_backend(self.wsgi_server)
+        if self.wsgi_server == PREFORK:
+            # before the workers are forked, they inherit it.
+            self.share_state()
+            self.app.wsgi_app = self._synced(self.app.wsgi_app)
+        serve(self.app, kwargs.get('host', '127.0.0.1'), self._port,
+              ssl_context=kwargs.get('ssl_context'), workers=self.workers)
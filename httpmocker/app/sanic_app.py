@@ -6,11 +6,19 @@ from __future__ import absolute_import
 import ast
 import json
 import logging
+import os
+import time
 from functools import wraps
 from http import HTTPStatus
+from multiprocessing import current_process
 
 from httpmocker.app.base_app import BaseApp
-from httpmocker.handler import HANDLER_DATA_URL, HANDLER_URL, HandlerMixin
+from httpmocker.exceptions import TemplateError
+from httpmocker.handler import (HANDLER_CACHE_URL, HANDLER_DATA_BULK_URL,
+                                HANDLER_DATA_URL, HANDLER_FILE_URL,
+                                HANDLER_URL, JOURNAL_URL, METRICS_URL,
+                                MOCK_APP_URL, HandlerMixin)
+from httpmocker.templating import answers_requests, parse_body
 from sanic import Blueprint, Sanic, request, response
 from sanic.exceptions import SanicException
 from sanic.router import RouteDoesNotExist, RouteExists
@@ -42,29 +50,124 @@ class SanicApp(HandlerMixin, BaseApp):
 
     def reg_request_middleware(self):
         @self.app.middleware('request')
-        def request_middleware(request):
-            request['handler_data'] = self.handler_data.get(
-                request.raw_url.decode(), {})
+        async def request_middleware(request):
+            if self.oplog is not None:
+                self.oplog.sync(self.apply)
+            # management routes never consume handler data.
+            if request.path.startswith(MOCK_APP_URL):
+                return
+            request['started'] = time.perf_counter()
+            key, data, params, template, fault = self.handler_data.resolve(
+                request.path, raw=request.raw_url.decode())
+            request['handler_route'] = key
+            request['handler_data'] = data
+            request['handler_params'] = params
+            if fault is not None:
+                # waits without blocking the other requests of the loop.
+                action = await fault.inject_async(request.transport)
+                if action is not None:
+                    body, status, headers = self.fault_result(action, fault)
+                    return response.json(body, status=status,
+                                         headers=headers)
+                request['fault'] = fault
+            if template is not None:
+                return await self._render(request, params, template)
+
+        @self.app.middleware('response')
+        async def response_middleware(request, resp):
+            started = request.get('started')
+            if started is None:
+                return
+            self.record_request(
+                request.method, request.path, request.query_string,
+                getattr(request, 'uri_template', None) or
+                request.get('handler_route'),
+                resp.status, started, request.body)
+            fault = request.get('fault')
+            if fault is not None and fault.trickles:
+                return self._trickle(resp, fault)
+
+    @staticmethod
+    def _trickle(resp, fault):
+        if hasattr(resp, 'streaming_fn'):
+            stream = resp.streaming_fn
+
+            async def trickled(out):
+                write = out.write
+                out.write = lambda data: fault.trickle_async(write, data)
+                await stream(out)
+            resp.streaming_fn = trickled
+            return resp
+
+        async def trickled(out):
+            await fault.trickle_async(out.write, resp.body)
+        return response.stream(trickled, status=resp.status,
+                               headers=resp.headers,
+                               content_type=resp.content_type)
+
+    async def _render(self, request, params, template):
+        status, headers, body = template.render(
+            path=params,
+            query={key: values[0] for key, values in request.args.items()},
+            headers=request.headers,
+            body=parse_body(request.body)
+            if 'body' in template.sources else None)
+        if template.fixture is not None:
+            try:
+                body = self.fixtures.get(template.fixture)
+            except KeyError:
+                return response.json(
+                    {'error': f'Fixture {template.fixture} not found.'},
+                    status=HTTPStatus.NOT_FOUND)
+        if template.file is None:
+            return response.raw(body, status=status, headers=headers,
+                                content_type=headers.get('Content-Type'))
+        location = self.fixture_path(template.file)
+        if not os.path.isfile(location):
+            return response.json(
+                {'error': f'Fixture file {template.file} not found.'},
+                status=HTTPStatus.NOT_FOUND)
+        return await response.file_stream(
+            location, status=status, headers=headers,
+            mime_type=headers.get('Content-Type'))
+
+    @staticmethod
+    def _blueprint_uris(bp):
+        for route in bp.routes:
+            uri = route.uri
+            if bp.url_prefix:
+                uri = bp.url_prefix + uri
+            version = route.version or getattr(bp, 'version', None)
+            if version:
+                uri = f'/v{version}/' + uri.lstrip('/')
+            yield uri
+            # if strict slash enforced, only the given route exists,
+            # otherwise, one with slash also.
+            if not route.strict_slashes:
+                yield uri[:-1] if uri.endswith('/') else uri + '/'
 
     def _remove_routes(self, bp):
         # clear all routes from the app.
-        for route in self.app.blueprints[bp.name].routes:
-            # if strict slash enforced, only delete the given route,
-            # otherwise, delete one with slash also.
-            if route.strict_slashes:
-                routes_to_delete = [route.uri]
-            else:
-                routes_to_delete = [route.uri, route.uri + '/']
-            for route_uri in routes_to_delete:
-                if route_uri in self.app.router.routes_all:
-                    logger.debug(f'Removing {route_uri} route from the app.')
-                    self.app.remove_route(route_uri)
+        for route_uri in self._blueprint_uris(self.app.blueprints[bp.name]):
+            if route_uri in self.app.router.routes_all:
+                logger.debug(f'Removing {route_uri} route from the app.')
+                self.app.remove_route(route_uri)
 
         # clear routes from blueprint
         self.app.blueprints[bp.name].routes.clear()
         # delete the blueprint
         del self.app.blueprints[bp.name]
 
+    def attach_handler(self, name, bp):
+        self.app.blueprint(bp)
+        self.handlers[name] = bp
+        self.routes.add(name, self._blueprint_uris(bp))
+
+    def detach_handler(self, name):
+        self._remove_routes(self.handlers[name])
+        del self.handlers[name]
+        self.routes.remove(name)
+
     def reg_handler_route(self):
         @self.app.route(HANDLER_URL, methods=['POST'])
         @enforce_headers(['m-handler-name'])
@@ -73,16 +176,13 @@ class SanicApp(HandlerMixin, BaseApp):
             blueprint_name = request.headers.get(
                 'm-blueprint-name', None) or 'bp'
             try:
-                module = self.import_handler(handler_name,
-                                             request.body.decode())
-                bp = getattr(module, blueprint_name)
-            except (ImportError, AttributeError) as error:
+                self.replicate({'op': 'attach', 'name': handler_name,
+                                'code': request.body.decode(),
+                                'attr': blueprint_name})
+            except (ImportError, AttributeError, SyntaxError) as error:
                 logger.exception(error)
                 return response.json({'error': str(error)},
                                      status=HTTPStatus.BAD_REQUEST)
-
-            try:
-                self.app.blueprint(bp)
             except (AssertionError, RouteExists,
                     RouteDoesNotExist, SanicException) as error:
                 logger.exception(error)
@@ -97,23 +197,16 @@ class SanicApp(HandlerMixin, BaseApp):
         @enforce_headers(['m-handler-name'])
         def remove_blueprint(request):
             handler_name = request.headers['m-handler-name']
-            blueprint_name = request.headers.get(
-                'm-blueprint-name', None) or 'bp'
-            try:
-                module = self.import_handler(handler_name,
-                                             request.body.decode(),
-                                             save_temp=True)
-                bp = getattr(module, blueprint_name)
-            except (ImportError, AttributeError) as error:
-                logger.exception(error)
-                return response.json({'error': str(error)},
-                                     status=HTTPStatus.BAD_REQUEST)
+            if handler_name not in self.handlers:
+                return response.json(
+                    {'error': f'Handler {handler_name} is not attached.'},
+                    status=HTTPStatus.NOT_FOUND)
             try:
-                self._remove_routes(bp)
+                self.replicate({'op': 'detach', 'name': handler_name})
             except (KeyError, RouteExists, RouteDoesNotExist) as error:
                 logger.exception(error)
                 return response.json(
-                    {'error': f'Blueprint not found with the name {bp.name}'},
+                    {'error': f'Blueprint not found for {handler_name}'},
                     status=HTTPStatus.CONFLICT)
             except SanicException as error:
                 logger.exception(error)
@@ -124,21 +217,26 @@ class SanicApp(HandlerMixin, BaseApp):
             return response.json({'msg': 'Blueprint unregistered.'},
                                  status=HTTPStatus.OK)
 
+        @self.app.route(HANDLER_CACHE_URL, methods=['GET'])
+        def get_handler_cache(request):
+            return response.json(self.code_cache.stats(),
+                                 status=HTTPStatus.OK)
+
     def reg_handler_data_route(self):
 
         @self.app.route(HANDLER_DATA_URL, methods=['GET'])
         @enforce_headers(['m-handler-url'])
-        def set_blueprint_data(request):
+        def get_blueprint_data(request):
             url = request.headers['m-handler-url']
-            print(self.app.router.routes_all.keys())
             if url in self.handler_data:
                 msg = f'Data found for \'{url}\' route.'
                 logger.info(msg)
                 return response.json(
                     self.handler_data[url],
+                    headers=self.sequence_headers(url),
                     status=HTTPStatus.OK)
 
-            msg = 'Blueprint data not found for \'{url}\' route.'
+            msg = f'Blueprint data not found for \'{url}\' route.'
             logger.info(msg)
             return response.json({'msg': msg}, status=HTTPStatus.NOT_FOUND)
 
@@ -146,13 +244,18 @@ class SanicApp(HandlerMixin, BaseApp):
         @enforce_headers(['m-handler-url'])
         def set_blueprint_data(request):
             url = request.headers['m-handler-url']
-            print(self.app.router.routes_all.keys())
-            for route in self.app.router.routes_all.keys():
-                if url == route:
-                    self.handler_data[url] = json.loads(request.body.decode())
-                    msg = f'Data registered for \'{url}\' route.'
-                    logger.info(msg)
-                    return response.json({'msg': msg}, status=HTTPStatus.OK)
+            data = json.loads(request.body)
+            # templated responses are served without a handler route.
+            if answers_requests(data) or self.routes.serves(url):
+                try:
+                    self.replicate({'op': 'set_data', 'url': url,
+                                    'data': data})
+                except TemplateError as e:
+                    return response.json({'error': str(e)},
+                                         status=HTTPStatus.BAD_REQUEST)
+                msg = f'Data registered for \'{url}\' route.'
+                logger.info(msg)
+                return response.json({'msg': msg}, status=HTTPStatus.OK)
 
             msg = 'Route not found.'
             logger.info(msg)
@@ -163,14 +266,87 @@ class SanicApp(HandlerMixin, BaseApp):
         def delete_blueprint_data(request):
             url = request.headers['m-handler-url']
             if url in self.handler_data:
-                del self.handler_data[url]
+                self.replicate({'op': 'remove_data', 'url': url})
                 msg = 'Blueprint data deleted.'
                 return response.json({'msg': msg}, status=HTTPStatus.OK)
             else:
-                msg = 'Blueprint data not found for \'{url}\' route.'
+                msg = f'Blueprint data not found for \'{url}\' route.'
                 return response.json({'msg': msg}, status=HTTPStatus.NOT_FOUND)
 
-    def run(self, **kwargs):
+        @self.app.route(HANDLER_DATA_BULK_URL, methods=['POST'])
+        def set_bulk_data(request):
+            count, errors = self.replicate({
+                'op': 'set_data_many',
+                'body': request.body.decode('utf-8', 'replace'),
+                'content_type': request.headers.get('content-type')})
+            body, status = self.bulk_result(count, errors, 'registered')
+            return response.json(body, status=status)
+
+        @self.app.route(HANDLER_DATA_BULK_URL, methods=['DELETE'])
+        def delete_bulk_data(request):
+            if request.headers.get('m-handler-clear'):
+                count, errors = self.replicate({'op': 'clear_data'})
+            else:
+                count, errors = self.replicate({
+                    'op': 'remove_data_many',
+                    'body': request.body.decode('utf-8', 'replace')})
+            body, status = self.bulk_result(count, errors, 'deleted')
+            return response.json(body, status=status)
+
+        @self.app.route(HANDLER_FILE_URL, methods=['POST'], stream=True)
+        @enforce_headers(['m-handler-file'])
+        async def upload_file(request):
+            name = request.headers['m-handler-file']
+            size = 0
+            try:
+                with self.open_fixture(name) as wh:
+                    while True:
+                        chunk = await request.stream.read()
+                        if chunk is None:
+                            break
+                        wh.write(chunk)
+                        size += len(chunk)
+            except ValueError as e:
+                return response.json({'error': str(e)},
+                                     status=HTTPStatus.BAD_REQUEST)
+            return response.json({'msg': f'File {name} saved.',
+                                  'size': size}, status=HTTPStatus.OK)
+
+        @self.app.route(HANDLER_FILE_URL, methods=['DELETE'])
+        @enforce_headers(['m-handler-file'])
+        def delete_file(request):
+            body, status = self.remove_fixture(
+                request.headers['m-handler-file'])
+            return response.json(body, status=status)
+
+    def reg_journal_route(self):
+
+        @self.app.route(JOURNAL_URL, methods=['GET'])
+        def get_journal(request):
+            body, status = self.journal_result(request.args)
+            return response.json(body, status=status)
+
+        @self.app.route(JOURNAL_URL, methods=['DELETE'])
+        def clear_journal(request):
+            self.journal.clear()
+            return response.json({'msg': 'Journal cleared.'},
+                                 status=HTTPStatus.OK)
+
+    def reg_metrics_route(self):
+
+        @self.app.route(METRICS_URL, methods=['GET'])
+        def get_metrics(request):
+            body, status, content_type = self.metrics_result(request.args)
+            return response.text(body, status=status,
+                                 content_type=content_type)
+
+        @self.app.route(METRICS_URL, methods=['DELETE'])
+        def clear_metrics(request):
+            self.metrics.clear()
+            return response.json({'msg': 'Metrics cleared.'},
+                                 status=HTTPStatus.OK)
+
+    def serve(self, **kwargs):
         if 'host' in kwargs:
             self._host = kwargs['host']
 
@@ -178,5 +354,15 @@ class SanicApp(HandlerMixin, BaseApp):
             kwargs.update(
                 {'ssl': {'cert': self.ssl_cert, 'key': self.ssl_key}})
 
+        kwargs.pop('enable_ssl', None)
+
         self._port = kwargs['port']
+        if self.workers > 1:
+            # before sanic forks the workers, which inherit it.
+            self.share_state()
+            # the app process is daemonic and multiprocessing refuses to
+            # fork children of a daemonic process. Sanic terminates its
+            # workers when the app process is stopped.
+            current_process().daemon = False
+            kwargs['workers'] = self.workers
         self.app.run(**kwargs)
@@ -0,0 +1,550 @@
+"""Asyncio client exposes APIs to manage server operations without
+blocking the event loop.
+
+It mirrors :mod:`httpmocker.client`: every request is a coroutine and runs
+over a pool of keep-alive asyncio streams, so many apps and handlers can be
+driven concurrently with ``asyncio.gather``.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import urlencode
+
+from httpmocker.client import (IDEMPOTENT_METHODS, IDLE_TIMEOUT,
+                               SEQUENCE_STATE, AppType, _body, _bulk_data_body,
+                               _bulk_error, _stream_length)
+from httpmocker.exceptions import (AccessDenied, AppException, ClientException,
+                                   ConnectError, HandlerException)
+from httpmocker.handler import JOURNAL_URL, METRICS_URL, STREAM_CHUNK_SIZE
+from httpmocker.utils import permit_access_if
+
+logger = logging.getLogger(__name__)
+
+
+async def mock_via(app_type, port, **kwargs):
+    async with AsyncClient() as client:
+        app = client.app(app_type, port, **kwargs)
+        await app.start()
+        return app
+
+
+async def mock_via_flask(port, **kwargs):
+    return await mock_via(AppType.FLASK, port, **kwargs)
+
+
+async def mock_via_sanic(port, **kwargs):
+    return await mock_via(AppType.SANIC, port, **kwargs)
+
+
+async def mock_via_django(port, **kwargs):
+    return await mock_via(AppType.DJANGO, port, **kwargs)
+
+
+class AsyncResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body.decode() or 'null')
+
+
+class _Stream:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+        # the current request was fully sent.
+        self.sent = False
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncConnectionPool:
+    """Bounded pool of keep-alive HTTP/1.1 connections over asyncio
+    streams.
+    """
+
+    def __init__(self, host, port, maxsize=10, idle_timeout=IDLE_TIMEOUT,
+                 ssl=None, timeout=10):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._maxsize = maxsize
+        self._slots = None
+        self._idle = []
+
+    @property
+    def slots(self):
+        # created lazily so the pool binds to the running event loop.
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._maxsize)
+        return self._slots
+
+    async def _connect(self):
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.ssl),
+                self.timeout)
+        except (OSError, asyncio.TimeoutError) as error:
+            raise ConnectError(
+                f'Could not connect to a {self.host}: {error}')
+        return _Stream(reader, writer)
+
+    def _take_idle(self):
+        now = time.monotonic()
+        while self._idle:
+            stream = self._idle.pop()
+            if now - stream.last_used < self.idle_timeout and \
+                    not stream.reader.at_eof():
+                return stream
+            stream.close()
+        return None
+
+    async def request(self, method, url, body=None, headers=None):
+        """Send the request and read the whole response.
+
+        A reused connection closed by the server is replaced and the
+        request is sent again: always when it failed while the request was
+        sent, only for an idempotent method once the request was sent. A
+        binary file body is streamed.
+
+        :return: response.
+        :rtype: AsyncResponse
+        """
+        if isinstance(body, str):
+            body = body.encode()
+        position = body.tell() if hasattr(body, 'seek') else None
+        async with self.slots:
+            stream = self._take_idle()
+            if stream is not None:
+                try:
+                    return await self._send(stream, method, url, body,
+                                            headers)
+                except (ConnectionError,
+                        asyncio.IncompleteReadError) as error:
+                    if stream.sent and method not in IDEMPOTENT_METHODS:
+                        raise ConnectError(
+                            f'Connection to {self.host} failed: {error}')
+                    if position is not None:
+                        body.seek(position)
+            stream = await self._connect()
+            try:
+                return await self._send(stream, method, url, body, headers)
+            except (ConnectionError, asyncio.IncompleteReadError) as error:
+                raise ConnectError(
+                    f'Connection to {self.host} failed: {error}')
+
+    async def _send(self, stream, method, url, body, headers):
+        try:
+            response = await self._exchange(stream, method, url, body,
+                                            headers)
+        except BaseException:
+            # a timed out or cancelled exchange leaves the stream in the
+            # middle of a request.
+            stream.close()
+            raise
+        connection = response.headers.get('connection', '').lower()
+        if connection == 'close' or stream.reader.at_eof():
+            stream.close()
+        else:
+            stream.last_used = time.monotonic()
+            self._idle.append(stream)
+        return response
+
+    async def _exchange(self, stream, method, url, body, headers):
+        stream.sent = False
+        is_file = hasattr(body, 'read')
+        if is_file:
+            length = _stream_length(body)
+        else:
+            length = len(body) if body else 0
+        headers = {name: value for name, value in (headers or {}).items()
+                   if name.lower() != 'content-length'}
+        lines = [f'{method} {url} HTTP/1.1',
+                 f'Host: {self.host}:{self.port}',
+                 f'Content-Length: {length}']
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        stream.writer.write(
+            ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if is_file:
+            for chunk in iter(lambda: body.read(STREAM_CHUNK_SIZE), b''):
+                stream.writer.write(chunk)
+                await stream.writer.drain()
+        elif body:
+            stream.writer.write(body)
+        await stream.writer.drain()
+        stream.sent = True
+        return await asyncio.wait_for(self._read(stream), self.timeout)
+
+    async def _read(self, stream):
+        reader = stream.reader
+        status_line = await reader.readuntil(b'\r\n')
+        version, status = status_line.decode('latin-1').split(' ', 2)[:2]
+        headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0],
+                           16)
+                if not size:
+                    await reader.readuntil(b'\r\n')
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            headers['connection'] = 'close'
+
+        if version == 'HTTP/1.0' and \
+                headers.get('connection', '').lower() != 'keep-alive':
+            headers['connection'] = 'close'
+        return AsyncResponse(int(status), headers, body)
+
+    def close(self):
+        idle, self._idle = self._idle, []
+        for stream in idle:
+            stream.close()
+
+
+def _raise_for_status(response, exception):
+    if response.status != 200:
+        try:
+            body = response.json()
+        except ValueError:
+            # an error page of the server rather than a json error.
+            body = None
+        if isinstance(body, dict):
+            raise exception(f'{body.get("error") or body.get("msg")}')
+        raise exception(f'Request failed with status {response.status}.')
+    return response.json()
+
+
+class AsyncHandler:
+
+    def __init__(self, name, **kwargs):
+        self._name = name
+        self.pool = kwargs['pool']
+        self.base_url = '/mock/app/handler/'
+        self.handler_set = False
+
+    @property
+    def name(self):
+        return self._name
+
+    @permit_access_if('handler_set', True, msg='Handler is not set.')
+    async def set_data(self, url, data):
+        headers = {'m-handler-url': url}
+        response = await self.pool.request(
+            'POST', self.base_url + 'data/', body=_body(data, headers),
+            headers=headers)
+        return _raise_for_status(response, HandlerException)
+
+    @permit_access_if('handler_set', True, msg='Handler is not set.')
+    async def remove_data(self, url):
+        response = await self.pool.request(
+            'DELETE', self.base_url + 'data/',
+            headers={'m-handler-url': url})
+        return _raise_for_status(response, HandlerException)
+
+    async def _bulk_request(self, method, body=None, headers=None):
+        response = await self.pool.request(
+            method, self.base_url + 'data/bulk/', body=body, headers=headers)
+        if response.status != 200:
+            raise HandlerException(_bulk_error(response.json()))
+        return response.json()
+
+    @permit_access_if('handler_set', True, msg='Handler is not set.')
+    async def set_data_many(self, entries):
+        body, headers = _bulk_data_body(entries)
+        return await self._bulk_request('POST', body, headers)
+
+    @permit_access_if('handler_set', True, msg='Handler is not set.')
+    async def remove_data_many(self, urls):
+        return await self._bulk_request('DELETE', json.dumps(list(urls)))
+
+    @permit_access_if('handler_set', True, msg='Handler is not set.')
+    async def clear_data(self):
+        return await self._bulk_request(
+            'DELETE', headers={'m-handler-clear': 'true'})
+
+    async def upload_file(self, name, file):
+        headers = {'m-handler-file': name}
+        response = await self.pool.request(
+            'POST', self.base_url + 'file/', body=_body(file, headers),
+            headers=headers)
+        return _raise_for_status(response, HandlerException)
+
+    async def remove_file(self, name):
+        response = await self.pool.request(
+            'DELETE', self.base_url + 'file/',
+            headers={'m-handler-file': name})
+        return _raise_for_status(response, HandlerException)
+
+    @permit_access_if('handler_set', True, msg='Handler is not set.')
+    async def sequence(self, url):
+        response = await self.pool.request(
+            'GET', self.base_url + 'data/', headers={'m-handler-url': url})
+        _raise_for_status(response, HandlerException)
+        if 'm-sequence-position' not in response.headers:
+            return None
+        return {key: int(response.headers[f'm-sequence-{key}'])
+                for key in SEQUENCE_STATE}
+
+    async def attach(self, data):
+        headers = {'m-handler-name': self._name}
+        response = await self.pool.request(
+            'POST', self.base_url, body=_body(data, headers, encode=str),
+            headers=headers)
+        body = _raise_for_status(response, HandlerException)
+        self.handler_set = True
+        return body
+
+    @permit_access_if('handler_set', True, msg='Handler is not set.')
+    async def detach(self):
+        response = await self.pool.request(
+            'DELETE', self.base_url,
+            headers={'m-handler-name': self._name})
+        body = _raise_for_status(response, HandlerException)
+        self.handler_set = False
+        return body
+
+    def __repr__(self):
+        return f'<AsyncHandler name={self._name}>'
+
+    __str__ = __repr__
+
+
+class AsyncApp:
+    def __init__(self, name, **kwargs):
+        self._name = name
+        self._id = None
+        self._enable_ssl = kwargs.get('enable_ssl', False)
+        self._ssl_cert = kwargs.get('ssl_cert', None)
+        self._ssl_key = kwargs.get('ssl_key', None)
+        self._config = kwargs.get('config', None)
+        # worker processes of a sanic app.
+        self._workers = kwargs.get('workers', None)
+        self.port = kwargs['port']
+        self.pool = kwargs['pool']
+        self.base_url = '/mock/app/'
+        self.started = False
+        self._handler_pool = None
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def id(self):
+        return self._id
+
+    def _start_config(self, config=None):
+        config = dict(config or self._config or {})
+        config.update({
+            'ssl_cert': self._ssl_cert,
+            'ssl_key': self._ssl_key
+        })
+        if self._workers:
+            config['WORKERS'] = self._workers
+        return config
+
+    def _start_entry(self):
+        return {'name': self._name,
+                'port': self.port,
+                'enable_ssl': self._enable_ssl,
+                'config': self._start_config()}
+
+    def _set_started(self, app_id):
+        self._id = app_id
+        self.started = True
+
+    def _set_stopped(self):
+        self.started = False
+
+    @permit_access_if('started', True, msg='App has not started.')
+    async def status(self):
+        response = await self.pool.request(
+            'GET', self.base_url, headers={'m-app-id': self._id})
+        return _raise_for_status(response, AppException)
+
+    @permit_access_if('started', True, msg='App has not started.')
+    async def stop(self):
+        response = await self.pool.request(
+            'DELETE', self.base_url, headers={'m-app-id': self._id})
+        body = _raise_for_status(response, AppException)
+        self._set_stopped()
+        return body
+
+    @permit_access_if('started', False, msg='App has already started.')
+    async def start(self, config=None):
+        headers = {'m-app-name': self._name,
+                   'm-app-port': self.port,
+                   'm-app-enable-ssl': self._enable_ssl}
+        response = await self.pool.request(
+            'POST', self.base_url,
+            body=json.dumps(self._start_config(config)), headers=headers)
+        body = _raise_for_status(response, AppException)
+        self._set_started(response.headers['m-app-id'])
+        return body
+
+    @permit_access_if('started', True, msg='App has not started.')
+    async def running(self):
+        return (await self.status())['status'] == 'running'
+
+    def _app_pool(self):
+        # handlers of the app share one pool of keep-alive streams.
+        if self._handler_pool is None:
+            self._handler_pool = AsyncConnectionPool(self.pool.host,
+                                                     self.port)
+        return self._handler_pool
+
+    @permit_access_if('started', True, msg='App has not started.')
+    def handler(self, name, **kwargs):
+        if 'pool' not in kwargs:
+            kwargs['pool'] = self._app_pool()
+        return AsyncHandler(name, **kwargs)
+
+    @permit_access_if('started', True, msg='App has not started.')
+    async def requests(self, filter=None):
+        query = urlencode({name: value for name, value
+                           in (filter or {}).items() if value is not None})
+        response = await self._app_pool().request(
+            'GET', JOURNAL_URL + (f'?{query}' if query else ''))
+        return _raise_for_status(response, AppException)['requests']
+
+    @permit_access_if('started', True, msg='App has not started.')
+    async def metrics(self):
+        response = await self._app_pool().request('GET', METRICS_URL)
+        return _raise_for_status(response, AppException)['routes']
+
+    @permit_access_if('started', True, msg='App has not started.')
+    async def clear_requests(self):
+        response = await self._app_pool().request('DELETE', JOURNAL_URL)
+        return _raise_for_status(response, AppException)
+
+    def __repr__(self):
+        status = 'running' if self.started else 'stopped'
+        return f'<AsyncApp name={self._name} id={self._id} status={status}>'
+
+    __str__ = __repr__
+
+
+class AsyncClient:
+    def __init__(self, host='0.0.0.0', port=8080, **kwargs):
+        self.pool = kwargs.pop('pool', None) or AsyncConnectionPool(
+            host, port, **kwargs)
+        self.base_url = '/mock/'
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, exec, tb):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+
+    def app(self, name, port, **kwargs):
+        kwargs['pool'] = self.pool
+        return AsyncApp(name, port=port, **kwargs)
+
+    def apps(self, entries, **kwargs):
+        """Create apps from ``(app_type, port[, config])`` entries.
+
+        :param list entries: app entries.
+        :return: apps, not started yet.
+        :rtype: list
+        """
+        apps = []
+        for name, port, *config in entries:
+            apps.append(self.app(name, port,
+                                 config=config[0] if config else None,
+                                 **kwargs))
+        return apps
+
+    async def upload_fixture(self, data):
+        headers = {}
+        response = await self.pool.request(
+            'POST', self.base_url + 'fixtures/',
+            body=_body(data, headers, encode=lambda data: data),
+            headers=headers)
+        return _raise_for_status(response, ClientException)
+
+    async def fixtures(self):
+        response = await self.pool.request('GET',
+                                           self.base_url + 'fixtures/')
+        return response.json()['fixtures']
+
+    async def remove_fixture(self, digest):
+        response = await self.pool.request(
+            'DELETE', self.base_url + 'fixtures/',
+            headers={'m-fixture-digest': digest})
+        return _raise_for_status(response, ClientException)
+
+    async def metrics(self):
+        response = await self.pool.request('GET',
+                                           self.base_url + 'metrics/')
+        return response.json()
+
+    async def _batch(self, method, body):
+        response = await self.pool.request(method, self.base_url + 'apps/',
+                                           body=json.dumps(body))
+        if response.status not in (200, 207):
+            _raise_for_status(response, AppException)
+        return response.json()['apps']
+
+    async def start_all(self, apps):
+        """Start apps in parallel on the server with one request.
+
+        :param list apps: apps to start.
+        :return: per app result with ``id`` or ``error``.
+        :rtype: list
+        """
+        apps = list(apps)
+        if any(app.started for app in apps):
+            raise AccessDenied('App has already started.')
+        results = await self._batch('POST',
+                                    [app._start_entry() for app in apps])
+        for app, result in zip(apps, results):
+            if 'id' in result:
+                app._set_started(result['id'])
+        return results
+
+    async def stop_all(self, apps):
+        """Stop apps in parallel on the server with one request.
+
+        :param list apps: apps to stop.
+        :return: per app result with ``msg`` or ``error``.
+        :rtype: list
+        """
+        apps = list(apps)
+        if not all(app.started for app in apps):
+            raise AccessDenied('App has not started.')
+        results = await self._batch('DELETE', [app.id for app in apps])
+        for app, result in zip(apps, results):
+            if 'error' not in result:
+                app._set_stopped()
+        return results
+
+    def __repr__(self):
+        return f'<AsyncClient host={self.pool.host} port={self.pool.port}>'
+
+    __str__ = __repr__
@@ -4,16 +4,35 @@ from __future__ import absolute_import
 
 import logging
 import importlib
+import io
 import json
 import abc
-from http.client import HTTPConnection, HTTPSConnection, HTTPException
-from httpmocker.exceptions import (ClientException, ConnectError,
-                                   AppException, HandlerException)
+import threading
+import time
+from http.client import (HTTPConnection, HTTPSConnection, HTTPException,
+                         RemoteDisconnected)
+from urllib.parse import urlencode
+
+from httpmocker.exceptions import (AccessDenied, ClientException,
+                                   ConnectError, AppException,
+                                   HandlerException)
+from httpmocker.handler import JOURNAL_URL, METRICS_URL
 
 from httpmocker.utils import permit_access_if
 
 logger = logging.getLogger(__name__)
 
+# m-sequence-* headers reporting a handler data sequence position.
+SEQUENCE_STATE = ('position', 'length', 'served')
+# seconds a pooled connection is kept idle, below the keep-alive timeout
+# of the servers (5 seconds for sanic apps) so that a connection the server
+# is closing is not reused.
+IDLE_TIMEOUT = 4
+# methods sent again when a reused connection was closed after the request
+# was sent, the server may have processed a request of another method.
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS',
+                                'TRACE'))
+
 
 class AppType:
     SANIC = 'sanic'
@@ -70,12 +89,15 @@ class HTTPAdapter(BaseAdapter):
     def conn(self):
         return self._conn
 
+    def _new_connection(self):
+        return HTTPConnection(
+            self.host, self.port,
+            timeout=10
+        )
+
     def connect(self):
         try:
-            self._conn = HTTPConnection(
-                self.host, self.port,
-                timeout=10
-            )
+            self._conn = self._new_connection()
             self._connected = True
         except HTTPException:
             raise ConnectError(
@@ -97,15 +119,18 @@ class HTTPSAdapter(HTTPAdapter):
         self.cert_file = cert_file
         self.key_file = key_file
 
+    def _new_connection(self):
+        return HTTPSConnection(
+            self.host,
+            port=self.port,
+            cert_file=self.cert_file,
+            key_file=self.key_file,
+            timeout=10
+        )
+
     def connect(self):
         try:
-            self._conn = HTTPSConnection(
-                self.host,
-                port=self.port,
-                cert_file=self.cert_file,
-                key_file=self.key_file,
-                timeout=10
-            )
+            self._conn = self._new_connection()
             self._connected = True
         except HTTPException:
             raise ConnectError(
@@ -113,6 +138,201 @@ class HTTPSAdapter(HTTPAdapter):
         return self._conn
 
 
+class PooledResponse:
+    """Fully read response of a pooled connection."""
+
+    def __init__(self, response):
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self._body = response.read()
+
+    def read(self):
+        body, self._body = self._body, b''
+        return body
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+
+class PooledConnection:
+    """Keep-alive connections shared by every user of a pooled adapter.
+
+    Mirrors the ``request``/``getresponse`` calls of ``HTTPConnection``.
+    The connection used by a request is tracked per thread, the response
+    body is read right away and the connection goes back to the pool.
+    A reused connection closed by the server is transparently replaced
+    and the request is sent again: always when it failed while the request
+    was sent, only for an idempotent method once the request was sent.
+    """
+
+    # errors of a keep-alive connection the server has already closed.
+    STALE_ERRORS = (RemoteDisconnected, ConnectionResetError,
+                    ConnectionAbortedError, BrokenPipeError)
+
+    def __init__(self, factory, maxsize=4, idle_timeout=IDLE_TIMEOUT):
+        self._factory = factory
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxsize)
+        self._local = threading.local()
+        self.idle_timeout = idle_timeout
+
+    def _acquire(self):
+        self._slots.acquire()
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn, last_used = self._idle.pop()
+                if now - last_used < self.idle_timeout:
+                    return conn, True
+                conn.close()
+        try:
+            return self._factory(), False
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, conn, reusable=True):
+        if reusable:
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        else:
+            conn.close()
+        self._slots.release()
+
+    @staticmethod
+    def _resend(conn, method, url, body, headers, position):
+        conn.close()
+        if position is not None:
+            # a file body is sent again from where it started.
+            body.seek(position)
+        conn.request(method, url, body=body, headers=headers)
+
+    def request(self, method, url, body=None, headers=None):
+        headers = headers or {}
+        position = body.tell() if hasattr(body, 'seek') else None
+        args = (method, url, body, headers, position)
+        conn, reused = self._acquire()
+        try:
+            try:
+                conn.request(method, url, body=body, headers=headers)
+            except self.STALE_ERRORS:
+                if not reused:
+                    raise
+                # the new connection may fail as well, its slot is released
+                # below.
+                self._resend(conn, *args)
+                reused = False
+        except BaseException:
+            self._local.pending = None
+            self._release(conn, reusable=False)
+            raise
+        self._local.pending = (conn, reused, args)
+
+    def getresponse(self):
+        conn, reused, args = self._local.pending
+        self._local.pending = None
+        try:
+            try:
+                response = conn.getresponse()
+            except self.STALE_ERRORS:
+                if not reused or args[0] not in IDEMPOTENT_METHODS:
+                    raise
+                self._resend(conn, *args)
+                response = conn.getresponse()
+            pooled = PooledResponse(response)
+        except BaseException:
+            self._release(conn, reusable=False)
+            raise
+        self._release(conn, reusable=not response.will_close)
+        return pooled
+
+    def evict_idle(self):
+        """Close connections idle for longer than the idle timeout."""
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle
+            self._idle = [(conn, last_used) for conn, last_used in idle
+                          if now - last_used < self.idle_timeout]
+            expired = [conn for conn, last_used in idle
+                       if now - last_used >= self.idle_timeout]
+        for conn in expired:
+            conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """Adapter keeping a bounded pool of keep-alive connections."""
+
+    def __init__(self, host, port, maxsize=4, idle_timeout=IDLE_TIMEOUT):
+        super().__init__(host, port)
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+
+    def connect(self):
+        if self._conn is None:
+            self._conn = PooledConnection(self._new_connection,
+                                          maxsize=self.maxsize,
+                                          idle_timeout=self.idle_timeout)
+        self._connected = True
+        return self._conn
+
+    def disconnect(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._connected = False
+
+
+def _stream_length(stream):
+    """Length of the rest of a seekable binary stream."""
+    position = stream.tell()
+    end = stream.seek(0, io.SEEK_END)
+    stream.seek(position)
+    return end - position
+
+
+def _body(data, headers, encode=json.dumps):
+    """Prepare a request body, a binary file is streamed as is.
+
+    :param Any data: data to encode or binary file.
+    :param dict headers: request headers, updated with the file length.
+    :param callable encode: encoder of non file data.
+    """
+    if hasattr(data, 'read'):
+        headers['Content-Length'] = str(_stream_length(data))
+        return data
+    return encode(data)
+
+
+def _bulk_data_body(entries):
+    """Encode handler data entries for the bulk endpoint.
+
+    :param entries: mapping of data by url or iterable of ``(url, data)``
+        pairs, sent as NDJSON.
+    :return: body and headers.
+    :rtype: tuple
+    """
+    if isinstance(entries, dict):
+        return json.dumps(entries), {'Content-Type': 'application/json'}
+    body = ''.join(json.dumps({'url': url, 'data': data}) + '\n'
+                   for url, data in entries)
+    return body, {'Content-Type': 'application/x-ndjson'}
+
+
+def _bulk_error(body):
+    details = '; '.join(
+        f'{error["url"]}: {error["error"]}' if 'url' in error
+        else error['error'] for error in body.get('errors', []))
+    message = body.get('error') or body.get('msg')
+    return f'{message} {details}' if details else message
+
+
 class Handler:
 
     def __init__(self, name, **kwargs):
@@ -128,9 +348,11 @@ class Handler:
     @permit_access_if('handler_set', True, msg='Handler is not set.')
     def set_data(self, url, data):
         headers = {'m-handler-url': url}
+        # a binary file holding the data as JSON is streamed.
+        body = _body(data, headers)
         self.conn.request('POST',
                           self.base_url + 'data/',
-                          body=json.dumps(data),
+                          body=body,
                           headers=headers)
         response = self.conn.getresponse()
         body = json.loads(response.read().decode())
@@ -150,11 +372,104 @@ class Handler:
             raise HandlerException(f'{body["error"]}')
         return body
 
+    def _bulk_request(self, method, body=None, headers=None):
+        self.conn.request(method,
+                          self.base_url + 'data/bulk/',
+                          body=body,
+                          headers=headers or {})
+        response = self.conn.getresponse()
+        body = json.loads(response.read().decode())
+        if response.status != 200:
+            raise HandlerException(_bulk_error(body))
+        return body
+
+    @permit_access_if('handler_set', True, msg='Handler is not set.')
+    def set_data_many(self, entries):
+        """Register handler data of many urls with one request.
+
+        Either every entry is registered or, when any is invalid, none.
+
+        :param entries: mapping of data by url or iterable of
+            ``(url, data)`` pairs.
+        :raises HandlerException: listing the invalid entries.
+        """
+        body, headers = _bulk_data_body(entries)
+        return self._bulk_request('POST', body, headers)
+
+    @permit_access_if('handler_set', True, msg='Handler is not set.')
+    def remove_data_many(self, urls):
+        """Remove handler data of many urls with one request.
+
+        Either every url is removed or, when any has no data, none.
+
+        :param iterable urls: handler data urls.
+        :raises HandlerException: listing the urls without data.
+        """
+        return self._bulk_request('DELETE', json.dumps(list(urls)))
+
+    @permit_access_if('handler_set', True, msg='Handler is not set.')
+    def clear_data(self):
+        return self._bulk_request('DELETE',
+                                  headers={'m-handler-clear': 'true'})
+
+    def upload_file(self, name, file):
+        """Stream a fixture file to the app.
+
+        Handler data responses reference it with
+        ``{"m-response": {"file": name}}``.
+
+        :param str name: fixture file name.
+        :param file: binary file.
+        """
+        headers = {'m-handler-file': name}
+        self.conn.request('POST',
+                          self.base_url + 'file/',
+                          body=_body(file, headers),
+                          headers=headers)
+        response = self.conn.getresponse()
+        body = json.loads(response.read().decode())
+        if response.status != 200:
+            raise HandlerException(f'{body["error"]}')
+        return body
+
+    def remove_file(self, name):
+        headers = {'m-handler-file': name}
+        self.conn.request('DELETE',
+                          self.base_url + 'file/',
+                          headers=headers)
+        response = self.conn.getresponse()
+        body = json.loads(response.read().decode())
+        if response.status != 200:
+            raise HandlerException(f'{body["error"]}')
+        return body
+
+    @permit_access_if('handler_set', True, msg='Handler is not set.')
+    def sequence(self, url):
+        """Retrieve the position of the handler data sequence of the url.
+
+        :return: next step ``position``, ``length`` and ``served`` requests,
+            None when the data is not a sequence.
+        :rtype: dict
+        """
+        headers = {'m-handler-url': url}
+        self.conn.request('GET',
+                          self.base_url + 'data/',
+                          headers=headers)
+        response = self.conn.getresponse()
+        body = json.loads(response.read().decode())
+        if response.status != 200:
+            raise HandlerException(f'{body.get("error") or body.get("msg")}')
+        if response.getheader('m-sequence-position') is None:
+            return None
+        return {key: int(response.getheader(f'm-sequence-{key}'))
+                for key in SEQUENCE_STATE}
+
     def attach(self, data):
         headers = {'m-handler-name': self._name}
+        body = _body(data, headers, encode=str)
         self.conn.request('POST',
                           self.base_url,
-                          body=data,
+                          body=body,
                           headers=headers)
         response = self.conn.getresponse()
         body = json.loads(response.read().decode())
@@ -189,10 +504,14 @@ class App:
         self._enable_ssl = kwargs.get('enable_ssl', False)
         self._ssl_cert = kwargs.get('ssl_cert', None)
         self._ssl_key = kwargs.get('ssl_key', None)
+        self._config = kwargs.get('config', None)
+        # worker processes of a sanic app.
+        self._workers = kwargs.get('workers', None)
         self.port = kwargs['port']
         self.conn = kwargs['conn']
         self.base_url = "/mock/app/"
         self.started = False
+        self._handler_adapter = None
 
     @property
     def name(self):
@@ -214,7 +533,7 @@ class App:
             raise AppException(f'{body["error"]}')
         return body
 
-    @permit_access_if('started', False, msg='App has not started.')
+    @permit_access_if('started', True, msg='App has not started.')
     def stop(self):
         headers = {'m-app-id': self._id}
         self.conn.request('DELETE',
@@ -224,29 +543,46 @@ class App:
         body = json.loads(response.read().decode())
         if response.status != 200:
             raise AppException(f'{body["error"]}')
-        self.started = False
+        self._set_stopped()
         return body
 
+    def _start_config(self, config=None):
+        config = dict(config or self._config or {})
+        config.update({
+            'ssl_cert': self._ssl_cert,
+            'ssl_key': self._ssl_key
+        })
+        if self._workers:
+            config['WORKERS'] = self._workers
+        return config
+
+    def _start_entry(self):
+        return {'name': self._name,
+                'port': self.port,
+                'enable_ssl': self._enable_ssl,
+                'config': self._start_config()}
+
+    def _set_started(self, app_id):
+        self._id = app_id
+        self.started = True
+
+    def _set_stopped(self):
+        self.started = False
+
     @permit_access_if('started', False, msg='App has already started.')
     def start(self, config=None):
-        config = config or {}
         headers = {'m-app-name': self._name,
                    'm-app-port': self.port,
                    'm-app-enable-ssl': self._enable_ssl}
-        config.update({
-            'ssl_cert': self._ssl_cert,
-            'ssl_key': self._ssl_key
-        })
         self.conn.request('POST',
                           self.base_url,
-                          body=json.dumps(config),
+                          body=json.dumps(self._start_config(config)),
                           headers=headers)
         response = self.conn.getresponse()
         body = json.loads(response.read().decode())
         if response.status != 200:
             raise AppException(f'{body["error"]}')
-        self._id = response.headers['m-app-id']
-        self.started = True
+        self._set_started(response.headers['m-app-id'])
         return body
 
     @property
@@ -257,12 +593,61 @@ class App:
         else:
             return False
 
+    def _app_conn(self):
+        # handlers of the app share one pool of keep-alive connections.
+        if self._handler_adapter is None:
+            self._handler_adapter = PooledHTTPAdapter('0.0.0.0', self.port)
+        return self._handler_adapter.connect()
+
     @permit_access_if('started', True, msg='App has not started.')
     def handler(self, name, **kwargs):
-        kwargs['conn'] = kwargs.get(
-            'adapter', HTTPAdapter('0.0.0.0', self.port)).connect()
+        if 'adapter' in kwargs:
+            kwargs['conn'] = kwargs['adapter'].connect()
+        else:
+            kwargs['conn'] = self._app_conn()
         return Handler(name, **kwargs)
 
+    @permit_access_if('started', True, msg='App has not started.')
+    def requests(self, filter=None):
+        """Retrieve the requests received by the app, oldest first.
+
+        :param dict filter: ``method``, ``path`` (concrete path or route
+            template), ``status`` (code or class such as ``4xx``),
+            ``since`` (epoch seconds) and ``limit`` (most recent records),
+            applied by the app.
+        :return: records with ``time``, ``method``, ``path``, ``query``,
+            ``status``, ``duration`` and truncated ``body``.
+        :rtype: list
+        """
+        conn = self._app_conn()
+        query = urlencode({name: value for name, value
+                           in (filter or {}).items() if value is not None})
+        conn.request('GET', JOURNAL_URL + (f'?{query}' if query else ''))
+        response = conn.getresponse()
+        body = json.loads(response.read().decode())
+        if response.status != 200:
+            raise AppException(f'{body["error"]}')
+        return body['requests']
+
+    @permit_access_if('started', True, msg='App has not started.')
+    def metrics(self):
+        """Retrieve request counts, error counts and latency percentiles
+        of the app by route.
+
+        :rtype: list
+        """
+        conn = self._app_conn()
+        conn.request('GET', METRICS_URL)
+        response = conn.getresponse()
+        return json.loads(response.read().decode())['routes']
+
+    @permit_access_if('started', True, msg='App has not started.')
+    def clear_requests(self):
+        conn = self._app_conn()
+        conn.request('DELETE', JOURNAL_URL)
+        response = conn.getresponse()
+        return json.loads(response.read().decode())
+
     def __repr__(self):
         status = 'running' if self.started else 'stopped'
         return f'<App name={self._name} id={self._id} status={status}>'
@@ -271,8 +656,8 @@ class App:
 
 
 class Client:
-    def __init__(self, adapter=HTTPAdapter('0.0.0.0', 8080)):
-        self.adapter = adapter
+    def __init__(self, adapter=None):
+        self.adapter = adapter or PooledHTTPAdapter('0.0.0.0', 8080)
         self.base_url = '/mock/'
 
     def __enter__(self):
@@ -292,6 +677,113 @@ class Client:
         kwargs['conn'] = self.adapter.conn
         return App(name, port=port, **kwargs)
 
+    def apps(self, entries, **kwargs):
+        """Create apps from ``(app_type, port[, config])`` entries.
+
+        :param list entries: app entries.
+        :return: apps, not started yet.
+        :rtype: list
+        """
+        apps = []
+        for name, port, *config in entries:
+            apps.append(self.app(name, port,
+                                 config=config[0] if config else None,
+                                 **kwargs))
+        return apps
+
+    def upload_fixture(self, data):
+        """Store a fixture blob in memory shared by every app.
+
+        Handler data responses reference it with
+        ``{"m-response": {"fixture": digest}}``, the apps do not hold a copy
+        of their own.
+
+        :param data: bytes or binary file.
+        :return: ``digest`` and ``size`` of the blob.
+        :rtype: dict
+        """
+        headers = {}
+        self.adapter.conn.request('POST',
+                                  self.base_url + 'fixtures/',
+                                  body=_body(data, headers,
+                                             encode=lambda data: data),
+                                  headers=headers)
+        response = self.adapter.conn.getresponse()
+        body = json.loads(response.read().decode())
+        if response.status != 200:
+            raise ClientException(f'{body["error"]}')
+        return body
+
+    def fixtures(self):
+        self.adapter.conn.request('GET', self.base_url + 'fixtures/')
+        response = self.adapter.conn.getresponse()
+        return json.loads(response.read().decode())['fixtures']
+
+    def remove_fixture(self, digest):
+        self.adapter.conn.request('DELETE',
+                                  self.base_url + 'fixtures/',
+                                  headers={'m-fixture-digest': digest})
+        response = self.adapter.conn.getresponse()
+        body = json.loads(response.read().decode())
+        if response.status != 200:
+            raise ClientException(f'{body["error"]}')
+        return body
+
+    def metrics(self):
+        """Retrieve the request metrics of every running app.
+
+        :return: per app ``routes`` metrics and their ``total``.
+        :rtype: dict
+        """
+        self.adapter.conn.request('GET', self.base_url + 'metrics/')
+        response = self.adapter.conn.getresponse()
+        return json.loads(response.read().decode())
+
+    def _batch(self, method, body):
+        self.adapter.conn.request(method,
+                                  self.base_url + 'apps/',
+                                  body=json.dumps(body))
+        response = self.adapter.conn.getresponse()
+        body = json.loads(response.read().decode())
+        if response.status not in (200, 207):
+            raise AppException(f'{body["error"]}')
+        return body['apps']
+
+    def start_all(self, apps):
+        """Start apps in parallel on the server with one request.
+
+        Apps that failed to start stay stopped, their error is reported in
+        the result.
+
+        :param list apps: apps to start.
+        :return: per app result with ``id`` or ``error``.
+        :rtype: list
+        """
+        apps = list(apps)
+        if any(app.started for app in apps):
+            raise AccessDenied('App has already started.')
+        results = self._batch('POST', [app._start_entry() for app in apps])
+        for app, result in zip(apps, results):
+            if 'id' in result:
+                app._set_started(result['id'])
+        return results
+
+    def stop_all(self, apps):
+        """Stop apps in parallel on the server with one request.
+
+        :param list apps: apps to stop.
+        :return: per app result with ``msg`` or ``error``.
+        :rtype: list
+        """
+        apps = list(apps)
+        if not all(app.started for app in apps):
+            raise AccessDenied('App has not started.')
+        results = self._batch('DELETE', [app.id for app in apps])
+        for app, result in zip(apps, results):
+            if 'error' not in result:
+                app._set_stopped()
+        return results
+
     def __repr__(self):
         return f'<Client adapter={self.adapter}>'
 
@@ -12,11 +12,20 @@ PREFIX = "HTTP_MOCKER_"
 DEFAULT_CONFIG = {
     'HOST': '0.0.0.0',
     'PORT': '8080',
+    'THREADED': True,
     'SSL_PORT': '443',
     'SSL_CERT': None,
     'SSL_KEY': None,
     'REQUEST_TIMEOUT': 10,
+    'BODY_SPOOL_SIZE': 1048576,
+    'APP_START_TIMEOUT': 10,
+    'BATCH_WORKERS': 16,
+    'WSGI_SERVER': 'dev',
     'HANDLER_STORAGE_ROOT': './httpmocker/handlers/',
+    'HANDLER_PERSIST': False,
+    'HANDLER_CACHE_SIZE': 128,
+    'JOURNAL_SIZE': 1000,
+    'JOURNAL_BODY_SIZE': 256,
     'CERT_STORAGE_ROOT': './httpmocker/certs/',
     'SERVER_LOG_FILE': './httpmocker/server.log',
     'SERVER_LOG_LEVEL': 'DEBUG'
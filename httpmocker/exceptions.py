@@ -42,6 +42,11 @@ class AppNotSupported(ServerException):
     """Raised when application requested by client is not supported"""
 
 
+class BadRequestBody(ServerException):
+    """Raised when a request body can not be read, its framing is
+    invalid"""
+
+
 class AppStartFailed(ServerException):
     """Raised when application could not start"""
 
@@ -52,3 +57,8 @@ class AppStopFailed(ServerException):
 
 class InvalidAppError(ServerException):
     """Raised when server finds the application invalid"""
+
+
+class TemplateError(PyMockHttpException):
+    """Raised when handler data declares an invalid response template,
+    sequence or fault policy"""
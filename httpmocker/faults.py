@@ -0,0 +1,225 @@
+"""Latency and fault injection policies of handler data.
+
+Handler data holding an ``m-fault`` entry delays, fails, resets or slows
+down the responses of its route, templated or served by a handler::
+
+    {"m-fault": {"latency": {"distribution": "normal",
+                             "mean": 0.2, "stddev": 0.05, "max": 1},
+                 "error_rate": 0.1, "error_status": 503,
+                 "reset_rate": 0.01,
+                 "trickle": {"chunk_size": 64, "interval": 0.05}}}
+
+``latency`` is a number of seconds or a distribution: ``fixed``
+(``value``), ``uniform`` (``min``, ``max``), ``normal`` (``mean``,
+``stddev``), ``lognormal`` (``median``, ``sigma``) or ``exponential``
+(``mean``), optionally capped by ``max``. After the latency, a request is
+answered with ``error_status`` at ``error_rate`` or has its connection reset
+at ``reset_rate``. ``trickle`` sends the response body ``chunk_size`` bytes
+at a time, waiting ``interval`` seconds before each piece.
+
+Each step of an ``m-sequence`` may declare its own policy, the policy of the
+sequence applies to the steps without one. Sanic waits with
+``asyncio.sleep``, Flask and Django block the thread serving the request.
+"""
+import asyncio
+import functools
+import math
+import random
+import socket
+import struct
+import time
+
+from httpmocker.exceptions import TemplateError
+
+FAULT_KEY = 'm-fault'
+# header marking the responses of injected faults.
+FAULT_HEADER = 'm-fault'
+ERROR = 'error'
+RESET = 'reset'
+
+
+def _number(spec, name, default=None, low=0.0, high=math.inf):
+    value = spec.get(name, default)
+    if value is None:
+        raise TemplateError(f'{FAULT_KEY} {name} is mandatory.')
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or \
+            not low <= value <= high:
+        raise TemplateError(
+            f'{FAULT_KEY} {name} must be a number between {low} and '
+            f'{high}.')
+    return float(value)
+
+
+def _latency(spec):
+    """Compile the latency spec into a sampling function."""
+    if spec is None:
+        return None
+    if not isinstance(spec, dict):
+        spec = {'distribution': 'fixed', 'value': spec}
+    distribution = spec.get('distribution', 'fixed')
+    if distribution == 'fixed':
+        value = _number(spec, 'value')
+
+        def sample():
+            return value
+    elif distribution == 'uniform':
+        sample = functools.partial(random.uniform, _number(spec, 'min'),
+                                   _number(spec, 'max'))
+    elif distribution == 'normal':
+        sample = functools.partial(random.gauss, _number(spec, 'mean'),
+                                   _number(spec, 'stddev'))
+    elif distribution == 'lognormal':
+        sample = functools.partial(
+            random.lognormvariate,
+            math.log(_number(spec, 'median', low=1e-9)),
+            _number(spec, 'sigma'))
+    elif distribution == 'exponential':
+        sample = functools.partial(
+            random.expovariate, 1 / _number(spec, 'mean', low=1e-9))
+    else:
+        raise TemplateError(
+            f'Unknown latency distribution {distribution!r}.')
+    cap = _number(spec, 'max', math.inf)
+    return lambda: min(max(sample(), 0.0), cap)
+
+
+def reset(sock):
+    """Make the connection end with a TCP reset instead of a response.
+
+    :param socket.socket sock: client connection.
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                    struct.pack('ii', 1, 0))
+    sock.shutdown(socket.SHUT_RDWR)
+
+
+class FaultPolicy:
+    """Precompiled fault policy of handler data."""
+
+    def __init__(self, spec):
+        """Compile the policy spec.
+
+        :param dict spec: ``latency``, ``error_rate``, ``error_status``,
+            ``reset_rate`` and ``trickle`` of the policy.
+        :raises TemplateError: when the spec is invalid.
+        """
+        if not isinstance(spec, dict):
+            raise TemplateError(f'{FAULT_KEY} must be an object.')
+        unknown = set(spec) - {'latency', 'error_rate', 'error_status',
+                               'reset_rate', 'trickle'}
+        if unknown:
+            raise TemplateError(
+                f'Unknown fault fields: {", ".join(sorted(unknown))}.')
+        self._latency = _latency(spec.get('latency'))
+        self.error_rate = _number(spec, 'error_rate', 0, high=1)
+        self.reset_rate = _number(spec, 'reset_rate', 0, high=1)
+        if self.error_rate + self.reset_rate > 1:
+            raise TemplateError(
+                'error_rate and reset_rate must not add up over 1.')
+        self.error_status = int(_number(spec, 'error_status', 503,
+                                        low=100, high=599))
+        trickle = spec.get('trickle')
+        if trickle is not None and not isinstance(trickle, dict):
+            raise TemplateError('trickle must be an object.')
+        trickle = trickle or {}
+        self.chunk_size = int(_number(trickle, 'chunk_size', 0))
+        self.interval = _number(trickle, 'interval', 0)
+
+    @property
+    def trickles(self):
+        return self.chunk_size > 0
+
+    def delay(self):
+        """Draw the latency of a request.
+
+        :return: seconds.
+        :rtype: float
+        """
+        return self._latency() if self._latency is not None else 0.0
+
+    def action(self):
+        """Draw the fault of a request.
+
+        :return: ``ERROR``, ``RESET`` or None.
+        :rtype: str
+        """
+        if not (self.error_rate or self.reset_rate):
+            return None
+        draw = random.random()
+        if draw < self.reset_rate:
+            return RESET
+        if draw < self.reset_rate + self.error_rate:
+            return ERROR
+        return None
+
+    def inject(self, connection=None):
+        """Apply the latency and draw the fault of a request, blocking.
+
+        :param socket.socket connection: client connection, reset by a
+            ``RESET`` fault.
+        :return: injected fault, None to serve the request.
+        :rtype: str
+        """
+        delay = self.delay()
+        if delay:
+            time.sleep(delay)
+        action = self.action()
+        if action == RESET and connection is not None:
+            reset(connection)
+        return action
+
+    async def inject_async(self, transport):
+        """Apply the latency and draw the fault of a request.
+
+        :param asyncio.Transport transport: client connection, aborted by a
+            ``RESET`` fault.
+        :return: injected fault, None to serve the request.
+        :rtype: str
+        """
+        delay = self.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        action = self.action()
+        if action == RESET:
+            sock = transport.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                struct.pack('ii', 1, 0))
+            transport.abort()
+        return action
+
+    def _pieces(self, chunks):
+        for chunk in chunks:
+            for offset in range(0, len(chunk), self.chunk_size):
+                yield chunk[offset:offset + self.chunk_size]
+
+    def trickle(self, chunks):
+        """Slow down a response body, blocking before each piece.
+
+        :param iterable chunks: body chunks.
+        """
+        for piece in self._pieces(chunks):
+            time.sleep(self.interval)
+            yield piece
+
+    async def trickle_async(self, write, data):
+        """Write a response body chunk slowly.
+
+        :param callable write: coroutine function writing a piece.
+        :param bytes data: body chunk.
+        """
+        for piece in self._pieces([data]):
+            await asyncio.sleep(self.interval)
+            await write(piece)
+
+
+def compile_fault(data):
+    """Compile the fault policy of the handler data.
+
+    :param Any data: handler data.
+    :return: compiled policy, None when the data has no policy.
+    :rtype: FaultPolicy
+    """
+    if not isinstance(data, dict) or FAULT_KEY not in data:
+        return None
+    return FaultPolicy(data[FAULT_KEY])
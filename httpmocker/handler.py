@@ -1,13 +1,29 @@
 import abc
+import contextlib
+import hashlib
 import importlib
+import linecache
 import os
-from contextlib import contextmanager
+import threading
+import types
+from collections import OrderedDict
 from functools import wraps
 
 from httpmocker.config import get_config
 
+# prefix of the routes every application serves to be managed.
+MOCK_APP_URL = '/mock/app/'
 HANDLER_URL = '/mock/app/handler/'
 HANDLER_DATA_URL = '/mock/app/handler/data/'
+HANDLER_DATA_BULK_URL = '/mock/app/handler/data/bulk/'
+HANDLER_CACHE_URL = '/mock/app/handler/cache/'
+HANDLER_FILE_URL = '/mock/app/handler/file/'
+JOURNAL_URL = '/mock/app/journal/'
+METRICS_URL = '/mock/app/metrics/'
+# content type of a bulk handler data body with one entry per line.
+NDJSON = 'application/x-ndjson'
+# size of the blocks a streamed request body is read in.
+STREAM_CHUNK_SIZE = 65536
 
 
 def register_handler_routes(*args, **kwargs):
@@ -17,6 +33,8 @@ def register_handler_routes(*args, **kwargs):
             obj = func(cls, *args, **kwargs)
             obj.reg_handler_route()
             obj.reg_handler_data_route()
+            obj.reg_journal_route()
+            obj.reg_metrics_route()
             obj.reg_request_middleware()
             return obj
         return wrapper
@@ -37,35 +55,175 @@ class AbstractHandler:
     def reg_handler_route(self):
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def reg_journal_route(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def reg_metrics_route(self):
+        raise NotImplementedError
+
+
+class CodeCache:
+    """Bounded LRU cache of compiled handler code objects."""
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._codes = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(name, data):
+        return hashlib.sha256(
+            name.encode() + b'\0' + data.encode()).hexdigest()
+
+    def compile(self, name, data, filename):
+        """Compile the handler source unless it was compiled before.
+
+        :param str name: handler name.
+        :param str data: handler source.
+        :param str filename: file name the code is compiled with.
+        :return: code object.
+        :rtype: code
+        """
+        key = self.key(name, data)
+        with self._lock:
+            code = self._codes.get(key)
+            if code is not None:
+                self._codes.move_to_end(key)
+                self.hits += 1
+                return code
+            self.misses += 1
+
+        code = compile(data, filename, 'exec')
+        if self.maxsize > 0:
+            with self._lock:
+                self._codes[key] = code
+                while len(self._codes) > self.maxsize:
+                    self._codes.popitem(last=False)
+        return code
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._codes), 'maxsize': self.maxsize}
+
 
 class HandlerMixin:
 
-    @contextmanager
-    def save_handler(self, name, data, temp=False):
-        storage_root = self.get_handler_storage_root()
-        if temp:
-            location = storage_root + '/tmp/'
-        else:
-            location = storage_root
+    @property
+    def code_cache(self):
+        if '_code_cache' not in self.__dict__:
+            self._code_cache = CodeCache(
+                int(get_config().get('HANDLER_CACHE_SIZE', 128)))
+        return self._code_cache
+
+    def save_handler(self, name, data):
+        """Write the handler source under the handler storage root.
+
+        :param str name: handler name.
+        :param str data: handler source.
+        :return: file location.
+        :rtype: str
+        """
+        location = self.get_handler_storage_root()
         file_location = location + '/' + name + '.py'
-        if not os.path.exists(location):
-            os.makedirs(location, exist_ok=True)
+        os.makedirs(location, exist_ok=True)
 
         with open(file_location, 'w+') as wh:
             wh.write(data)
-
-        yield file_location
-
-        if temp:
-            os.system('rm ' + file_location + '*')
-
-    def import_handler(self, name, data, save_temp=False):
-        with self.save_handler(name, data, temp=save_temp) as file_location:
-            spec = importlib.util.spec_from_file_location(
-                name, file_location)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            return module
+        return file_location
+
+    def fixture_path(self, name):
+        """Locate the fixture file under the handler storage root.
+
+        :param str name: fixture file name.
+        :return: file location.
+        :rtype: str
+        :raises ValueError: when the name is not a plain file name.
+        """
+        if not name or name in ('.', '..') or \
+                os.path.basename(name) != name:
+            raise ValueError(f'Invalid fixture file name {name!r}.')
+        return os.path.abspath(
+            os.path.join(self.get_handler_storage_root(), 'files', name))
+
+    @contextlib.contextmanager
+    def open_fixture(self, name):
+        """Open the fixture file for writing.
+
+        The file is written aside and moved in place once complete, so
+        responses never serve a partial upload.
+
+        :param str name: fixture file name.
+        :return: binary file.
+        """
+        location = self.fixture_path(name)
+        os.makedirs(os.path.dirname(location), exist_ok=True)
+        partial = f'{location}.{os.getpid()}.part'
+        try:
+            with open(partial, 'wb') as wh:
+                yield wh
+            os.replace(partial, location)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+
+    def save_fixture(self, name, chunks):
+        """Write the fixture file from body chunks without buffering it.
+
+        :param str name: fixture file name.
+        :param iterable chunks: body chunks.
+        :return: file location and size.
+        :rtype: tuple
+        """
+        size = 0
+        with self.open_fixture(name) as wh:
+            for chunk in chunks:
+                wh.write(chunk)
+                size += len(chunk)
+        return self.fixture_path(name), size
+
+    def import_handler(self, name, data, persist=True):
+        """Compile the handler source straight into a module object.
+
+        Code objects are cached by source hash, so attaching the same
+        handler again only executes it. The source is written through to
+        the handler storage root only when ``HANDLER_PERSIST`` is enabled.
+
+        :param str name: handler name.
+        :param str data: handler source.
+        :param bool persist: allow write-through, Defaults -> True
+        :return: handler module.
+        :rtype: module
+        """
+        filename = f'<handler {name}>'
+        code = self.code_cache.compile(name, data, filename)
+        # keep the source around so tracebacks can show handler lines.
+        linecache.cache[filename] = (
+            len(data), None, data.splitlines(True), filename)
+
+        module = types.ModuleType(name)
+        module.__file__ = filename
+        exec(code, module.__dict__)
+
+        if persist and get_config().get('HANDLER_PERSIST'):
+            self.save_handler(name, data)
+        return module
+
+    def load_handler(self, name, data, attr):
+        """Import the handler source and retrieve the object to attach.
+
+        :param str name: handler name.
+        :param str data: handler source.
+        :param str attr: module attribute holding the blueprint or
+            urlpatterns.
+        :return: blueprint or urlpatterns.
+        :rtype: Any
+        """
+        return getattr(self.import_handler(name, data), attr)
 
     def reload_module(self, module):
         importlib.reload(module)
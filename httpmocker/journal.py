@@ -0,0 +1,208 @@
+"""Journal of the requests received by a mock application.
+
+Every request outside of the ``/mock/app/`` management routes is recorded
+by the request middleware into a bounded ring buffer, the oldest record is
+dropped once it is full. A record is a tuple of the request method, path,
+query string, response status, timing and the first bytes of the body.
+
+Records are queried from ``/mock/app/journal/`` with ``method``, ``path``
+(a concrete path or a route template such as ``/users/<int:id>``),
+``status`` (``404`` or a class such as ``4xx``), ``since`` (epoch seconds)
+and ``limit`` (most recent records) query parameters.
+
+The workers of an app record into the same :class:`SharedJournal`.
+"""
+import ctypes
+import itertools
+import multiprocessing
+import struct
+import time
+from collections import deque, namedtuple
+
+from httpmocker.routing import RouteTrie, is_template
+
+# time, duration, status then the sizes of the method, path, query and
+# body of a shared record, -1 for no body.
+_HEADER = struct.Struct('<ddHBHHi')
+# bytes of the method, path and query of a shared record, longer ones are
+# truncated, the query first.
+TEXT_SIZE = 2048
+
+Record = namedtuple('Record', ('time', 'method', 'path', 'query', 'status',
+                               'duration', 'body'))
+
+
+def _status_filter(status):
+    status = str(status).lower()
+    if len(status) == 3 and status.endswith('xx') and status[0].isdigit():
+        low = int(status[0]) * 100
+        return lambda code: low <= code < low + 100
+    code = int(status)
+    return lambda value: value == code
+
+
+def _path_filter(path):
+    if not is_template(path):
+        return lambda value: value == path
+    trie = RouteTrie()
+    trie.insert(path, None)
+    return lambda value: trie.match(value) is not None
+
+
+class Journal:
+    """Ring buffer of request records."""
+
+    def __init__(self, size=1000, body_size=256):
+        """
+        :param int size: records kept, 0 disables the journal.
+        :param int body_size: request body bytes kept per record.
+        """
+        self.size = size
+        self.body_size = body_size
+        self._records = deque(maxlen=size)
+        # next() on a count is atomic, the recorded total needs no lock.
+        self._counter = itertools.count()
+        self._recorded = 0
+
+    @property
+    def recorded(self):
+        """Number of records since the last clear, dropped ones included."""
+        return self._recorded
+
+    @property
+    def keeps_body(self):
+        return self.size > 0 and self.body_size > 0
+
+    def record(self, method, path, query, status, duration, body=None):
+        """Record a served request.
+
+        :param str method: request method.
+        :param str path: request path.
+        :param str query: raw query string.
+        :param int status: response status.
+        :param float duration: seconds spent serving the request.
+        :param bytes body: request body, truncated to ``body_size``.
+        """
+        if not self.size:
+            return
+        if body and self.body_size:
+            body = bytes(body[:self.body_size])
+        else:
+            body = None
+        # deque appends are atomic, recording takes no lock.
+        self._records.append(Record(time.time(), method, path, query or '',
+                                    status, duration, body))
+        self._recorded = next(self._counter) + 1
+
+    def clear(self):
+        self._records.clear()
+        self._counter = itertools.count()
+        self._recorded = 0
+
+    def query(self, method=None, path=None, status=None, since=None,
+              limit=None):
+        """Retrieve records, oldest first.
+
+        :param str method: request method.
+        :param str path: concrete path or route template.
+        :param str status: status code or class such as ``4xx``.
+        :param float since: epoch seconds of the oldest record.
+        :param int limit: keep only the most recent matching records.
+        :return: matching records as dicts.
+        :rtype: list
+        :raises ValueError: when a filter is invalid.
+        """
+        checks = []
+        if method:
+            method = method.upper()
+            checks.append(lambda record: record.method == method)
+        if path:
+            match_path = _path_filter(path)
+            checks.append(lambda record: match_path(record.path))
+        if status:
+            match_status = _status_filter(status)
+            checks.append(lambda record: match_status(record.status))
+        if since:
+            since = float(since)
+            checks.append(lambda record: record.time >= since)
+        limit = int(limit) if limit else None
+        if limit is not None and limit < 0:
+            raise ValueError('limit must not be negative.')
+
+        records = [record for record in self._snapshot()
+                   if all(check(record) for check in checks)]
+        if limit is not None:
+            records = records[-limit:] if limit else []
+        return [self._to_dict(record) for record in records]
+
+    def _snapshot(self):
+        return list(self._records)
+
+    @staticmethod
+    def _to_dict(record):
+        record = record._asdict()
+        if record['body'] is not None:
+            record['body'] = record['body'].decode('utf-8', 'replace')
+        return record
+
+
+class SharedJournal(Journal):
+    """Journal of the worker processes of an application, a ring buffer of
+    fixed size records in shared memory allocated before they are forked.
+    """
+
+    def __init__(self, size=1000, body_size=256):
+        super().__init__(size, body_size)
+        self._record_size = _HEADER.size + TEXT_SIZE + body_size
+        self._buffer = multiprocessing.RawArray(
+            ctypes.c_char, size * self._record_size)
+        self._view = memoryview(self._buffer).cast('B')
+        self._total = multiprocessing.RawValue('Q', 0)
+        self._lock = multiprocessing.Lock()
+
+    @property
+    def recorded(self):
+        return self._total.value
+
+    def record(self, method, path, query, status, duration, body=None):
+        if not self.size:
+            return
+        method = method.encode()[:255]
+        path = path.encode()[:TEXT_SIZE - len(method)]
+        query = (query or '').encode()[:TEXT_SIZE - len(method) - len(path)]
+        body = bytes(body[:self.body_size]) \
+            if body and self.body_size else None
+        entry = _HEADER.pack(
+            time.time(), duration, status, len(method), len(path),
+            len(query), -1 if body is None else len(body)) + \
+            method + path + query + (body or b'')
+        with self._lock:
+            offset = self._total.value % self.size * self._record_size
+            self._view[offset:offset + len(entry)] = entry
+            self._total.value += 1
+
+    def clear(self):
+        with self._lock:
+            self._total.value = 0
+
+    def _snapshot(self):
+        with self._lock:
+            total = self._total.value
+            data = self._buffer.raw
+        records = []
+        for number in range(max(total - self.size, 0), total):
+            offset = number % self.size * self._record_size
+            (recorded_at, duration, status, method_size, path_size,
+             query_size, body_size) = _HEADER.unpack_from(data, offset)
+            offset += _HEADER.size
+            fields = []
+            for field_size in (method_size, path_size, query_size):
+                fields.append(data[offset:offset + field_size].decode(
+                    'utf-8', 'replace'))
+                offset += field_size
+            body = data[offset:offset + body_size] \
+                if body_size >= 0 else None
+            method, path, query = fields
+            records.append(Record(recorded_at, method, path, query, status,
+                                  duration, body))
+        return records
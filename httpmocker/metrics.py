@@ -0,0 +1,255 @@
+"""Request metrics of the mock applications.
+
+Requests outside of the ``/mock/app/`` management routes are counted per
+method and route. The route is the framework route serving the request,
+else the handler data key of a templated response, else ``<unmatched>``,
+so that concrete paths do not blow up the number of series. Latencies are
+counted into fixed buckets: the memory of a route does not grow with the
+requests it serves and the histograms of several apps add up.
+
+Apps serve their metrics on ``/mock/app/metrics/`` and the control plane
+aggregates every running app on ``/mock/metrics/``, both as JSON or, with
+``?format=prometheus``, in the Prometheus text format. The workers of an
+app count into the same :class:`SharedMetrics`.
+"""
+import bisect
+import logging
+import threading
+
+from httpmocker.shared import SharedTable
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the latency buckets, a last bucket holds the
+# slower requests.
+BOUNDS = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05,
+          0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0)
+PERCENTILES = (50, 90, 99)
+UNMATCHED = '<unmatched>'
+# counts the requests of the routes a full shared table has no row for.
+OVERFLOW = '<overflow>'
+# routes of the shared metrics of the workers of an app.
+SHARED_ROUTES = 1024
+PROMETHEUS = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Route:
+    __slots__ = ('count', 'errors', 'sum', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BOUNDS) + 1)
+
+
+class Metrics:
+    """Request counts, error counts and latency histograms by route."""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method, route, status, duration):
+        """Count a served request.
+
+        :param str method: request method.
+        :param str route: route template, None when unmatched.
+        :param int status: response status, 5xx counts as an error.
+        :param float duration: seconds spent serving the request.
+        """
+        index = bisect.bisect_left(BOUNDS, duration)
+        key = (method, route or UNMATCHED)
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = _Route()
+            stats.count += 1
+            if status >= 500:
+                stats.errors += 1
+            stats.sum += duration
+            if duration > stats.max:
+                stats.max = duration
+            stats.buckets[index] += 1
+
+    def clear(self):
+        with self._lock:
+            self._routes = {}
+
+    def snapshot(self):
+        """Retrieve the metrics of every route.
+
+        :return: ``method``, ``route``, ``count``, ``errors``, ``sum``,
+            ``max`` and per bucket ``buckets`` counts of every route.
+        :rtype: list
+        """
+        with self._lock:
+            rows = [{'method': method, 'route': route, 'count': stats.count,
+                     'errors': stats.errors, 'sum': stats.sum,
+                     'max': stats.max, 'buckets': list(stats.buckets)}
+                    for (method, route), stats in self._routes.items()]
+        return sorted(rows, key=lambda row: (row['route'], row['method']))
+
+
+class SharedMetrics(Metrics):
+    """Metrics counted by the worker processes of an application, in
+    shared memory allocated before they are forked.
+
+    Up to ``routes`` method and route pairs are counted apart, the
+    requests of the other routes are counted together as the ``*``
+    method of the ``<overflow>`` route.
+    """
+
+    def __init__(self, routes=SHARED_ROUTES):
+        super().__init__()
+        # count, errors, sum, max then the buckets of a route.
+        self._table = SharedTable(routes + 1, 4 + len(BOUNDS) + 1,
+                                  keep_keys=True)
+        self._overflow = self._table.row(f'* {OVERFLOW}')
+        self._full = False
+
+    def observe(self, method, route, status, duration):
+        index = bisect.bisect_left(BOUNDS, duration)
+        row = self._table.row(f'{method} {route or UNMATCHED}')
+        if row is None:
+            if not self._full:
+                self._full = True
+                logger.warning(f'Shared metrics are full, new routes are '
+                               f'counted as {OVERFLOW}.')
+            row = self._overflow
+        values = self._table.values
+        offset = row * self._table.width
+        with self._table.lock:
+            values[offset] += 1
+            if status >= 500:
+                values[offset + 1] += 1
+            values[offset + 2] += duration
+            if duration > values[offset + 3]:
+                values[offset + 3] = duration
+            values[offset + 4 + index] += 1
+
+    def clear(self):
+        with self._table.lock:
+            self._table.reset()
+
+    def snapshot(self):
+        with self._table.lock:
+            rows = self._table.rows()
+        rows = [{'method': key.split(' ', 1)[0],
+                 'route': key.split(' ', 1)[1], 'count': int(values[0]),
+                 'errors': int(values[1]), 'sum': values[2],
+                 'max': values[3], 'buckets': [int(n) for n in values[4:]]}
+                for key, values in rows if values[0]]
+        return sorted(rows, key=lambda row: (row['route'], row['method']))
+
+
+def percentile(row, q):
+    """Estimate a latency percentile from the buckets of a route.
+
+    The value is interpolated linearly inside the bucket holding it.
+
+    :param dict row: route metrics.
+    :param float q: percentile, between 0 and 100.
+    :return: seconds, None when no request was served.
+    :rtype: float
+    """
+    if not row['count']:
+        return None
+    rank = q / 100 * row['count']
+    seen = 0
+    for index, count in enumerate(row['buckets']):
+        if count and seen + count >= rank:
+            low = BOUNDS[index - 1] if index else 0.0
+            high = BOUNDS[index] if index < len(BOUNDS) else row['max']
+            return min(low + (high - low) * (rank - seen) / count,
+                       row['max'])
+        seen += count
+    return row['max']
+
+
+def summarize(row):
+    """Add the mean and percentiles to the route metrics.
+
+    :param dict row: route metrics.
+    :rtype: dict
+    """
+    summary = dict(row)
+    summary['mean'] = row['sum'] / row['count'] if row['count'] else None
+    for q in PERCENTILES:
+        summary[f'p{q}'] = percentile(row, q)
+    return summary
+
+
+def merge(groups):
+    """Add up route metrics of several apps.
+
+    :param iterable groups: route metrics lists.
+    :return: route metrics.
+    :rtype: list
+    """
+    merged = {}
+    for rows in groups:
+        for row in rows:
+            key = (row['method'], row['route'])
+            total = merged.get(key)
+            if total is None:
+                merged[key] = dict(row, buckets=list(row['buckets']))
+                continue
+            for name in ('count', 'errors', 'sum'):
+                total[name] += row[name]
+            total['max'] = max(total['max'], row['max'])
+            total['buckets'] = [a + b for a, b in
+                                zip(total['buckets'], row['buckets'])]
+    return sorted(merged.values(),
+                  key=lambda row: (row['route'], row['method']))
+
+
+def _labels(labels):
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace(
+            '"', r'\"').replace('\n', r'\n')
+    return ','.join(f'{name}="{escape(value)}"'
+                    for name, value in labels.items())
+
+
+def to_prometheus(series):
+    """Render route metrics in the Prometheus text format.
+
+    :param list series: ``(labels, row)`` pairs, labels identify the app
+        serving the route.
+    :rtype: str
+    """
+    lines = [
+        '# HELP httpmocker_requests_total Requests served by mock apps.',
+        '# TYPE httpmocker_requests_total counter']
+    for labels, row in series:
+        labels = _labels(dict(labels, method=row['method'],
+                              route=row['route']))
+        lines.append(f'httpmocker_requests_total{{{labels}}} {row["count"]}')
+    lines += [
+        '# HELP httpmocker_request_errors_total Requests answered with a '
+        '5xx status.',
+        '# TYPE httpmocker_request_errors_total counter']
+    for labels, row in series:
+        labels = _labels(dict(labels, method=row['method'],
+                              route=row['route']))
+        lines.append(
+            f'httpmocker_request_errors_total{{{labels}}} {row["errors"]}')
+    lines += [
+        '# HELP httpmocker_request_duration_seconds Time spent serving '
+        'requests.',
+        '# TYPE httpmocker_request_duration_seconds histogram']
+    for labels, row in series:
+        labels = dict(labels, method=row['method'], route=row['route'])
+        cumulative = 0
+        for bound, count in zip(BOUNDS + ('+Inf',), row['buckets']):
+            cumulative += count
+            bucket = _labels(dict(labels, le=bound))
+            lines.append(f'httpmocker_request_duration_seconds_bucket'
+                         f'{{{bucket}}} {cumulative}')
+        lines.append(f'httpmocker_request_duration_seconds_sum'
+                     f'{{{_labels(labels)}}} {row["sum"]}')
+        lines.append(f'httpmocker_request_duration_seconds_count'
+                     f'{{{_labels(labels)}}} {row["count"]}')
+    return '\n'.join(lines) + '\n'
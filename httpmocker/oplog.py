@@ -0,0 +1,91 @@
+"""Control plane writes shared by the worker processes of an application.
+
+A Sanic app running with ``WORKERS`` greater than one and a Flask app on
+the ``prefork`` WSGI server fork their workers, each with its own handler
+data and attached blueprints, and the kernel hands every request to any of
+them. The worker receiving a control plane write applies it and appends it
+to the log, the other workers replay the entries they have not seen before
+serving their next request.
+
+The log is an anonymous file and a shared size counter created before the
+workers are forked. Entries are written and read at explicit offsets, the
+workers never share a file position. Checking for new entries reads the
+counter only, the lock is taken when there is something to replay.
+
+The position of ``m-sequence`` data, the journal and the metrics change
+with every request, they are kept in shared memory instead, see
+``httpmocker.shared``.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import struct
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<I')
+
+
+class OpLog:
+    """Append only log of operations replayed by every worker."""
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._size = multiprocessing.Value('Q', 0, lock=False)
+        self._lock = multiprocessing.Lock()
+        # bytes of the log applied by this process.
+        self._offset = 0
+
+    def sync(self, apply):
+        """Replay the operations written by the other workers.
+
+        :param callable apply: applies an operation.
+        """
+        if self._size.value == self._offset:
+            return
+        with self._lock:
+            self._replay(apply)
+
+    def _replay(self, apply):
+        size = self._size.value
+        if size == self._offset:
+            return
+        data = os.pread(self._file.fileno(), size - self._offset,
+                        self._offset)
+        position = 0
+        while position < len(data):
+            length, = _HEADER.unpack_from(data, position)
+            position += _HEADER.size
+            op = json.loads(data[position:position + length])
+            position += length
+            try:
+                apply(op)
+            except Exception as error:
+                # the writer applied it, the state can only diverge here.
+                logger.exception(f'Could not replay {op["op"]}: {error!r}')
+        self._offset = size
+
+    def write(self, op, apply):
+        """Apply an operation and share it with the other workers.
+
+        An operation raising is not shared.
+
+        :param dict op: JSON operation with an ``op`` name.
+        :param callable apply: applies an operation.
+        :return: result of the operation.
+        """
+        with self._lock:
+            # apply on top of the state the other workers have reached.
+            self._replay(apply)
+            result = apply(op)
+            record = json.dumps(op).encode()
+            entry = _HEADER.pack(len(record)) + record
+            os.pwrite(self._file.fileno(), entry, self._offset)
+            self._offset += len(entry)
+            self._size.value = self._offset
+        return result
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,524 @@
+"""Route bookkeeping shared by the mock applications."""
+import logging
+import threading
+from collections.abc import MutableMapping
+
+from httpmocker.exceptions import TemplateError
+from httpmocker.faults import compile_fault
+from httpmocker.shared import SharedTable
+from httpmocker.templating import compile_response, is_sequence, sequence_steps
+
+logger = logging.getLogger(__name__)
+
+# routes of the workers of an app sharing the position of their sequence.
+SHARED_SEQUENCES = 4096
+
+
+class RouteIndex:
+    """Routes served by attached handlers.
+
+    Kept up to date on handler attach and detach, so that handler data
+    registration can validate a route without walking the framework router.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._by_handler = {}
+        self._templates = RouteTrie()
+
+    def add(self, name, uris):
+        """Index the routes of the handler.
+
+        :param str name: handler name.
+        :param iterable uris: route uris served by the handler.
+        """
+        uris = list(uris)
+        for uri in uris:
+            self._routes[uri] = name
+            if is_template(uri):
+                self._templates.insert(uri, name)
+        self._by_handler.setdefault(name, []).extend(uris)
+
+    def remove(self, name):
+        """Drop the routes of the handler.
+
+        :param str name: handler name.
+        """
+        for uri in self._by_handler.pop(name, []):
+            if self._routes.get(uri) == name:
+                del self._routes[uri]
+                if is_template(uri):
+                    self._templates.remove(uri)
+
+    def handler(self, uri):
+        """Retrieve the name of the handler serving the route.
+
+        :param str uri: route uri.
+        :return: handler name or None.
+        :rtype: str
+        """
+        return self._routes.get(uri)
+
+    def serves(self, uri):
+        """Check if the uri is a route or a path matching a route template.
+
+        :param str uri: route uri or concrete path.
+        :rtype: bool
+        """
+        return uri in self._routes or (
+            len(self._templates) > 0 and
+            self._templates.match(uri) is not None)
+
+    def __contains__(self, uri):
+        return uri in self._routes
+
+    def __iter__(self):
+        return iter(self._routes)
+
+    def __len__(self):
+        return len(self._routes)
+
+
+def _is_float(segment):
+    try:
+        float(segment)
+    except ValueError:
+        return False
+    return True
+
+
+# converters matching a single path segment of a given shape.
+SEGMENT_CONVERTERS = {
+    'int': str.isdigit,
+    'number': _is_float,
+    'float': _is_float,
+}
+# converters matching the rest of the path.
+PATH_CONVERTERS = ('path',)
+CONVERTERS = set(SEGMENT_CONVERTERS) | set(PATH_CONVERTERS) | {
+    'string', 'str', 'slug', 'uuid', 'alpha', 'any'}
+
+
+def is_template(uri):
+    """Check if the uri has path parameters.
+
+    :param str uri: route uri.
+    :rtype: bool
+    """
+    return '<' in uri
+
+
+def split_path(path):
+    return path.split('/')[1:] if path.startswith('/') else path.split('/')
+
+
+def parse_param(segment):
+    """Parse a ``<name>`` path parameter segment.
+
+    Flask and Django spell typed parameters ``<int:id>``, Sanic spells
+    them ``<id:int>``.
+
+    :param str segment: path segment.
+    :return: parameter name and converter, None if not a parameter.
+    :rtype: tuple
+    """
+    if not (segment.startswith('<') and segment.endswith('>')):
+        return None
+    inner = segment[1:-1]
+    if ':' not in inner:
+        return inner, None
+    left, right = inner.split(':', 1)
+    if left in CONVERTERS:
+        return right, left
+    return left, right
+
+
+class _Node:
+    __slots__ = ('static', 'params', 'rest', 'value', 'template')
+
+    def __init__(self):
+        self.static = {}
+        # (check, converter, name, node), typed converters first.
+        self.params = []
+        # (name, template, value) of a catch-all path parameter.
+        self.rest = None
+        self.value = None
+        self.template = None
+
+
+class RouteTrie:
+    """Segment trie of route templates.
+
+    Resolves a concrete path to the most specific template: a static
+    segment beats a typed parameter, which beats an untyped one, which
+    beats a catch-all ``path`` parameter.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, template, value):
+        """Add or replace the template.
+
+        :param str template: route template.
+        :param Any value: value returned on match.
+        """
+        node = self._root
+        for segment in split_path(template):
+            param = parse_param(segment)
+            if param is None:
+                node = node.static.setdefault(segment, _Node())
+                continue
+            name, converter = param
+            if converter in PATH_CONVERTERS:
+                if node.rest is None:
+                    self._size += 1
+                node.rest = (name, template, value)
+                return
+            node = self._param_node(node, converter, name)
+        if node.template is None:
+            self._size += 1
+        node.value = value
+        node.template = template
+
+    @staticmethod
+    def _param_node(node, converter, name):
+        for _, _converter, _name, child in node.params:
+            if (_converter, _name) == (converter, name):
+                return child
+        child = _Node()
+        node.params.append(
+            (SEGMENT_CONVERTERS.get(converter), converter, name, child))
+        node.params.sort(key=lambda param: param[0] is None)
+        return child
+
+    def remove(self, template):
+        """Remove the template.
+
+        :param str template: route template.
+        :raises KeyError: when the template is not in the trie.
+        """
+        node = self._root
+        for segment in split_path(template):
+            param = parse_param(segment)
+            if param is None:
+                node = node.static.get(segment)
+            elif param[1] in PATH_CONVERTERS:
+                if node.rest is None or node.rest[1] != template:
+                    raise KeyError(template)
+                node.rest = None
+                self._size -= 1
+                return
+            else:
+                node = next((child for _, converter, name, child
+                             in node.params
+                             if (converter, name) == (param[1], param[0])),
+                            None)
+            if node is None:
+                raise KeyError(template)
+        if node.template != template:
+            raise KeyError(template)
+        node.value = node.template = None
+        self._size -= 1
+
+    def match(self, path):
+        """Resolve the path to the most specific template.
+
+        :param str path: concrete request path.
+        :return: template, value and path parameters, None when no
+            template matches.
+        :rtype: tuple
+        """
+        return self._match(self._root, split_path(path), 0, {})
+
+    def _match(self, node, segments, index, params):
+        if index == len(segments):
+            if node.template is not None:
+                return node.template, node.value, params
+        else:
+            segment = segments[index]
+            child = node.static.get(segment)
+            if child is not None:
+                found = self._match(child, segments, index + 1, params)
+                if found is not None:
+                    return found
+            for check, _, name, child in node.params:
+                if not segment or (check is not None and not check(segment)):
+                    continue
+                found = self._match(child, segments, index + 1,
+                                    dict(params, **{name: segment}))
+                if found is not None:
+                    return found
+        if node.rest is not None and index < len(segments):
+            name, template, value = node.rest
+            return template, value, dict(
+                params, **{name: '/'.join(segments[index:])})
+        return None
+
+
+class _Entry:
+    __slots__ = ('data', 'response', 'fault')
+
+    def __init__(self, data):
+        self.data = data
+        self.response = compile_response(data)
+        self.fault = compile_fault(data)
+
+    def step(self):
+        return self.data, self.response, self.fault
+
+
+class _Counter:
+    """Requests served by a sequence."""
+    __slots__ = ('_served', '_lock')
+
+    def __init__(self):
+        self._served = 0
+        self._lock = threading.Lock()
+
+    @property
+    def served(self):
+        return self._served
+
+    def advance(self):
+        with self._lock:
+            served = self._served
+            self._served += 1
+        return served
+
+
+class _SharedCounter:
+    """Requests served by a sequence in every worker."""
+    __slots__ = ('_table', '_offset', '_generation')
+
+    def __init__(self, table, row, generation):
+        self._table = table
+        self._offset = row * table.width
+        self._generation = generation
+
+    def _restart(self):
+        # the first worker serving a new set of the data restarts it.
+        values = self._table.values
+        if values[self._offset] < self._generation:
+            values[self._offset] = self._generation
+            values[self._offset + 1] = 0
+
+    @property
+    def served(self):
+        with self._table.lock:
+            self._restart()
+            return self._table.values[self._offset + 1]
+
+    def advance(self):
+        values = self._table.values
+        with self._table.lock:
+            self._restart()
+            served = values[self._offset + 1]
+            values[self._offset + 1] = served + 1
+        return served
+
+
+class SharedCounters:
+    """Positions of the sequences served by the worker processes of an
+    application, in shared memory allocated before they are forked.
+
+    Every worker applies the handler data writes in the same order, see
+    :mod:`httpmocker.oplog`, the n-th set of the data of a route is the same
+    in every worker and its sequence restarts when the first worker serves
+    it. Past ``capacity`` routes, sequences advance in each worker.
+    """
+
+    def __init__(self, capacity=SHARED_SEQUENCES):
+        # generation then served requests of a route.
+        self._table = SharedTable(capacity, 2, 'q')
+        self._generations = {}
+
+    def bind(self, key):
+        """Count the requests served by a new set of the data of a route.
+
+        :param str key: path or route template.
+        :return: counter of the served requests.
+        """
+        generation = self._generations.get(key, 0) + 1
+        self._generations[key] = generation
+        row = self._table.row(key)
+        if row is None:
+            logger.warning(f'Shared sequences are full, {key} advances in '
+                           f'each worker.')
+            return _Counter()
+        return _SharedCounter(self._table, row, generation)
+
+
+class _Sequence:
+    """Handler data answering requests with its steps in order."""
+    __slots__ = ('data', 'steps', 'cycle', 'fault', 'counter')
+
+    def __init__(self, data):
+        steps, self.cycle = sequence_steps(data)
+        self.data = data
+        self.steps = [_Entry(step) for step in steps]
+        # applies to the steps without a policy of their own.
+        self.fault = compile_fault(data)
+        self.counter = _Counter()
+
+    def _index(self, served):
+        if self.cycle:
+            return served % len(self.steps)
+        return min(served, len(self.steps) - 1)
+
+    def step(self):
+        served = self.counter.advance()
+        data, response, fault = self.steps[self._index(served)].step()
+        return data, response, fault or self.fault
+
+    def state(self):
+        served = self.counter.served
+        return {'position': self._index(served),
+                'length': len(self.steps),
+                'served': served}
+
+
+def _entry(data):
+    return _Sequence(data) if is_sequence(data) else _Entry(data)
+
+
+class HandlerData(MutableMapping):
+    """Handler data keyed by route.
+
+    A key is either a concrete path or a route template such as
+    ``/users/<int:id>``. Concrete paths are resolved with a dict lookup,
+    templates through a :class:`RouteTrie`, so the per request cost does not
+    grow with the number of entries. Response templates of the data are
+    compiled when it is set, sequences advance on every lookup, see
+    :mod:`httpmocker.templating`. So are fault policies, see
+    :mod:`httpmocker.faults`.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._templates = RouteTrie()
+        self._lock = threading.Lock()
+        # sequence positions shared by the workers, see SharedCounters.
+        self.counters = None
+
+    def __getitem__(self, key):
+        return self._entries[key].data
+
+    def __setitem__(self, key, value):
+        """Set the data of the route.
+
+        :raises TemplateError: when the data declares an invalid response
+            template or sequence.
+        """
+        entry = _entry(value)
+        with self._lock:
+            self._set(key, entry)
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._delete(key)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _set(self, key, entry):
+        if self.counters is not None and isinstance(entry, _Sequence):
+            entry.counter = self.counters.bind(key)
+        self._entries[key] = entry
+        if is_template(key):
+            self._templates.insert(key, entry)
+
+    def _delete(self, key):
+        del self._entries[key]
+        if is_template(key):
+            self._templates.remove(key)
+
+    def set_many(self, items, check=None):
+        """Set the data of many routes, all of them or none.
+
+        :param list items: ``(key, data)`` pairs.
+        :param callable check: called with the key and data, returns an
+            error message to reject the data.
+        :return: ``(key, error)`` pairs of invalid data, nothing is set
+            when not empty.
+        :rtype: list
+        """
+        entries, errors = [], []
+        for key, value in items:
+            error = check(key, value) if check is not None else None
+            if error is None:
+                try:
+                    entries.append((key, _entry(value)))
+                except TemplateError as e:
+                    error = str(e)
+            if error is not None:
+                errors.append((key, error))
+        if not errors:
+            with self._lock:
+                for key, entry in entries:
+                    self._set(key, entry)
+        return errors
+
+    def delete_many(self, keys):
+        """Delete the data of many routes, all of them or none.
+
+        :param list keys: paths or route templates.
+        :return: keys without data, nothing is deleted when not empty.
+        :rtype: list
+        """
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            missing = [key for key in keys if key not in self._entries]
+            if not missing:
+                for key in keys:
+                    self._delete(key)
+        return missing
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._templates = RouteTrie()
+
+    def state(self, key):
+        """Retrieve the position of a sequence.
+
+        :param str key: path or route template.
+        :return: next step position, number of steps and served requests,
+            None when the data is not a sequence.
+        :rtype: dict
+        """
+        entry = self._entries[key]
+        return entry.state() if isinstance(entry, _Sequence) else None
+
+    def resolve(self, path, raw=None):
+        """Resolve the most specific entry for the request.
+
+        A sequence advances to its next step.
+
+        :param str path: request path.
+        :param str raw: raw request url, tried before the path when given.
+        :return: matched key, data, path parameters of the matched template,
+            the compiled response template and fault policy or None.
+        :rtype: tuple
+        """
+        # no lock, a get never observes a half applied write.
+        key = raw
+        entry = self._entries.get(raw) if raw is not None else None
+        if entry is None:
+            key, entry = path, self._entries.get(path)
+        params = {}
+        if entry is None and len(self._templates):
+            found = self._templates.match(path)
+            if found is not None:
+                key, entry, params = found
+        if entry is None:
+            return None, {}, params, None, None
+        data, response, fault = entry.step()
+        return key, data, params, response, fault
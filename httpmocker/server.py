@@ -1,23 +1,40 @@
+import ast
 import json
 import logging
+import multiprocessing
 import os
 import re
+import ssl
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
 from http.server import BaseHTTPRequestHandler, HTTPServer, HTTPStatus
-from multiprocessing import Process, ProcessError
+from multiprocessing import ProcessError
+from socketserver import ThreadingMixIn
+from tempfile import SpooledTemporaryFile
+from urllib.parse import parse_qs, urlsplit
 
 import click
-from httpmocker.app.base_app import AppRegistry
+from httpmocker.app.base_app import READY, AppRegistry
 from httpmocker.client import AppType, Client
 from httpmocker.config import get_config
-from httpmocker.exceptions import AppStartFailed, AppStopFailed
+from httpmocker.exceptions import (AppNotSupported, AppStartFailed,
+                                   AppStopFailed, BadRequestBody)
+from httpmocker.handler import METRICS_URL
 from httpmocker.log import configure_logging
+from httpmocker.metrics import PROMETHEUS, merge, summarize, to_prometheus
+from httpmocker.store import FixtureStore
 from httpmocker.utils import singleton
 
 logger = logging.getLogger(__name__)
 
 BASE_URL = '/mock/'
 
+# Apps are not picklable, their processes are forked whatever the default
+# start method of the platform is.
+FORK = multiprocessing.get_context('fork')
+
 
 @singleton
 class Server:
@@ -29,7 +46,45 @@ class Server:
         :param dict config: server configurations, Defaults -> None
         """
         self._apps = {}
+        self._processes = {}
+        self._ports = {}
+        self._lock = threading.RLock()
         self.config = config or {}
+        # fixture blobs shared with the apps, see httpmocker.store.
+        self.fixtures = FixtureStore()
+
+    def app_metrics(self):
+        """Collect the request metrics of every running application.
+
+        :return: per application ``id``, ``name``, ``port`` and ``routes``
+            metrics or ``error``.
+        :rtype: list
+        """
+        timeout = float(self.config.get('REQUEST_TIMEOUT', 10))
+        # the apps serve the certificate they were given, not one to verify.
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+        def collect(app):
+            result = {'id': app.id, 'name': app.name, 'port': app.port}
+            if app.ssl_enabled:
+                conn = HTTPSConnection('127.0.0.1', app.port,
+                                       timeout=timeout, context=context)
+            else:
+                conn = HTTPConnection('127.0.0.1', app.port,
+                                      timeout=timeout)
+            try:
+                conn.request('GET', METRICS_URL)
+                response = conn.getresponse()
+                result['routes'] = json.loads(response.read())['routes']
+            except (OSError, HTTPException, ValueError, KeyError) as error:
+                result['error'] = str(error) or error.__class__.__name__
+            finally:
+                conn.close()
+            return result
+
+        return self._map(collect, self.apps)
 
     @property
     def apps(self):
@@ -38,7 +93,28 @@ class Server:
         :return: list of application instances.
         :rtype: list
         """
-        return self._apps
+        with self._lock:
+            return list(self._apps.values())
+
+    def get(self, app_id):
+        """Retrieve the application by id.
+
+        :param str app_id: application id.
+        :return: application instance or None.
+        :rtype: BaseApp
+        """
+        return self._apps.get(app_id)
+
+    def get_by_port(self, port):
+        """Retrieve the application attached to the given port.
+
+        :param int port: application port.
+        :return: application instance or None.
+        :rtype: BaseApp
+        """
+        with self._lock:
+            app_id = self._ports.get(int(port))
+            return self._apps.get(app_id)
 
     def _is_alive(self, app):
         """Check the application status.
@@ -47,37 +123,220 @@ class Server:
         :return: True if alive else False
         :rtype: bool
         """
-        return self._apps[app].is_alive()
+        process = self._processes.get(app.id)
+        return process is not None and process.is_alive()
+
+    def _reserve(self, app, port):
+        """Reserve the port for the application.
+
+        :param BaseApp app: application instance.
+        :param int port: port to reserve.
+        :raises AppStartFailed: when port is taken by another application.
+        """
+        with self._lock:
+            if port in self._ports:
+                other = self._apps.get(self._ports[port])
+                name = other.name if other else 'another'
+                raise AppStartFailed(
+                    f'Port {port} is already used by {name} app.')
+            self._ports[port] = app.id
+
+    def _register(self, app, port, process):
+        """Add the started application to the registry.
+
+        :param BaseApp app: application instance.
+        :param int port: application port.
+        :param Process process: application process.
+        """
+        with self._lock:
+            app.port = port
+            self._apps[app.id] = app
+            self._processes[app.id] = process
+            self._ports[port] = app.id
+
+    def _unregister(self, app, port=None):
+        """Remove the application from the registry.
+
+        :param BaseApp app: application instance.
+        :param int port: reserved port, Defaults -> application port.
+        :return: application process or None.
+        :rtype: Process
+        """
+        port = app.port if port is None else port
+        with self._lock:
+            self._apps.pop(app.id, None)
+            if self._ports.get(port) == app.id:
+                del self._ports[port]
+            return self._processes.pop(app.id, None)
+
+    def create(self, name, port, config=None, **kwargs):
+        """Create and start the application.
+
+        :param str name: application name.
+        :param int port: port to attach to.
+        :param dict config: application configurations, Defaults -> None
+        :return: started application instance.
+        :rtype: BaseApp
+        :raises AppNotSupported: when application is not supported.
+        :raises AppStartFailed: when application fails to start.
+        """
+        app_cls = getattr(AppRegistry, name.lower(), None)
+        if not isinstance(app_cls, type):
+            raise AppNotSupported(f'App {name} is not supported')
+        app = app_cls(config or {})
+        self.start(app, port=int(port), **kwargs)
+        return app
+
+    def create_many(self, entries):
+        """Create and start applications in parallel.
+
+        :param list entries: dicts with ``name``, ``port`` and optional
+            ``config`` and ``enable_ssl`` keys.
+        :return: per application result with ``id`` or ``error``.
+        :rtype: list
+        """
+        def create(entry):
+            if not isinstance(entry, dict):
+                return {'error': 'Invalid app entry.'}
+            result = {'name': entry.get('name'), 'port': entry.get('port')}
+            try:
+                app = self.create(entry['name'], entry['port'],
+                                  entry.get('config'),
+                                  enable_ssl=str(
+                                      entry.get('enable_ssl', False)))
+            except KeyError as error:
+                result['error'] = f'{error} not found.'
+            except Exception as error:
+                logger.exception(error)
+                result['error'] = str(error)
+            else:
+                result['id'] = app.id
+            return result
+
+        return self._map(create, entries)
+
+    def stop_many(self, app_ids):
+        """Stop applications in parallel.
+
+        :param list app_ids: application ids.
+        :return: per application result with ``msg`` or ``error``.
+        :rtype: list
+        """
+        def stop(app_id):
+            app = self.get(app_id)
+            if app is None:
+                return {'id': app_id, 'error': 'App not found.'}
+            try:
+                self.stop(app)
+            except AppStopFailed as error:
+                return {'id': app_id, 'error': str(error)}
+            return {'id': app_id, 'msg': f'App {app.name} stopped.'}
+
+        return self._map(stop, app_ids)
+
+    def _map(self, func, items):
+        items = list(items)
+        if not items:
+            return []
+        workers = min(len(items), int(self.config.get('BATCH_WORKERS', 16)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, items))
 
     def start(self, app, port, **kwargs):
         """Start the application on given port.
 
+        Returns as soon as the application reports that it is listening.
+
         :param BaseApp app: application instance.
         :param str port: port to attach to.
         :param bool ssl: enable ssl.
+        :param float timeout: seconds to wait for the application to
+            become ready, Defaults -> ``APP_START_TIMEOUT`` config.
         :raises AppStartFailed: when application fails to start.
         """
+        timeout = kwargs.get('timeout') or float(
+            self.config.get('APP_START_TIMEOUT', 10))
+        enable_ssl = kwargs.get('enable_ssl', 'False')
+        self._reserve(app, port)
+        ready_conn = None
+        try:
+            process, ready_conn = self._spawn(app, port, enable_ssl)
+            self._wait_until_ready(app, process, ready_conn, timeout)
+        except (ProcessError, OSError):
+            self._unregister(app, port)
+            raise AppStartFailed(
+                f'Could not start the {app.name} app on port {port}.')
+        except AppStartFailed:
+            self._unregister(app, port)
+            raise
+        finally:
+            if ready_conn is not None:
+                ready_conn.close()
+
+        app.ssl_enabled = bool(ast.literal_eval(str(enable_ssl)))
+        logger.info(f'{app.name} app started on port {port}.')
+        self._register(app, port, process)
+
+    def _spawn(self, app, port, enable_ssl):
+        """Start a new process running the application.
+
+        The process is forked from a control plane thread while others may
+        be serving requests. The child only runs the application, which no
+        other thread sees before it is registered, and logs, whose handler
+        locks are reinitialized after a fork like the import lock. The
+        modules it imports lazily are the ones of the web framework, which
+        the control plane threads never import, so it does not wait on a
+        lock held by a thread that was not forked.
+
+        :param BaseApp app: application instance.
+        :param int port: port to attach to.
+        :param str enable_ssl: enable ssl.
+        :return: application process and readiness connection.
+        :rtype: tuple
+        """
+        ready_conn, child_conn = FORK.Pipe(duplex=False)
         try:
-            process = Process(target=app.run, kwargs={
+            process = FORK.Process(target=app.run, kwargs={
                 'port': port,
-                'enable_ssl': kwargs.get('enable_ssl', 'False')
+                'enable_ssl': enable_ssl,
+                'ready': child_conn
             }, daemon=True)
             process.start()
-            # If process is alive after 5 secs, consider
-            # the app running.
-            process.join(5)
-            if process.is_alive():
-                logger.info(
-                    f'{app.name} app started on port {port}.'
-                )
-            else:
+        except BaseException:
+            ready_conn.close()
+            raise
+        finally:
+            child_conn.close()
+        return process, ready_conn
+
+    def _wait_until_ready(self, app, process, conn, timeout):
+        """Wait for the readiness report of the application process.
+
+        :param BaseApp app: application instance.
+        :param Process process: application process.
+        :param multiprocessing.Connection conn: readiness connection.
+        :param float timeout: seconds to wait for the report.
+        :raises AppStartFailed: when application reports a failure, exits
+            or does not become ready in time.
+        """
+        try:
+            if not conn.poll(timeout):
                 raise AppStartFailed(
-                    f'Could not start the {app.name} app on port {port}.')
-        except (ProcessError):
+                    f'{app.name} app did not become ready '
+                    f'in {timeout} seconds.')
+            status, error = conn.recv()
+        except EOFError:
+            status, error = None, 'app process exited.'
+        except AppStartFailed:
+            process.terminate()
+            raise
+
+        if status != READY:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
             raise AppStartFailed(
-                f'Could not start the {app.name} app on port {port}.')
-        else:
-            self._apps[app] = process
+                f'Could not start the {app.name} app: {error}')
 
     def stop(self, app):
         """Stop the application.
@@ -85,162 +344,349 @@ class Server:
         :param BaseApp app: application instance.
         :raises AppStopFailed: when application fails to stop.
         """
+        process = self._unregister(app)
+        if process is None:
+            raise AppStopFailed(f'App {app.name} is not running.')
+
         try:
-            self._apps[app].terminate()
+            process.terminate()
+            process.join(1)
             logger.info(
                 f'{app.name} app stopped.')
         except ProcessError:
+            self._register(app, app.port, process)
             raise AppStopFailed(f'Could not stop the app {app.name}')
-        else:
-            del self._apps[app]
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """Control plane server handling every request in its own thread."""
+    daemon_threads = True
 
 
 class MockHTTPRequestHandler(BaseHTTPRequestHandler):
+    # keep connections open between requests, every response carries
+    # a content length.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    # close kept-alive connections idle for this many seconds.
+    timeout = 30
+
     MOCK_APP_URL = re.compile(r'^\/mock\/app\/*$')
+    MOCK_APPS_URL = re.compile(r'^\/mock\/apps\/*$')
+    MOCK_FIXTURES_URL = re.compile(r'^\/mock\/fixtures\/*$')
+    MOCK_METRICS_URL = re.compile(r'^\/mock\/metrics\/*(\?.*)?$')
 
     def do_DELETE(self):
+        try:
+            self.dispatch_delete()
+        except BadRequestBody as error:
+            self.bad_request_body(error)
+
+    def dispatch_delete(self):
         if self.MOCK_APP_URL.match(self.path):
             logger.debug(f'Handing {self.command} on {self.path}')
             self.delete_app()
+        elif self.MOCK_APPS_URL.match(self.path):
+            logger.debug(f'Handing {self.command} on {self.path}')
+            self.delete_apps()
+        elif self.MOCK_FIXTURES_URL.match(self.path):
+            logger.debug(f'Handing {self.command} on {self.path}')
+            self.delete_fixture()
+        else:
+            self.not_found()
 
     def do_POST(self):
+        try:
+            self.dispatch_post()
+        except BadRequestBody as error:
+            self.bad_request_body(error)
+
+    def dispatch_post(self):
         if self.MOCK_APP_URL.match(self.path):
             logger.debug(f'Handing {self.command} on {self.path}')
             self.create_app()
+        elif self.MOCK_APPS_URL.match(self.path):
+            logger.debug(f'Handing {self.command} on {self.path}')
+            self.create_apps()
+        elif self.MOCK_FIXTURES_URL.match(self.path):
+            logger.debug(f'Handing {self.command} on {self.path}')
+            self.create_fixture()
+        else:
+            self.not_found()
 
     def do_GET(self):
         if self.MOCK_APP_URL.match(self.path):
             logger.debug(f'Handing {self.command} on {self.path}')
             self.get_app()
+        elif self.MOCK_FIXTURES_URL.match(self.path):
+            logger.debug(f'Handing {self.command} on {self.path}')
+            self.get_fixtures()
+        elif self.MOCK_METRICS_URL.match(self.path):
+            logger.debug(f'Handing {self.command} on {self.path}')
+            self.get_metrics()
+        else:
+            self.not_found()
+
+    def _iter_body(self, chunk_size=65536):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                line = self.rfile.readline()
+                try:
+                    size = int(line.split(b';')[0], 16)
+                except ValueError:
+                    size = -1
+                if size < 0:
+                    raise BadRequestBody(f'Invalid chunk size {line!r}.')
+                if not size:
+                    # skip trailers up to the blank line ending the body.
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    return
+                yield from self._read_exactly(size, chunk_size)
+                self.rfile.readline()
+        else:
+            length = int(self.headers.get('Content-Length') or 0)
+            yield from self._read_exactly(length, chunk_size)
+
+    def _read_exactly(self, size, chunk_size):
+        while size > 0:
+            chunk = self.rfile.read(min(size, chunk_size))
+            if not chunk:
+                raise ConnectionError('Request body ended early.')
+            size -= len(chunk)
+            yield chunk
+
+    def read_body(self):
+        """Read the request body, fixed length or chunked, into a file kept
+        in memory up to BODY_SPOOL_SIZE bytes and spooled to disk above.
+
+        Meant for the bodies consumed as a stream, like the fixtures copied
+        to the fixture store. A body parsed at once is read with
+        ``get_body``, spooling it would only add a copy.
+
+        :return: body file positioned at the start.
+        :rtype: SpooledTemporaryFile
+        :raises BadRequestBody: when the chunked encoding is malformed.
+        """
+        body = SpooledTemporaryFile(
+            max_size=int(Server().config.get('BODY_SPOOL_SIZE', 1048576)))
+        for chunk in self._iter_body():
+            body.write(chunk)
+        body.seek(0)
+        return body
 
     def get_body(self):
-        return self.rfile.read(int(self.headers.get('Content-Length')))
+        return b''.join(self._iter_body())
+
+    def get_json(self, default=None):
+        body = self.get_body()
+        if not body:
+            return default
+        return json.loads(body)
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_text(self, status, text, content_type):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def bad_request_body(self, error):
+        # the rest of the body can not be told apart from the next request.
+        self.close_connection = True
+        self.send_json(HTTPStatus.BAD_REQUEST, {'error': str(error)},
+                       headers={'Connection': 'close'})
+
+    def not_found(self):
+        # the request body was not read, do not reuse the connection.
+        self.close_connection = True
+        self.send_json(HTTPStatus.NOT_FOUND,
+                       {'error': f'{self.path} not found.'})
 
     def get_app(self):
         app_id = self.headers.get('m-app-id')
         if app_id is not None:
-            for app in Server().apps:
-                if app.id == app_id:
-                    if Server()._is_alive(app):
-                        self.send_response(HTTPStatus.OK)
-                        self.end_headers()
-                        self.wfile.write(json.dumps({
-                            'status': 'running',
-                            'host': app.host,
-                            'port': app.port
-                        }).encode())
-                    else:
-                        self.send_response(HTTPStatus.NOT_FOUND)
-                        self.end_headers()
-                        self.wfile.write(json.dumps({
-                            'msg': f'{app.name} app not running.'
-                        }).encode())
-                    break
+            app = Server().get(app_id)
+            if app is None:
+                self.send_json(HTTPStatus.NOT_FOUND,
+                               {'error': 'App not found.'})
+            elif Server()._is_alive(app):
+                self.send_json(HTTPStatus.OK, {
+                    'status': 'running',
+                    'host': app.host,
+                    'port': app.port
+                })
             else:
-                self.send_response(HTTPStatus.NOT_FOUND)
-                self.end_headers()
-                self.wfile.write(
-                    json.dumps({'error': 'App not found.'}).encode())
+                self.send_json(HTTPStatus.NOT_FOUND, {
+                    'msg': f'{app.name} app not running.'
+                })
 
         else:
-            self.send_response(HTTPStatus.BAD_REQUEST)
-            self.end_headers()
-            self.wfile.write(json.dumps(
-                {'error': 'm-app-id not found.'}).encode())
+            self.send_json(HTTPStatus.BAD_REQUEST,
+                           {'error': 'm-app-id not found.'})
+
+    def get_metrics(self):
+        apps = Server().app_metrics()
+        query = parse_qs(urlsplit(self.path).query)
+        if query.get('format') == ['prometheus']:
+            series = [({'app': app['name'], 'port': app['port']}, row)
+                      for app in apps for row in app.get('routes', [])]
+            self.send_text(HTTPStatus.OK, to_prometheus(series), PROMETHEUS)
+            return
+        total = merge(app['routes'] for app in apps if 'routes' in app)
+        self.send_json(HTTPStatus.OK, {
+            'apps': apps,
+            'total': [summarize(row) for row in total]})
+
+    def get_fixtures(self):
+        self.send_json(HTTPStatus.OK, {'fixtures': Server().fixtures.list()})
+
+    def create_fixture(self):
+        with self.read_body() as body:
+            digest, size = Server().fixtures.put(body)
+        self.send_json(HTTPStatus.OK, {'digest': digest, 'size': size})
+
+    def delete_fixture(self):
+        digest = self.headers.get('m-fixture-digest')
+        try:
+            Server().fixtures.remove(digest)
+        except KeyError:
+            self.send_json(HTTPStatus.NOT_FOUND,
+                           {'error': f'Fixture {digest} not found.'})
+        else:
+            self.send_json(HTTPStatus.OK,
+                           {'msg': f'Fixture {digest} deleted.'})
 
     def create_app(self):
         app_name = self.headers.get('m-app-name')
         app_port = self.headers.get('m-app-port')
         app_enable_ssl = self.headers.get('m-app-enable-ssl', 'False')
+        body = self.get_body()
 
         if app_name is not None and app_port is not None:
             try:
-                app = getattr(AppRegistry, app_name.lower())(
-                    json.loads(self.get_body().decode()))
-            except AttributeError:
-                msg = f'App {app_name} is not supported'
-                logger.exception(msg)
-                self.send_response(HTTPStatus.NOT_FOUND)
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': msg}).encode())
-                return
-            except Exception as error:
+                app = Server().create(app_name, app_port,
+                                      json.loads(body or b'{}'),
+                                      enable_ssl=app_enable_ssl)
+            except AppNotSupported as error:
                 logger.exception(error)
-                self.send_response(HTTPStatus.INTERNAL_SERVER_ERROR)
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': str(error)}).encode())
-                return
-
-            try:
-                Server().start(app, port=int(app_port),
-                               enable_ssl=app_enable_ssl)
-            except (AppStartFailed, OSError) as error:
+                self.send_json(HTTPStatus.NOT_FOUND, {'error': str(error)})
+            except Exception as error:
                 logger.exception(error)
-                self.send_response(HTTPStatus.INTERNAL_SERVER_ERROR)
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': str(error)}).encode())
-                return
+                self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR,
+                               {'error': str(error)})
             else:
-                self.send_response(HTTPStatus.OK)
-                self.send_header('m-app-id', app.id)
-                self.end_headers()
-                self.wfile.write(json.dumps(
-                    {'msg': f'{app.name} app created.'}).encode())
+                self.send_json(HTTPStatus.OK,
+                               {'msg': f'{app.name} app created.'},
+                               headers={'m-app-id': app.id})
         else:
-            self.send_response(HTTPStatus.BAD_REQUEST)
-            self.end_headers()
-            self.wfile.write(json.dumps(
-                {'error': 'm-app-name and m-app-port not found.'}).encode())
+            self.send_json(HTTPStatus.BAD_REQUEST,
+                           {'error': 'm-app-name and m-app-port not found.'})
+
+    def get_json_list(self):
+        try:
+            items = self.get_json()
+        except (TypeError, ValueError):
+            items = None
+        if not isinstance(items, list):
+            self.send_json(HTTPStatus.BAD_REQUEST,
+                           {'error': 'Request body must be a json list.'})
+            return None
+        return items
+
+    def send_results(self, results):
+        failed = any('error' in result for result in results)
+        self.send_json(HTTPStatus.MULTI_STATUS if failed else HTTPStatus.OK,
+                       {'apps': results})
+
+    def create_apps(self):
+        entries = self.get_json_list()
+        if entries is not None:
+            self.send_results(Server().create_many(entries))
+
+    def delete_apps(self):
+        app_ids = self.get_json_list()
+        if app_ids is not None:
+            self.send_results(Server().stop_many(app_ids))
 
     def delete_app(self):
         app_id = self.headers.get('m-app-id')
 
         if app_id is not None:
-            for app in Server().apps:
-                if app.id == app_id:
-                    try:
-                        Server().stop(app)
-                    except AppStopFailed as error:
-                        self.send_response(HTTPStatus.INTERNAL_SERVER_ERROR)
-                        self.end_headers()
-                        self.wfile.write(
-                            json.dumps({'error': str(error)}).encode())
-                    else:
-                        self.send_response(HTTPStatus.OK)
-                        self.end_headers()
-                        self.wfile.write(json.dumps(
-                            {'msg': 'App {} stopped.'.format(
-                                    app.name)}).encode())
-
-                    break
+            app = Server().get(app_id)
+            if app is None:
+                self.send_json(HTTPStatus.NOT_FOUND,
+                               {'error': 'App not found.'})
+                return
+
+            try:
+                Server().stop(app)
+            except AppStopFailed as error:
+                self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR,
+                               {'error': str(error)})
             else:
-                self.send_response(HTTPStatus.NOT_FOUND)
-                self.end_headers()
-                self.wfile.write(json.dumps(
-                    {'error': 'App not found.'}).encode())
+                self.send_json(HTTPStatus.OK,
+                               {'msg': f'App {app.name} stopped.'})
 
         else:
-            self.send_response(HTTPStatus.BAD_REQUEST)
-            self.end_headers()
-            self.wfile.write(json.dumps(
-                {'error': 'm-app-id not found.'}).encode())
+            self.send_json(HTTPStatus.BAD_REQUEST,
+                           {'error': 'm-app-id not found.'})
+
+
+class SingleRequestHandler(MockHTTPRequestHandler):
+    """Handler closing the connection after every request.
+
+    Used by the single-threaded server, where a kept-alive connection
+    would block every other client.
+    """
+    protocol_version = 'HTTP/1.0'
+
+
+def make_server(host, port, threaded=True):
+    """Create the control plane http server.
+
+    :param str host: host to bind to.
+    :param int port: port to bind to.
+    :param bool threaded: serve requests concurrently, Defaults -> True
+    :return: http server instance.
+    :rtype: HTTPServer
+    """
+    if threaded:
+        return ThreadingHTTPServer((host, port), MockHTTPRequestHandler)
+    return HTTPServer((host, port), SingleRequestHandler)
 
 
 @click.command()
 @click.argument('host', default='0.0.0.0', type=click.STRING)
 @click.argument('port', default=8080, type=click.INT)
-def run(host, port):
+@click.option('--threaded/--no-threaded', default=None,
+              help='Serve control requests concurrently.')
+def run(host, port, threaded):
     config = get_config()
     host = config.get('HOST', host)
     port = int(config.get('PORT', port))
+    if threaded is None:
+        threaded = config.get('THREADED', True)
     server = Server(config)
-    http_server = HTTPServer((host, port), MockHTTPRequestHandler)
+    http_server = make_server(host, port, threaded=threaded)
     try:
         http_server.serve_forever()
     except KeyboardInterrupt:
         logger.info('KeyboardInterrupt. Stopping all apps.')
-        for app in list(server.apps):
+        for app in server.apps:
             server.stop(app)
+        server.fixtures.close()
         http_server.server_close()
 
 
@@ -0,0 +1,104 @@
+"""Memory shared by the worker processes of an application.
+
+The handler data and the attached handlers of a forked worker are kept in
+step by the ``httpmocker.oplog.OpLog``, the state changing with every
+request is kept in memory mapped by every worker instead: the position of
+``m-sequence`` data, the journal and the metrics, see
+``httpmocker.routing.SharedCounters``, ``httpmocker.journal.SharedJournal``
+and ``httpmocker.metrics.SharedMetrics``. The memory is allocated before
+the workers are forked, it has a fixed size.
+"""
+import ctypes
+import hashlib
+import multiprocessing
+
+DIGEST_SIZE = 16
+# bytes of a key kept to list the keys of a table, longer keys are listed
+# truncated.
+KEY_SIZE = 256
+_EMPTY = bytes(DIGEST_SIZE)
+
+
+class SharedTable:
+    """Rows of numbers keyed by string, in memory shared with the forked
+    processes.
+
+    A key claims a row for good, a full table has no row for a new key.
+    Rows are read and written under ``lock``, a process remembers the rows
+    it looked up.
+    """
+
+    def __init__(self, capacity, width, typecode='d', keep_keys=False):
+        """
+        :param int capacity: number of rows.
+        :param int width: numbers per row.
+        :param str typecode: ``array`` type code of the numbers.
+        :param bool keep_keys: keep the keys to list them, see ``rows``.
+        """
+        self.capacity = capacity
+        self.width = width
+        self.lock = multiprocessing.Lock()
+        self.values = multiprocessing.RawArray(typecode, capacity * width)
+        self._digests = multiprocessing.RawArray(
+            ctypes.c_char, capacity * DIGEST_SIZE)
+        self._keys = multiprocessing.RawArray(
+            ctypes.c_char, capacity * KEY_SIZE) if keep_keys else None
+        self._rows = {}
+
+    def row(self, key):
+        """Find the row of the key, claiming one on first use.
+
+        :param str key: row key.
+        :return: row index, None when the table is full.
+        :rtype: int
+        """
+        row = self._rows.get(key)
+        if row is not None:
+            return row
+        encoded = key.encode()
+        digest = hashlib.blake2b(encoded, digest_size=DIGEST_SIZE).digest()
+        start = int.from_bytes(digest[:8], 'little')
+        with self.lock:
+            for probe in range(self.capacity):
+                row = (start + probe) % self.capacity
+                offset = row * DIGEST_SIZE
+                stored = self._digests[offset:offset + DIGEST_SIZE]
+                if stored == digest:
+                    break
+                if stored == _EMPTY:
+                    self._digests[offset:offset + DIGEST_SIZE] = digest
+                    if self._keys is not None:
+                        encoded = encoded[:KEY_SIZE]
+                        offset = row * KEY_SIZE
+                        self._keys[offset:offset + len(encoded)] = encoded
+                    break
+            else:
+                return None
+        self._rows[key] = row
+        return row
+
+    def rows(self):
+        """Retrieve the claimed rows, to be called under ``lock``.
+
+        :return: ``(key, numbers)`` of every claimed row, the key is None
+            unless the table keeps keys.
+        :rtype: list
+        """
+        values = self.values[:]
+        rows = []
+        for row in range(self.capacity):
+            offset = row * DIGEST_SIZE
+            if self._digests[offset:offset + DIGEST_SIZE] == _EMPTY:
+                continue
+            key = None
+            if self._keys is not None:
+                key = self._keys[row * KEY_SIZE:(row + 1) * KEY_SIZE]
+                key = key.rstrip(b'\0').decode('utf-8', 'ignore')
+            rows.append((key, values[row * self.width:
+                                     (row + 1) * self.width]))
+        return rows
+
+    def reset(self):
+        """Zero the numbers of every row, to be called under ``lock``.
+        The rows stay claimed."""
+        ctypes.memset(self.values, 0, ctypes.sizeof(self.values))
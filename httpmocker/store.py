@@ -0,0 +1,172 @@
+"""Content-addressed fixture blobs shared by the application processes.
+
+The control plane owns the blobs, each one a ``multiprocessing``
+shared memory segment named after the sha256 digest of its content.
+Applications attach a blob by digest on first use and serve it straight
+from the shared pages, so fifty apps serving the same fixture hold one copy
+of it.
+"""
+import hashlib
+import struct
+import threading
+from multiprocessing import shared_memory
+
+# segment layout: content length then content, the segment itself may be
+# rounded up to a page size.
+HEADER = struct.Struct('<Q')
+# POSIX shared memory names are limited to 31 characters on some platforms.
+NAME_PREFIX = 'hm-'
+NAME_DIGEST_SIZE = 24
+
+
+def segment_name(digest):
+    return NAME_PREFIX + digest[:NAME_DIGEST_SIZE]
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before python 3.13 attaching registers the segment with the
+        # resource tracker. App processes share the tracker of the control
+        # plane, which already tracks it, so the registration is a no-op.
+        return shared_memory.SharedMemory(name=name)
+
+
+def iter_chunks(view, chunk_size=65536):
+    """Copy a blob out of the shared pages one chunk at a time.
+
+    For servers writing only bytes, the blob is never copied whole.
+
+    :param memoryview view: blob content.
+    :param int chunk_size: chunk size.
+    """
+    for offset in range(0, len(view), chunk_size):
+        yield bytes(view[offset:offset + chunk_size])
+
+
+class FixtureStore:
+    """Owner of the fixture blobs, lives in the control plane process."""
+
+    def __init__(self):
+        self._segments = {}
+        self._lock = threading.Lock()
+
+    def put(self, stream, chunk_size=65536):
+        """Store the content of a binary stream.
+
+        The stream is read twice, to digest and to copy it, without
+        holding the whole content in memory.
+
+        :param stream: seekable binary stream positioned at the start.
+        :return: digest and size of the content.
+        :rtype: tuple
+        """
+        sha = hashlib.sha256()
+        size = 0
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            sha.update(chunk)
+            size += len(chunk)
+        digest = sha.hexdigest()
+
+        with self._lock:
+            if digest in self._segments:
+                return digest, size
+            segment = self._create(segment_name(digest),
+                                   HEADER.size + max(size, 1))
+            HEADER.pack_into(segment.buf, 0, size)
+            stream.seek(0)
+            offset = HEADER.size
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                segment.buf[offset:offset + len(chunk)] = chunk
+                offset += len(chunk)
+            self._segments[digest] = segment
+        return digest, size
+
+    @staticmethod
+    def _create(name, size):
+        try:
+            return shared_memory.SharedMemory(name=name, create=True,
+                                              size=size)
+        except FileExistsError:
+            # left behind by a control plane that did not shut down.
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+
+    def remove(self, digest):
+        """Unlink the blob, attached apps keep their mapping.
+
+        :param str digest: content digest.
+        :raises KeyError: when the blob is not stored.
+        """
+        with self._lock:
+            segment = self._segments.pop(digest)
+        segment.close()
+        segment.unlink()
+
+    def list(self):
+        """Retrieve stored blobs.
+
+        :return: ``digest`` and ``size`` of every blob.
+        :rtype: list
+        """
+        with self._lock:
+            return [{'digest': digest,
+                     'size': HEADER.unpack_from(segment.buf, 0)[0]}
+                    for digest, segment in self._segments.items()]
+
+    def close(self):
+        """Unlink every blob."""
+        with self._lock:
+            segments, self._segments = self._segments, {}
+        for segment in segments.values():
+            segment.close()
+            segment.unlink()
+
+
+class FixtureCache:
+    """Blobs attached by an application process."""
+
+    def __init__(self):
+        self._views = {}
+        self._segments = []
+        self._lock = threading.Lock()
+
+    def get(self, digest):
+        """Retrieve the content of a blob, attaching it on first use.
+
+        :param str digest: content digest.
+        :return: read-only view of the shared content.
+        :rtype: memoryview
+        :raises KeyError: when no such blob is stored.
+        """
+        view = self._views.get(digest)
+        if view is not None:
+            return view
+        with self._lock:
+            if digest not in self._views:
+                try:
+                    segment = _attach(segment_name(digest))
+                except FileNotFoundError:
+                    raise KeyError(digest)
+                size = HEADER.unpack_from(segment.buf, 0)[0]
+                self._segments.append(segment)
+                self._views[digest] = segment.buf[
+                    HEADER.size:HEADER.size + size].toreadonly()
+            return self._views[digest]
+
+    def close(self):
+        """Release the views and detach the blobs.
+
+        A segment can not be closed while a view of it is exported, the
+        views returned by ``get`` can not be used afterwards.
+        """
+        with self._lock:
+            views, self._views = self._views, {}
+            segments, self._segments = self._segments, []
+        for view in views.values():
+            view.release()
+        for segment in segments:
+            segment.close()
@@ -0,0 +1,298 @@
+"""Response templates of handler data.
+
+Handler data holding an ``m-response`` entry is answered by the application
+itself, without running handler code::
+
+    {"m-response": {"status": 201,
+                    "headers": {"X-User": "{path.id}"},
+                    "body": {"id": "{path.id}", "q": "{query.q}",
+                             "name": "{body.user.name}"}}}
+
+Strings reference ``path`` parameters, ``query`` parameters, request
+``headers`` and JSON ``body`` fields with ``{source.field}``, nested fields
+and list items are separated by dots. A string made of a single reference
+keeps the type of the referenced value. ``{{`` and ``}}`` are literal braces.
+
+A ``file`` naming a fixture uploaded to ``/mock/app/handler/file/`` replaces
+the body, large responses are then streamed from disk. A ``fixture`` digest
+of a blob uploaded to the control plane ``/mock/fixtures/`` serves the blob
+from memory shared by every app::
+
+    {"m-response": {"file": "catalog.json"}}
+    {"m-response": {"fixture": "9f86d08...",
+                    "headers": {"Content-Type": "application/json"}}}
+
+Handler data holding an ``m-sequence`` list answers requests with its steps
+in order, each step being plain handler data or an ``m-response``. The last
+step repeats once the sequence is exhausted, unless ``m-cycle`` is set::
+
+    {"m-sequence": [{"m-response": {"status": 503}},
+                    {"m-response": {"body": {"page": 1}}}],
+     "m-cycle": false}
+
+Templates are compiled once when the data is set, rendering only joins the
+precompiled pieces.
+"""
+import json
+import mimetypes
+from string import Formatter
+
+from httpmocker.exceptions import TemplateError
+
+RESPONSE_KEY = 'm-response'
+SEQUENCE_KEY = 'm-sequence'
+CYCLE_KEY = 'm-cycle'
+SOURCES = ('path', 'query', 'headers', 'body')
+
+_formatter = Formatter()
+
+
+def is_response(data):
+    """Check if the handler data declares a response template.
+
+    :param Any data: handler data.
+    :rtype: bool
+    """
+    return isinstance(data, dict) and RESPONSE_KEY in data
+
+
+def is_sequence(data):
+    """Check if the handler data declares a sequence of steps.
+
+    :param Any data: handler data.
+    :rtype: bool
+    """
+    return isinstance(data, dict) and SEQUENCE_KEY in data
+
+
+def answers_requests(data):
+    """Check if the handler data answers requests without handler code.
+
+    :param Any data: handler data.
+    :rtype: bool
+    """
+    if is_sequence(data):
+        steps = data[SEQUENCE_KEY]
+        return isinstance(steps, list) and all(map(is_response, steps))
+    return is_response(data)
+
+
+def sequence_steps(data):
+    """Validate the steps of the handler data sequence.
+
+    :param dict data: handler data declaring a sequence.
+    :return: steps and if the sequence cycles.
+    :rtype: tuple
+    :raises TemplateError: when the sequence is invalid.
+    """
+    steps = data[SEQUENCE_KEY]
+    if not isinstance(steps, list) or not steps:
+        raise TemplateError(f'{SEQUENCE_KEY} must be a non empty list.')
+    if any(map(is_sequence, steps)):
+        raise TemplateError(f'{SEQUENCE_KEY} steps can not be sequences.')
+    return steps, bool(data.get(CYCLE_KEY, False))
+
+
+def parse_body(raw):
+    """Parse the request body referenced by a template.
+
+    :param bytes raw: request body.
+    :return: JSON body, None if the body is not JSON.
+    """
+    try:
+        return json.loads(raw or b'null')
+    except ValueError:
+        return None
+
+
+def _reference(field):
+    source, *keys = field.split('.')
+    if source not in SOURCES:
+        raise TemplateError(
+            f'Unknown template source {source!r}, expected one of '
+            f'{", ".join(SOURCES)}.')
+    return source, tuple(keys)
+
+
+def _resolve(context, reference):
+    source, keys = reference
+    value = context.get(source)
+    for key in keys:
+        try:
+            value = value[int(key) if isinstance(value, list) else key]
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
+    return value
+
+
+def _to_str(value):
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+class Template:
+    """String template with ``{source.field}`` references."""
+
+    def __init__(self, text):
+        pieces = []
+        try:
+            for literal, field, spec, conversion in _formatter.parse(text):
+                if literal:
+                    pieces.append(literal)
+                if field is None:
+                    continue
+                if spec or conversion:
+                    raise TemplateError(
+                        f'Format spec is not supported in {text!r}.')
+                pieces.append(_reference(field))
+        except ValueError as error:
+            raise TemplateError(f'Invalid template {text!r}: {error}')
+        self.text = text
+        self.sources = {piece[0] for piece in pieces
+                        if isinstance(piece, tuple)}
+        self._pieces = tuple(pieces)
+        self._single = len(pieces) == 1 and isinstance(pieces[0], tuple)
+
+    def render(self, context, raw=False):
+        """Render the template.
+
+        :param dict context: values by source.
+        :param bool raw: keep the type of a single referenced value.
+        """
+        if self._single:
+            value = _resolve(context, self._pieces[0])
+            return value if raw else _to_str(value)
+        return ''.join(
+            piece if isinstance(piece, str)
+            else _to_str(_resolve(context, piece))
+            for piece in self._pieces)
+
+
+def _compile(value, sources):
+    """Compile a JSON value into a render function of the context.
+
+    :return: render function, None when the value renders as is.
+    """
+    if isinstance(value, str):
+        if '{' not in value and '}' not in value:
+            return None
+        template = Template(value)
+        if not template.sources:
+            text = template.render({})
+            return lambda context: text
+        sources |= template.sources
+        return lambda context: template.render(context, raw=True)
+    if isinstance(value, dict):
+        items = [(key, item, _compile(item, sources))
+                 for key, item in value.items()]
+        if all(render is None for _, _, render in items):
+            return None
+        return lambda context: {
+            key: item if render is None else render(context)
+            for key, item, render in items}
+    if isinstance(value, list):
+        items = [(item, _compile(item, sources)) for item in value]
+        if all(render is None for _, render in items):
+            return None
+        return lambda context: [
+            item if render is None else render(context)
+            for item, render in items]
+    return None
+
+
+class ResponseTemplate:
+    """Precompiled response of handler data."""
+
+    def __init__(self, spec):
+        """Compile the response spec.
+
+        :param dict spec: ``status``, ``headers`` and one of ``body``,
+            ``file`` or ``fixture`` of the response. A str body is sent as
+            text, any other JSON value as JSON.
+        :raises TemplateError: when the spec is invalid.
+        """
+        if not isinstance(spec, dict):
+            raise TemplateError(f'{RESPONSE_KEY} must be an object.')
+        unknown = set(spec) - {'status', 'headers', 'body', 'file',
+                               'fixture'}
+        if unknown:
+            raise TemplateError(
+                f'Unknown response fields: {", ".join(sorted(unknown))}.')
+        if len({'body', 'file', 'fixture'} & set(spec)) > 1:
+            raise TemplateError(
+                'Response body, file and fixture exclude each other.')
+        self.file = spec.get('file')
+        self.fixture = spec.get('fixture')
+        if not isinstance(self.file or '', str) or \
+                not isinstance(self.fixture or '', str):
+            raise TemplateError(
+                'Response file and fixture must be a name and a digest.')
+        try:
+            self.status = int(spec.get('status', 200))
+        except (TypeError, ValueError):
+            raise TemplateError(f'Invalid status {spec["status"]!r}.')
+        headers = spec.get('headers', {})
+        if not isinstance(headers, dict):
+            raise TemplateError('Response headers must be an object.')
+        self.headers = [(name, Template(str(value)))
+                        for name, value in headers.items()]
+        self.sources = set()
+        for _, template in self.headers:
+            self.sources |= template.sources
+        body = spec.get('body', '')
+        self.is_json = not isinstance(body, str)
+        if self.is_json:
+            self._body = _compile(body, self.sources) or \
+                (lambda context: body)
+        else:
+            template = Template(body)
+            self.sources |= template.sources
+            self._body = template.render
+        if not any(name.lower() == 'content-type' for name in headers):
+            if self.file is not None:
+                content_type = mimetypes.guess_type(self.file)[0] or \
+                    'application/octet-stream'
+            elif self.fixture is not None:
+                content_type = 'application/octet-stream'
+            elif self.is_json:
+                content_type = 'application/json'
+            else:
+                content_type = 'text/plain; charset=utf-8'
+            self.headers.append(('Content-Type', Template(content_type)))
+
+    def render(self, path=None, query=None, headers=None, body=None):
+        """Render the response of a request.
+
+        :param dict path: path parameters.
+        :param dict query: query parameters.
+        :param Mapping headers: request headers.
+        :param Any body: JSON request body.
+        :return: status, headers and encoded body, None for a file or
+            fixture response.
+        :rtype: tuple
+        """
+        context = {'path': path, 'query': query, 'headers': headers,
+                   'body': body}
+        headers = {name: template.render(context)
+                   for name, template in self.headers}
+        if self.file is not None or self.fixture is not None:
+            return self.status, headers, None
+        rendered = self._body(context)
+        if self.is_json:
+            rendered = json.dumps(rendered)
+        return self.status, headers, rendered.encode()
+
+
+def compile_response(data):
+    """Compile the response template of the handler data.
+
+    :param Any data: handler data.
+    :return: compiled response, None when the data has no template.
+    :rtype: ResponseTemplate
+    """
+    if not is_response(data):
+        return None
+    return ResponseTemplate(data[RESPONSE_KEY])
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from httpmocker.async_client import AsyncConnectionPool, _raise_for_status
+from httpmocker.exceptions import ConnectError, HandlerException
+
+RESPONSES = {
+    b'/ok': b'HTTP/1.1 200 OK\r\nContent-Length: 11\r\n\r\n{"msg": ""}',
+    b'/page': b'HTTP/1.1 502 Bad Gateway\r\nContent-Length: 7\r\n\r\n'
+              b'<html/>',
+}
+
+
+async def _serve(connections, dropped=None):
+    async def handle(reader, writer):
+        connections.append(writer)
+        while True:
+            try:
+                request = await reader.readuntil(b'\r\n\r\n')
+            except asyncio.IncompleteReadError:
+                break
+            method, path = request.split(b' ')[:2]
+            if method == b'POST':
+                await reader.readexactly(2)
+            # the connection of the first /lost request is closed once the
+            # request was read.
+            if path == b'/lost' and dropped is not None and not dropped:
+                dropped.append(method)
+                break
+            # /slow is never answered.
+            response = RESPONSES.get(path.replace(b'/lost', b'/ok'))
+            if response is not None:
+                writer.write(response)
+        writer.close()
+    return await asyncio.start_server(handle, '127.0.0.1', 0)
+
+
+async def _cancel(tasks):
+    # handlers of the test server still reading closed streams.
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _run(coroutine):
+    # not asyncio.run, the uvloop policy sanic installs lacks
+    # shutdown_default_executor on older releases.
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.run_until_complete(_cancel(asyncio.all_tasks(loop)))
+        loop.close()
+
+
+async def _pool(connections, dropped=None, **kwargs):
+    server = await _serve(connections, dropped)
+    port = server.sockets[0].getsockname()[1]
+    return server, AsyncConnectionPool('127.0.0.1', port, **kwargs)
+
+
+def test_pool_reuses_connections_and_checks_status_first():
+    async def run():
+        connections = []
+        server, pool = await _pool(connections)
+        try:
+            for _ in range(3):
+                response = await pool.request('GET', '/ok')
+                assert _raise_for_status(response, HandlerException) == \
+                    {'msg': ''}
+            assert len(connections) == 1 and len(pool._idle) == 1
+            response = await pool.request('GET', '/page')
+            with pytest.raises(HandlerException,
+                               match='Request failed with status 502'):
+                _raise_for_status(response, HandlerException)
+        finally:
+            pool.close()
+            server.close()
+    _run(run())
+
+
+def test_pool_closes_the_stream_of_a_timed_out_request():
+    async def run():
+        connections, streams = [], []
+        server, pool = await _pool(connections, timeout=0.1)
+        connect = pool._connect
+
+        async def track():
+            streams.append(await connect())
+            return streams[-1]
+        pool._connect = track
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.request('GET', '/slow')
+            assert streams[0].writer.is_closing() and pool._idle == []
+            await pool.request('GET', '/ok')
+            assert len(streams) == 2 and len(connections) == 2
+        finally:
+            pool.close()
+            server.close()
+    _run(run())
+
+
+def test_pool_resends_idempotent_requests_only():
+    async def run():
+        connections, dropped = [], []
+        server, pool = await _pool(connections, dropped)
+        try:
+            await pool.request('GET', '/ok')
+            assert (await pool.request('GET', '/lost')).status == 200
+            dropped.clear()
+            await pool.request('GET', '/ok')
+            with pytest.raises(ConnectError):
+                await pool.request('POST', '/lost', body=b'{}')
+            assert dropped == [b'POST'] and len(connections) == 2
+        finally:
+            pool.close()
+            server.close()
+    _run(run())
@@ -0,0 +1,115 @@
+import threading
+from http.client import HTTPConnection, RemoteDisconnected
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from httpmocker.client import PooledConnection
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.seen.append((self.command, self.client_address))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    do_GET = do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class _Connection(HTTPConnection):
+    """Connection closed before the next request is sent or once the server
+    processed it, at the steps listed in ``fail``."""
+
+    fail = []
+
+    def _stale(self, step):
+        if _Connection.fail[:1] != [step]:
+            return
+        del _Connection.fail[0]
+        if step == 'getresponse':
+            super().getresponse().read()
+        self.close()
+        raise RemoteDisconnected('Remote end closed connection')
+
+    def request(self, *args, **kwargs):
+        self._stale('request')
+        return super().request(*args, **kwargs)
+
+    def getresponse(self):
+        self._stale('getresponse')
+        return super().getresponse()
+
+
+@pytest.fixture
+def pool():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.seen = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    pool = PooledConnection(
+        lambda: _Connection('127.0.0.1', port, timeout=5), maxsize=1)
+    pool.server = server
+    yield pool
+    pool.close()
+    server.shutdown()
+    server.server_close()
+
+
+def _get(pool, method, *fail):
+    _Connection.fail = list(fail)
+    pool.request(method, '/', body=b'{}' if method == 'POST' else None)
+    return pool.getresponse().read()
+
+
+def _released(pool):
+    if not pool._slots.acquire(timeout=1):
+        return False
+    pool._slots.release()
+    return True
+
+
+def test_pooled_connection_is_reused_and_released(pool):
+    assert [_get(pool, 'GET') for _ in range(3)] == [b'ok'] * 3
+    assert len({client for _, client in pool.server.seen}) == 1
+    assert len(pool._idle) == 1 and _released(pool)
+
+
+def test_stale_connection_retries_idempotent_requests_only(pool):
+    _get(pool, 'GET')
+    assert _get(pool, 'GET', 'getresponse') == b'ok'
+    # not sent yet, safe to send again.
+    assert _get(pool, 'POST', 'request') == b'ok'
+    # may have been processed by the server.
+    with pytest.raises(RemoteDisconnected):
+        _get(pool, 'POST', 'getresponse')
+    assert [method for method, _ in pool.server.seen] == [
+        'GET', 'GET', 'GET', 'POST', 'POST']
+    assert pool._idle == [] and _released(pool)
+
+
+def test_stale_error_of_a_new_connection_is_raised(pool):
+    with pytest.raises(RemoteDisconnected):
+        _get(pool, 'GET', 'getresponse')
+    assert pool._idle == [] and _released(pool)
+    pool._factory = lambda: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        _get(pool, 'GET')
+    assert _released(pool)
+
+
+def test_failed_resend_releases_the_connection(pool):
+    # more failures than slots, a leaked slot blocks the next request.
+    for _ in range(2):
+        _get(pool, 'GET')
+        with pytest.raises(RemoteDisconnected):
+            _get(pool, 'GET', 'request', 'request')
+        assert pool._local.pending is None and _released(pool)
+    assert _get(pool, 'GET') == b'ok'
@@ -0,0 +1,59 @@
+import sys
+
+import django
+from django.http import HttpResponse
+from django.test import Client
+from django.urls import path
+
+from httpmocker.app import django_app
+from httpmocker.app.base_app import AppRegistry
+
+
+def _view(request):
+    pass
+
+
+def test_url_pattern_index_replaces_patterns_by_route():
+    index = django_app.URLPatternIndex()
+    # created in the serving process only.
+    assert index.urlconf not in sys.modules
+    index.install()
+    module = sys.modules[index.urlconf]
+    first, second = path('a', _view), path('b/<int:id>', _view)
+    index.add([first, second])
+    assert module.urlpatterns == [first, second]
+    served = module.urlpatterns
+    override = path('a', _view)
+    index.add([override])
+    # published as a new list, the one being resolved is left untouched.
+    assert served == [first, second]
+    assert module.urlpatterns == [second, override]
+    # the replaced pattern no longer owns its route.
+    assert index.remove([first, path('c', _view)]) == ['a', 'c']
+    assert module.urlpatterns == [second, override]
+    assert index.remove([override]) == []
+    assert module.urlpatterns == [second]
+    assert 'b/<int:id>' in index and len(index) == 1
+    del sys.modules[index.urlconf]
+
+
+def test_apps_of_a_process_serve_their_own_routes():
+    apps = [AppRegistry.django({}), AppRegistry.django({})]
+    django.setup()
+    for port, app in enumerate(apps, 9801):
+        app.urlpatterns.install()
+        django_app._apps[port] = app
+        app.attach_handler('who', [
+            path('who/', lambda request, port=port: HttpResponse(port))])
+    client = Client()
+    try:
+        assert client.get('/who/', SERVER_PORT='9801').content == b'9801'
+        assert client.get('/who/', SERVER_PORT='9802').content == b'9802'
+        apps[0].detach_handler('who')
+        assert client.get('/who/', SERVER_PORT='9801').status_code == 404
+        assert client.get('/who/', SERVER_PORT='9802').content == b'9802'
+        assert [app.journal.recorded for app in apps] == [2, 2]
+    finally:
+        django_app._apps.clear()
+        for app in apps:
+            del sys.modules[app.urlpatterns.urlconf]
@@ -0,0 +1,41 @@
+import pytest
+
+from httpmocker.exceptions import TemplateError
+from httpmocker.faults import ERROR, RESET, FaultPolicy
+from httpmocker.routing import HandlerData
+
+
+def test_fault_policy_draws_latency_and_faults():
+    policy = FaultPolicy({'latency': {'distribution': 'normal', 'mean': 0.2,
+                                      'stddev': 1, 'max': 0.5},
+                          'error_rate': 0.5, 'reset_rate': 0.5})
+    assert all(0 <= policy.delay() <= 0.5 for _ in range(100))
+    assert {policy.action() for _ in range(100)} == {ERROR, RESET}
+    assert FaultPolicy({'latency': 0.1}).delay() == 0.1
+    assert FaultPolicy({}).action() is None
+
+
+def test_fault_policy_trickles_the_body():
+    policy = FaultPolicy({'trickle': {'chunk_size': 4, 'interval': 0}})
+    assert list(policy.trickle([b'abcdef', b'gh'])) == [b'abcd', b'ef',
+                                                        b'gh']
+
+
+@pytest.mark.parametrize('spec', [
+    {'latency': {'distribution': 'zipf'}},
+    {'latency': -1},
+    {'error_rate': 0.7, 'reset_rate': 0.7},
+    {'error_status': 700},
+    {'timeout': 1},
+])
+def test_fault_policy_rejects_invalid_specs(spec):
+    with pytest.raises(TemplateError):
+        FaultPolicy(spec)
+
+
+def test_sequence_steps_inherit_the_sequence_fault():
+    store = HandlerData()
+    store['/s/'] = {'m-sequence': [{'m-fault': {'error_rate': 1}}, {}],
+                    'm-fault': {'latency': 0.1}}
+    assert store.resolve('/s/')[4].error_rate == 1
+    assert store.resolve('/s/')[4].delay() == 0.1
@@ -0,0 +1,32 @@
+import time
+
+import pytest
+
+from httpmocker.journal import Journal
+
+
+def test_journal_keeps_the_most_recent_records():
+    journal = Journal(size=3, body_size=4)
+    for n in range(5):
+        journal.record('GET', f'/users/{n}/', '', 200, 0.001)
+    journal.record('POST', '/users/', 'q=1', 201, 0.001, b'{"name": 1}')
+    records = journal.query()
+    assert [record['path'] for record in records] == [
+        '/users/3/', '/users/4/', '/users/']
+    assert records[-1]['body'] == '{"na'
+    assert journal.recorded == 6
+
+
+def test_journal_filters():
+    journal = Journal()
+    journal.record('GET', '/users/7/', '', 200, 0.001)
+    journal.record('GET', '/users/x/', '', 404, 0.001)
+    journal.record('POST', '/users/', '', 201, 0.001)
+    assert len(journal.query(method='get')) == 2
+    assert [r['path'] for r in journal.query(path='/users/<int:id>/')] == [
+        '/users/7/']
+    assert [r['status'] for r in journal.query(status='2xx')] == [200, 201]
+    assert [r['path'] for r in journal.query(limit=1)] == ['/users/']
+    assert journal.query(since=time.time() + 60) == []
+    with pytest.raises(ValueError):
+        journal.query(status='teapot')
@@ -0,0 +1,32 @@
+from httpmocker.metrics import (Metrics, merge, percentile, summarize,
+                                to_prometheus)
+
+
+def test_metrics_count_requests_into_buckets():
+    metrics = Metrics()
+    for _ in range(98):
+        metrics.observe('GET', '/users/<int:id>/', 200, 0.0015)
+    metrics.observe('GET', '/users/<int:id>/', 500, 0.3)
+    metrics.observe('GET', None, 404, 0.00005)
+    users, unmatched = metrics.snapshot()
+    assert unmatched['route'] == '<unmatched>'
+    assert (users['count'], users['errors'], users['max']) == (99, 1, 0.3)
+    assert 0.001 < percentile(users, 50) <= 0.002
+    assert 0.2 < percentile(users, 100) <= 0.3
+    assert summarize(users)['mean'] == users['sum'] / 99
+
+    total, = merge([[users], [users]])
+    assert total['count'] == 198 and total['buckets'] == [
+        count * 2 for count in users['buckets']]
+
+
+def test_metrics_prometheus_format():
+    metrics = Metrics()
+    metrics.observe('GET', '/a"b', 200, 0.0015)
+    text = to_prometheus([({'app': 'flask'}, metrics.snapshot()[0])])
+    assert ('httpmocker_requests_total{app="flask",method="GET",'
+            'route="/a\\"b"} 1') in text
+    assert ('httpmocker_request_duration_seconds_bucket{app="flask",'
+            'method="GET",route="/a\\"b",le="0.001"} 0') in text
+    assert ('httpmocker_request_duration_seconds_bucket{app="flask",'
+            'method="GET",route="/a\\"b",le="+Inf"} 1') in text
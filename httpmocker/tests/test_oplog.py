@@ -0,0 +1,45 @@
+import multiprocessing
+
+import pytest
+
+from httpmocker.oplog import OpLog
+
+
+def _worker(log, conn):
+    state = {}
+
+    def apply(op):
+        state[op['key']] = op['value']
+
+    conn.send('forked')
+    conn.recv()
+    log.sync(apply)
+    log.write({'op': 'set', 'key': 'b', 'value': 2}, apply)
+    conn.send(state)
+
+
+def test_oplog_replays_writes_of_other_processes():
+    log = OpLog()
+    state = {}
+
+    def apply(op):
+        if op['value'] is None:
+            raise ValueError('no value')
+        state[op['key']] = op['value']
+
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.get_context('fork').Process(
+        target=_worker, args=(log, child))
+    process.start()
+    try:
+        assert parent.recv() == 'forked'
+        log.write({'op': 'set', 'key': 'a', 'value': 1}, apply)
+        with pytest.raises(ValueError):
+            log.write({'op': 'set', 'key': 'c', 'value': None}, apply)
+        parent.send('go')
+        assert parent.recv() == {'a': 1, 'b': 2}
+        log.sync(apply)
+        assert state == {'a': 1, 'b': 2}
+    finally:
+        process.join(5)
+        log.close()
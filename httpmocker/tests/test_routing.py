@@ -0,0 +1,53 @@
+import pytest
+
+from httpmocker.routing import HandlerData, RouteTrie
+
+
+def test_trie_prefers_most_specific_template():
+    trie = RouteTrie()
+    for template in ('/users/<id>', '/users/<int:id>', '/users/me',
+                     '/files/<path:rest>'):
+        trie.insert(template, template)
+    assert trie.match('/users/me')[0] == '/users/me'
+    assert trie.match('/users/12') == ('/users/<int:id>', '/users/<int:id>',
+                                       {'id': '12'})
+    assert trie.match('/users/bob')[2] == {'id': 'bob'}
+    assert trie.match('/files/a/b')[2] == {'rest': 'a/b'}
+    assert trie.match('/nope') is None
+    trie.remove('/users/me')
+    assert trie.match('/users/me')[0] == '/users/<id>'
+    with pytest.raises(KeyError):
+        trie.remove('/users/me')
+
+
+def test_handler_data_exact_path_beats_template():
+    data = HandlerData()
+    data['/users/<id:int>'] = {'template': True}
+    data['/users/1'] = {'exact': True}
+    assert data.resolve('/users/1') == (
+        '/users/1', {'exact': True}, {}, None, None)
+    assert data.resolve('/users/2') == (
+        '/users/<id:int>', {'template': True}, {'id': '2'}, None, None)
+    del data['/users/<id:int>']
+    assert data.resolve('/users/2') == (None, {}, {}, None, None)
+
+
+def test_handler_data_sequence_advances_per_lookup():
+    data = HandlerData()
+    data['/retry'] = {'m-sequence': [{'status': 'down'}, {'status': 'up'}]}
+    data['/cycle'] = {'m-sequence': [1, 2], 'm-cycle': True}
+    assert [data.resolve('/retry')[1]['status'] for _ in range(3)] == \
+        ['down', 'up', 'up']
+    assert [data.resolve('/cycle')[1] for _ in range(3)] == [1, 2, 1]
+    assert data.state('/retry') == {'position': 1, 'length': 2, 'served': 3}
+    assert data.state('/cycle')['position'] == 1
+
+
+def test_handler_data_bulk_changes_are_all_or_nothing():
+    data = HandlerData()
+    errors = data.set_many([('/a', 1), ('/b', {'m-response': {'x': 1}})])
+    assert [key for key, _ in errors] == ['/b'] and not data
+    assert data.set_many([('/a', 1), ('/<x>', 2)]) == []
+    assert data.delete_many(['/a', '/missing']) == ['/missing']
+    assert len(data) == 2
+    assert data.delete_many(['/a', '/<x>']) == [] and not data
@@ -0,0 +1,45 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from httpmocker.server import make_server
+
+
+@pytest.fixture
+def address():
+    server = make_server('127.0.0.1', 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def _post_chunked(address, path, chunks):
+    """Send a chunked request as is, return its response and the rest of
+    the stream up to its end for a closed connection."""
+    with socket.create_connection(address, timeout=5) as sock, \
+            sock.makefile('rb') as stream:
+        sock.sendall(f'POST {path} HTTP/1.1\r\nHost: mock\r\n'
+                     f'Transfer-Encoding: chunked\r\n\r\n'.encode() + chunks)
+        status = int(stream.readline().split()[1])
+        headers = dict(line.decode().rstrip().lower().split(': ', 1)
+                       for line in iter(stream.readline, b'\r\n'))
+        body = json.loads(stream.read(int(headers['content-length'])))
+        rest = stream.read() if headers.get('connection') == 'close' \
+            else None
+    return status, body, rest
+
+
+def test_chunked_json_body(address):
+    assert _post_chunked(address, '/mock/apps/',
+                         b'1\r\n[\r\n1\r\n]\r\n0\r\n\r\n') == \
+        (200, {'apps': []}, None)
+
+
+def test_malformed_chunk_size_closes_the_connection(address):
+    status, body, rest = _post_chunked(address, '/mock/fixtures/',
+                                       b'zz\r\nabc\r\n0\r\n\r\n')
+    assert status == 400 and 'Invalid chunk size' in body['error']
+    assert rest == b''
@@ -0,0 +1,55 @@
+import multiprocessing
+
+from httpmocker.journal import SharedJournal
+from httpmocker.metrics import SharedMetrics
+from httpmocker.routing import HandlerData, SharedCounters
+from httpmocker.shared import SharedTable
+
+SEQUENCE = {'m-sequence': [1, 2, 3]}
+
+
+def _worker(journal, metrics, data):
+    data.resolve('/retry')
+    journal.record('GET', '/retry', 'q=1', 200, 0.001, b'body')
+    metrics.observe('GET', '/retry', 500, 0.001)
+
+
+def test_workers_share_journal_metrics_and_sequences():
+    journal, metrics = SharedJournal(size=2), SharedMetrics()
+    data = HandlerData()
+    data.counters = SharedCounters()
+    data['/retry'] = SEQUENCE
+    context = multiprocessing.get_context('fork')
+    for _ in range(2):
+        process = context.Process(target=_worker,
+                                  args=(journal, metrics, data))
+        process.start()
+        process.join(5)
+        assert process.exitcode == 0
+    journal.record('GET', '/users/', '', 404, 0.002)
+
+    assert data.resolve('/retry')[1] == 3
+    assert data.state('/retry') == {'position': 2, 'length': 3,
+                                    'served': 3}
+    # a new set of the data restarts the sequence in every worker.
+    data['/retry'] = SEQUENCE
+    assert data.resolve('/retry')[1] == 1
+
+    assert journal.recorded == 3
+    assert [(r['path'], r['query'], r['body'])
+            for r in journal.query()] == [('/retry', 'q=1', 'body'),
+                                          ('/users/', '', None)]
+    row, = metrics.snapshot()
+    assert (row['route'], row['count'], row['errors']) == ('/retry', 2, 2)
+    journal.clear()
+    metrics.clear()
+    assert journal.query() == [] and metrics.snapshot() == []
+
+
+def test_shared_table_full():
+    table = SharedTable(2, 1, keep_keys=True)
+    assert {table.row('a'), table.row('b')} == {0, 1}
+    assert table.row('c') is None
+    assert table.row('a') in (0, 1)
+    with table.lock:
+        assert sorted(key for key, _ in table.rows()) == ['a', 'b']
@@ -0,0 +1,24 @@
+import io
+
+import pytest
+
+from httpmocker.store import FixtureCache, FixtureStore
+
+
+def test_fixture_store_shares_blobs_by_digest():
+    store = FixtureStore()
+    cache = FixtureCache()
+    try:
+        digest, size = store.put(io.BytesIO(b'x' * 100000))
+        assert size == 100000
+        assert store.put(io.BytesIO(b'x' * 100000)) == (digest, size)
+        assert store.list() == [{'digest': digest, 'size': size}]
+        view = cache.get(digest)
+        assert view.readonly and bytes(view) == b'x' * 100000
+        assert cache.get(digest) is view
+        store.remove(digest)
+        with pytest.raises(KeyError):
+            FixtureCache().get(digest)
+    finally:
+        cache.close()
+        store.close()
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from httpmocker.exceptions import TemplateError
+from httpmocker.templating import ResponseTemplate, compile_response
+
+
+def test_response_template_renders_request_fields():
+    template = ResponseTemplate({
+        'status': 201,
+        'headers': {'X-Id': 'user-{path.id}'},
+        'body': {'id': '{path.id}', 'q': '{query.q}',
+                 'tags': '{body.tags}', 'first': '{body.tags.0}',
+                 'missing': 'x{body.nope}x', 'braces': '{{}}'}})
+    status, headers, body = template.render(
+        path={'id': '7'}, query={'q': 'a'}, body={'tags': ['t1', 't2']})
+    assert status == 201
+    assert headers == {'X-Id': 'user-7', 'Content-Type': 'application/json'}
+    assert json.loads(body) == {'id': '7', 'q': 'a', 'tags': ['t1', 't2'],
+                                'first': 't1', 'missing': 'xx',
+                                'braces': '{}'}
+    assert template.sources == {'path', 'query', 'body'}
+
+
+def test_compile_response_rejects_invalid_templates():
+    assert compile_response({'plain': 'data'}) is None
+    with pytest.raises(TemplateError):
+        compile_response({'m-response': {'body': '{cookies.id}'}})
+    with pytest.raises(TemplateError):
+        compile_response({'m-response': {'body': '{path.id:>4}'}})
+
+
+def test_file_response_replaces_the_body():
+    template = ResponseTemplate({'file': 'catalog.json'})
+    assert template.render() == (
+        200, {'Content-Type': 'application/json'}, None)
+    with pytest.raises(TemplateError):
+        ResponseTemplate({'file': 'catalog.json', 'body': 'x'})
@@ -0,0 +1,53 @@
+import multiprocessing
+import os
+import socket
+import time
+from http.client import HTTPConnection
+
+import pytest
+
+from httpmocker import wsgi
+
+
+def _app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid()).encode()]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_get_backend():
+    assert wsgi.get_backend('prefork') is wsgi.serve_prefork
+    assert wsgi.get_backend('httpmocker.wsgi:serve_threaded') is \
+        wsgi.serve_threaded
+    with pytest.raises(ValueError):
+        wsgi.get_backend('gunicorn')
+
+
+def test_prefork_workers_share_the_port():
+    port = _free_port()
+    process = multiprocessing.get_context('fork').Process(
+        target=wsgi.serve_prefork, args=(_app, '127.0.0.1', port),
+        kwargs={'workers': 2})
+    process.start()
+    try:
+        pids = set()
+        deadline = time.monotonic() + 10
+        while len(pids) < 2 and time.monotonic() < deadline:
+            conn = HTTPConnection('127.0.0.1', port, timeout=5)
+            try:
+                conn.request('GET', '/')
+                pids.add(conn.getresponse().read())
+            except OSError:
+                time.sleep(0.05)
+            finally:
+                conn.close()
+        assert len(pids) == 2
+    finally:
+        process.terminate()
+        process.join(5)
+    assert process.exitcode == 0
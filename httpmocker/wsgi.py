@@ -0,0 +1,142 @@
+"""WSGI servers of the mock applications.
+
+The ``WSGI_SERVER`` app config selects the server of a Flask app:
+
+- ``dev``, the Werkzeug development server started by ``Flask.run``.
+- ``threaded``, a Werkzeug server serving every connection in its own
+  thread, keeping connections alive and without access logging.
+- ``prefork``, ``WORKERS`` processes forked from the app process, each one
+  a ``threaded`` server accepting connections on the listening socket they
+  share.
+- ``package.module:callable``, any callable taking the same arguments as
+  ``serve_threaded``.
+
+Forked workers have their own handler state, the app shares it with
+``BaseApp.share_state`` before they are forked.
+"""
+import importlib
+import logging
+import os
+import signal
+import socket
+
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+logger = logging.getLogger(__name__)
+
+DEV = 'dev'
+THREADED = 'threaded'
+PREFORK = 'prefork'
+# pending connections of the listening socket.
+BACKLOG = 1024
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler logging errors only, access logs cost more than
+    serving a mocked response."""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class BacklogServer(ThreadedWSGIServer):
+    """Threaded server listening with a ``BACKLOG`` queue, Werkzeug listens
+    as the server is created."""
+    request_queue_size = BACKLOG
+
+
+def serve_dev(app, host, port, ssl_context=None, workers=None):
+    """Serve the Flask application from the development server."""
+    app.run(host=host, port=port, ssl_context=ssl_context)
+
+
+def serve_threaded(app, host, port, ssl_context=None, workers=None,
+                   fd=None):
+    """Serve the WSGI application from a thread per connection.
+
+    :param app: WSGI application.
+    :param str host: host to bind.
+    :param int port: port to bind.
+    :param ssl_context: ssl context or ``(cert, key)`` paths.
+    :param int workers: unused, a single process serves the application.
+    :param int fd: listening socket to accept connections from instead of
+        binding the port.
+    """
+    server = BacklogServer(host, port, app, handler=QuietRequestHandler,
+                           ssl_context=ssl_context, fd=fd)
+    server.serve_forever()
+
+
+def serve_prefork(app, host, port, ssl_context=None, workers=None):
+    """Serve the WSGI application from forked worker processes.
+
+    The parent process binds the port and waits for the workers, a
+    ``SIGTERM`` it receives is forwarded to them.
+
+    :param app: WSGI application.
+    :param str host: host to bind.
+    :param int port: port to bind.
+    :param ssl_context: ssl context or ``(cert, key)`` paths.
+    :param int workers: worker processes, Defaults -> CPU count.
+    """
+    workers = workers or os.cpu_count() or 1
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(BACKLOG)
+
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                serve_threaded(app, host, port, ssl_context,
+                               fd=sock.fileno())
+            except BaseException:
+                logger.exception('WSGI worker failed.')
+                code = 1
+            finally:
+                os._exit(code)
+        pids.append(pid)
+
+    def stop(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+    finally:
+        stop(None, None)
+        sock.close()
+
+
+BACKENDS = {DEV: serve_dev, THREADED: serve_threaded,
+            PREFORK: serve_prefork}
+
+
+def get_backend(name):
+    """Find the WSGI server of the ``WSGI_SERVER`` config.
+
+    :param str name: backend name or ``package.module:callable`` path.
+    :return: serve function.
+    :rtype: callable
+    :raises ValueError: when the backend is unknown.
+    """
+    if name in BACKENDS:
+        return BACKENDS[name]
+    module, _, attr = name.partition(':')
+    if not attr:
+        raise ValueError(
+            f'Unknown WSGI server {name!r}, expected one of '
+            f'{", ".join(BACKENDS)} or a package.module:callable path.')
+    return getattr(importlib.import_module(module), attr)
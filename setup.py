@@ -41,12 +41,14 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
         "Topic :: Software Development :: Libraries",
     ],
     # Packages and dependencies
     packages=["httpmocker"],
+    # shared memory fixture blobs, see httpmocker.store.
+    python_requires=">=3.8",
     install_requires=['click', 'sanic', 'flask', 'django'],
     extras_require={"dev": ["python-boilerplate[dev]", "manuel"]},
     # Other configurations